@@ -0,0 +1,349 @@
+# 複数データグラムの一括受信（receive_backend = "recvmmsg"）
+#
+# Linux では recvmmsg(2) を ctypes 経由で呼び、ソケットに溜まっているデータグラムを
+# 1回のシステムコールで最大 batch_size 個まで受信する。データスレッドが一時的に
+# 止まった後でも、1回の起床で追いつける。
+#
+# recvmmsg が使えない環境（Windows / macOS など）では socket の recv_into にフォールバックし、
+# 最初の1個を受信した後に溜まっている分を select で確認しながら読み切る。
+#
+# receive() が返す memoryview は内部バッファを指し、次の receive() 呼び出しまで有効。
+#
+# BatchSender は1フレーム分の送信（全送信先への fan-out）を、1つのソケットから sendmmsg(2) の
+# 1回のシステムコールで行う。sendmmsg が使えない環境では sendto のループにフォールバックする。
+
+import ctypes
+import ctypes.util
+import errno
+import select
+import socket
+import sys
+
+MSG_WAITFORONE = 0x10000
+
+
+class IoVec(ctypes.Structure):
+    _fields_ = [("iov_base", ctypes.c_void_p),
+                ("iov_len", ctypes.c_size_t)]
+
+
+class MsgHdr(ctypes.Structure):
+    _fields_ = [("msg_name", ctypes.c_void_p),
+                ("msg_namelen", ctypes.c_uint32),
+                ("msg_iov", ctypes.POINTER(IoVec)),
+                ("msg_iovlen", ctypes.c_size_t),
+                ("msg_control", ctypes.c_void_p),
+                ("msg_controllen", ctypes.c_size_t),
+                ("msg_flags", ctypes.c_int)]
+
+
+class MMsgHdr(ctypes.Structure):
+    _fields_ = [("msg_hdr", MsgHdr),
+                ("msg_len", ctypes.c_uint)]
+
+
+class SockAddrIn(ctypes.Structure):
+    _fields_ = [("sin_family", ctypes.c_ushort),
+                ("sin_port", ctypes.c_ubyte * 2),       # ネットワークバイトオーダー
+                ("sin_addr", ctypes.c_ubyte * 4),
+                ("sin_zero", ctypes.c_ubyte * 8)]
+
+
+def _load_libc_function(name, argtypes):
+    if not sys.platform.startswith("linux"):
+        return None
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or None, use_errno=True)
+        function = getattr(libc, name)
+    except (OSError, AttributeError):
+        return None
+    function.argtypes = argtypes
+    function.restype = ctypes.c_int
+    return function
+
+_recvmmsg = _load_libc_function("recvmmsg", [ctypes.c_int, ctypes.POINTER(MMsgHdr), ctypes.c_uint, ctypes.c_int, ctypes.c_void_p])
+_sendmmsg = _load_libc_function("sendmmsg", [ctypes.c_int, ctypes.POINTER(MMsgHdr), ctypes.c_uint, ctypes.c_int])
+
+
+def has_recvmmsg():
+    return _recvmmsg is not None
+
+
+def has_sendmmsg():
+    return _sendmmsg is not None
+
+
+class BatchReceiver:
+    def __init__(self, sock, batch_size=32, buffer_size=64*1024, use_recvmmsg=True):
+        self.sock = sock
+        self.batch_size = batch_size
+        self.buffer_size = buffer_size
+        self.use_recvmmsg = use_recvmmsg and (_recvmmsg is not None)
+
+        self.__buffers = [bytearray(buffer_size) for i in range(batch_size)]
+        self.__views = [memoryview(buffer) for buffer in self.__buffers]
+
+        if self.use_recvmmsg:
+            # iovec / mmsghdr は固定のバッファを指すので一度だけ組み立てる
+            self.__iovecs = (IoVec * batch_size)()
+            self.__msgvec = (MMsgHdr * batch_size)()
+            self.__c_buffers = [(ctypes.c_char * buffer_size).from_buffer(buffer) for buffer in self.__buffers]
+            for i in range(batch_size):
+                self.__iovecs[i].iov_base = ctypes.addressof(self.__c_buffers[i])
+                self.__iovecs[i].iov_len = buffer_size
+                self.__msgvec[i].msg_hdr.msg_iov = ctypes.pointer(self.__iovecs[i])
+                self.__msgvec[i].msg_hdr.msg_iovlen = 1
+            self.__msgvec_pointer = ctypes.cast(self.__msgvec, ctypes.POINTER(MMsgHdr))
+            # 受信長 msg_len を ctypes の属性アクセスを介さずに読むためのビュー
+            self.__msg_len_view = memoryview(self.__msgvec).cast('B').cast('I')[MMsgHdr.msg_len.offset // 4::ctypes.sizeof(MMsgHdr) // 4]
+
+        # 統計
+        self.call_count = 0
+        self.datagram_count = 0
+        self.max_batch = 0
+
+    # 1個以上のデータグラムを受信し、受信長の memoryview のリストを返す。
+    # ソケットのタイムアウト時は socket.timeout、エラー時は OSError を送出する（socket の recv と同じ）
+    def receive(self):
+        if self.use_recvmmsg:
+            datagrams = self.__receive_recvmmsg()
+        else:
+            datagrams = self.__receive_fallback()
+        self.call_count += 1
+        self.datagram_count += len(datagrams)
+        if len(datagrams) > self.max_batch:
+            self.max_batch = len(datagrams)
+        return datagrams
+
+    def __receive_recvmmsg(self):
+        sock = self.sock
+        fileno = sock.fileno()
+        if fileno < 0:
+            raise OSError(errno.EBADF, "socket is closed")
+        timeout = sock.gettimeout()
+        if timeout is None:
+            # ブロッキングソケット: 最初の1個を待ち、残りは溜まっている分だけ受信
+            flags = MSG_WAITFORONE
+        else:
+            # タイムアウト付きソケット（内部的に非ブロッキング）: 待ちは select で行う
+            readable, writable, exceptional = select.select([sock], [], [], timeout)
+            if not readable:
+                raise socket.timeout("timed out")
+            flags = socket.MSG_DONTWAIT
+        count = _recvmmsg(fileno, self.__msgvec_pointer, self.batch_size, flags, None)
+        if count < 0:
+            error_number = ctypes.get_errno()
+            if error_number in (errno.EAGAIN, errno.EWOULDBLOCK, errno.EINTR):
+                return []
+            raise OSError(error_number, "recvmmsg: " + errno.errorcode.get(error_number, str(error_number)))
+        views = self.__views
+        msg_len_view = self.__msg_len_view
+        return [views[i][:msg_len_view[i]] for i in range(count)]
+
+    def __receive_fallback(self):
+        sock = self.sock
+        views = self.__views
+        nbytes = sock.recv_into(views[0])
+        datagrams = [views[0][:nbytes]]
+        # 溜まっている分だけ読み切る（select のタイムアウト 0 で確認）
+        for i in range(1, self.batch_size):
+            readable, writable, exceptional = select.select([sock], [], [], 0)
+            if not readable:
+                break
+            nbytes = sock.recv_into(views[i])
+            datagrams.append(views[i][:nbytes])
+        return datagrams
+
+    def get_as_string(self):
+        backend = "recvmmsg" if self.use_recvmmsg else "socket"
+        average = self.datagram_count / self.call_count if self.call_count else 0.0
+        return "Batch receive (%s) - Calls: %d, Datagrams: %d, Avg batch: %.2f, Max batch: %d/%d"%(
+            backend, self.call_count, self.datagram_count, average, self.max_batch, self.batch_size)
+
+
+class BatchSender:
+    def __init__(self, sock, batch_size=64, buffer_size=2048, use_sendmmsg=True):
+        self.sock = sock
+        self.batch_size = batch_size
+        self.buffer_size = buffer_size
+        self.use_sendmmsg = use_sendmmsg and (_sendmmsg is not None)
+
+        if self.use_sendmmsg:
+            # 送信データは固定のバッファへコピーし、iovec / mmsghdr は宛先と長さだけを書き換える
+            self.__buffers = [bytearray(buffer_size) for i in range(batch_size)]
+            self.__c_buffers = [(ctypes.c_char * buffer_size).from_buffer(buffer) for buffer in self.__buffers]
+            self.__iovecs = (IoVec * batch_size)()
+            self.__msgvec = (MMsgHdr * batch_size)()
+            for i in range(batch_size):
+                self.__iovecs[i].iov_base = ctypes.addressof(self.__c_buffers[i])
+                self.__msgvec[i].msg_hdr.msg_iov = ctypes.pointer(self.__iovecs[i])
+                self.__msgvec[i].msg_hdr.msg_iovlen = 1
+                self.__msgvec[i].msg_hdr.msg_namelen = ctypes.sizeof(SockAddrIn)
+            # i 番目のメッセージから送り直すためのポインタ
+            self.__msgvec_pointers = [ctypes.cast(ctypes.addressof(self.__msgvec) + i * ctypes.sizeof(MMsgHdr), ctypes.POINTER(MMsgHdr))
+                                      for i in range(batch_size)]
+            # msg_name / iov_len を ctypes の属性アクセスを介さずに書き込むためのビュー（ポインタ・size_t 単位）
+            word_format = 'Q' if ctypes.sizeof(ctypes.c_void_p) == 8 else 'I'
+            word_size = ctypes.sizeof(ctypes.c_void_p)
+            self.__msg_name_view = memoryview(self.__msgvec).cast('B').cast(word_format)[
+                (MMsgHdr.msg_hdr.offset + MsgHdr.msg_name.offset) // word_size::ctypes.sizeof(MMsgHdr) // word_size]
+            self.__iov_len_view = memoryview(self.__iovecs).cast('B').cast(word_format)[
+                IoVec.iov_len.offset // word_size::ctypes.sizeof(IoVec) // word_size]
+            # 宛先 (ip, port) → sockaddr_in のアドレス（sockaddr_in は一度だけ組み立ててキャッシュ）
+            self.__sockaddrs = {}
+            self.__sockaddr_addresses = {}
+
+        # 統計
+        self.call_count = 0
+        self.datagram_count = 0
+        self.error_count = 0
+
+    def __add_sockaddr(self, address):
+        ip, port = address
+        sockaddr = SockAddrIn()
+        sockaddr.sin_family = socket.AF_INET
+        sockaddr.sin_port[:] = port.to_bytes(2, "big")
+        sockaddr.sin_addr[:] = socket.inet_aton(ip)
+        self.__sockaddrs[address] = sockaddr
+        self.__sockaddr_addresses[address] = ctypes.addressof(sockaddr)
+        return self.__sockaddr_addresses[address]
+
+    # datagrams は (data, (ip, port)) のリスト。送信できた件数と、失敗した [(index, OSError), ...] を返す
+    def send(self, datagrams):
+        if self.use_sendmmsg:
+            sent_count, errors = self.__send_sendmmsg(datagrams)
+        else:
+            sent_count, errors = self.__send_fallback(datagrams)
+        self.datagram_count += sent_count
+        self.error_count += len(errors)
+        return sent_count, errors
+
+    def __send_sendmmsg(self, datagrams):
+        sock = self.sock
+        fileno = sock.fileno()
+        if fileno < 0:
+            raise OSError(errno.EBADF, "socket is closed")
+        sent_count = 0
+        errors = []
+        buffers = self.__buffers
+        msgvec_pointers = self.__msgvec_pointers
+        msg_name_view = self.__msg_name_view
+        iov_len_view = self.__iov_len_view
+        sockaddr_addresses = self.__sockaddr_addresses
+        for start in range(0, len(datagrams), self.batch_size):
+            chunk = datagrams[start:start + self.batch_size]
+            for i, (data, address) in enumerate(chunk):
+                length = len(data)
+                if length > self.buffer_size:
+                    raise ValueError("datagram of %d bytes exceeds buffer size %d"%(length, self.buffer_size))
+                buffers[i][:length] = data
+                iov_len_view[i] = length
+                sockaddr_address = sockaddr_addresses.get(address)
+                if sockaddr_address is None:
+                    sockaddr_address = self.__add_sockaddr(address)
+                msg_name_view[i] = sockaddr_address
+            # 失敗したメッセージで sendmmsg は止まるので、そのメッセージをエラーとして数えて残りを送り直す
+            index = 0
+            while index < len(chunk):
+                self.call_count += 1
+                count = _sendmmsg(fileno, msgvec_pointers[index], len(chunk) - index, 0)
+                if count > 0:
+                    sent_count += count
+                    index += count
+                    continue
+                error_number = ctypes.get_errno() if count < 0 else errno.EAGAIN
+                if error_number == errno.EINTR:
+                    continue
+                errors.append((start + index, OSError(error_number, "sendmmsg: " + errno.errorcode.get(error_number, str(error_number)))))
+                index += 1
+        return sent_count, errors
+
+    def __send_fallback(self, datagrams):
+        sock = self.sock
+        sent_count = 0
+        errors = []
+        for index, (data, address) in enumerate(datagrams):
+            self.call_count += 1
+            try:
+                sock.sendto(data, address)
+            except OSError as msg:
+                errors.append((index, msg))
+                continue
+            sent_count += 1
+        return sent_count, errors
+
+    def get_as_string(self):
+        backend = "sendmmsg" if self.use_sendmmsg else "sendto"
+        return "Batch send (%s) - Calls: %d, Datagrams: %d, Errors: %d"%(
+            backend, self.call_count, self.datagram_count, self.error_count)
+
+
+# ---- テスト ----
+
+K_SKIP = [0, 0, 1]
+K_FAIL = [0, 1, 0]
+K_PASS = [1, 0, 0]
+
+
+# ループバックで BatchSender → BatchReceiver の順にデータグラムを送受信し、内容と順序が一致すること。
+# batch_size より多く送り、複数回の呼び出しに分かれる場合も確認する
+def test_round_trip(use_mmsg, run_test=True, count=20, batch_size=8):
+    test_name = "BatchSocket round trip (%s)"%( "recvmmsg/sendmmsg" if use_mmsg else "socket fallback" )
+    if not run_test:
+        print("[SKIP] %s"%test_name)
+        return K_SKIP
+    if use_mmsg and not ( has_recvmmsg() and has_sendmmsg() ):
+        print("[SKIP] %s: recvmmsg/sendmmsg is not available"%test_name)
+        return K_SKIP
+    receive_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    send_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    try:
+        receive_socket.bind(("127.0.0.1", 0))
+        address = receive_socket.getsockname()
+        receiver = BatchReceiver(receive_socket, batch_size, 2048, use_mmsg)
+        sender = BatchSender(send_socket, batch_size, 2048, use_mmsg)
+        sent = [bytes([i]) * ( 1 + i * 50 ) for i in range(count)]
+        sent_count, errors = sender.send([( data, address ) for data in sent])
+        ok = receiver.use_recvmmsg == use_mmsg and sender.use_sendmmsg == use_mmsg
+        ok &= sent_count == count and not errors
+
+        # 最初の1回はブロッキング（recvmmsg は MSG_WAITFORONE）、以降はタイムアウト付き
+        received = []
+        receive_socket.settimeout(None)
+        while len(received) < count:
+            received += [bytes(view) for view in receiver.receive()]
+            receive_socket.settimeout(1.0)
+        ok &= received == sent and receiver.max_batch > 1 and receiver.datagram_count == count
+
+        # 受信するものが無ければ socket.timeout
+        receive_socket.settimeout(0.05)
+        try:
+            receiver.receive()
+            ok = False
+        except socket.timeout:
+            pass
+    finally:
+        receive_socket.close()
+        send_socket.close()
+    detail = "%s / %s"%(sender.get_as_string(), receiver.get_as_string())
+    if ok:
+        print("[PASS] %s: %s"%(test_name, detail))
+        return K_PASS
+    print("[FAIL] %s: %s"%(test_name, detail))
+    return K_FAIL
+
+
+def test_all(run_test=True):
+    totals = [0, 0, 0]
+    for use_mmsg in ( True, False ):
+        result = test_round_trip(use_mmsg, run_test)
+        totals = [total + value for total, value in zip(totals, result)]
+    print("--------------------")
+    print("[PASS] Count = %3.1d"%totals[0])
+    print("[FAIL] Count = %3.1d"%totals[1])
+    print("[SKIP] Count = %3.1d"%totals[2])
+    return totals
+
+
+if __name__ == "__main__":
+    test_all(True)
@@ -0,0 +1,582 @@
+# NatNetClient 性能ベンチマーク
+#
+# 合成した NatNet パケット（NAT_SERVERINFO / NAT_FRAMEOFDATA）を NatNetClient に
+# 直接流し込み、デコーダ毎の1フレームあたり処理時間を比較する。
+# Motive やネットワークは不要。
+#
+# 使い方:
+#   python Benchmark.py            # 全ベンチマーク
+#   python Benchmark.py decode     # デコーダ比較のみ
+#   python Benchmark.py sections   # セクション選択デコード
+#   python Benchmark.py lazy       # 遅延デコード（lazy_frames、MoCapDataView）
+#   python Benchmark.py subscription  # 剛体IDフィルタ
+#   python Benchmark.py receive    # 受信方式比較（loopback）
+#   python Benchmark.py fanout     # 送信方式比較（送信先毎のソケット / sendmmsg、loopback）
+#   python Benchmark.py geo        # NED → GPS 変換（pyned2lla / 純 Python / 線形化 / NumPy 一括）
+#   python Benchmark.py history    # 剛体データの履歴（従来の dict / FrameHistory への追加・読み出し）
+#   python Benchmark.py memory     # 1フレームのデコードで確保されるメモリ（__slots__）
+
+import contextlib
+import io
+import math
+import random
+import socket
+import struct
+import sys
+import time
+import tracemalloc
+
+import BatchSocket
+import FrameHistory
+import GeoConversion
+import MoCapData
+import NatNetClient as NatNetClientModule
+from NatNetClient import NatNetClient
+
+NAT_SERVERINFO = 1
+NAT_FRAMEOFDATA = 7
+
+FRAME_RATE_HZ = 240
+
+
+def has_size_fields(major, minor):
+    return ((major == 4) and (minor > 0)) or (major > 4)
+
+
+def pack_message(message_id, payload):
+    return struct.pack('<hh', message_id, len(payload)) + payload
+
+
+def pack_server_info(major=4, minor=1, app_name=b"Motive", clock_frequency=10000000):
+    payload = app_name.ljust(256, b'\0')
+    payload += struct.pack('BBBB', 3, 1, 0, 0)
+    payload += struct.pack('BBBB', major, minor, 0, 0)
+    if major >= 3:
+        payload += struct.pack('<Q', clock_frequency)
+    return pack_message(NAT_SERVERINFO, payload)
+
+
+def pack_section(major, minor, count, body):
+    # count [+ size (4.1+)] + body
+    out = struct.pack('<i', count)
+    if has_size_fields(major, minor):
+        out += struct.pack('<i', len(body))
+    return out + body
+
+
+def pack_rigid_body(rb_id, rng, major, minor):
+    out = struct.pack('<i3f4f', rb_id,
+                      rng.uniform(-5, 5), rng.uniform(0, 3), rng.uniform(-5, 5),
+                      0.0, rng.uniform(-1, 1), 0.0, 1.0)
+    if major < 3 and major != 0:
+        marker_count = 3
+        out += struct.pack('<i', marker_count)
+        for i in range(marker_count):
+            out += struct.pack('<3f', rng.random(), rng.random(), rng.random())
+        if major >= 2:
+            for i in range(marker_count):
+                out += struct.pack('<i', i)
+            for i in range(marker_count):
+                out += struct.pack('<f', 0.014)
+    if major >= 2:
+        out += struct.pack('<f', rng.random() * 0.001)
+    if ((major == 2) and (minor >= 6)) or major > 2:
+        out += struct.pack('<h', 1)
+    return out
+
+
+def pack_mocap_frame(frame_number, rigid_body_count=50, labeled_marker_count=500,
+                     major=4, minor=1, marker_set_count=2, markers_per_set=5,
+                     legacy_marker_count=0, skeleton_count=0, asset_count=0,
+                     force_plate_count=0, device_count=0, seed=0):
+    """合成フレーム（NAT_FRAMEOFDATA パケット全体）を生成"""
+    rng = random.Random(seed + frame_number)
+
+    payload = struct.pack('<i', frame_number)
+
+    # Marker sets
+    body = b''
+    for i in range(marker_set_count):
+        body += b'model_%d\0' % i
+        body += struct.pack('<i', markers_per_set)
+        for j in range(markers_per_set):
+            body += struct.pack('<3f', rng.random(), rng.random(), rng.random())
+    payload += pack_section(major, minor, marker_set_count, body)
+
+    # Legacy other markers
+    body = b''.join(struct.pack('<3f', rng.random(), rng.random(), rng.random())
+                    for i in range(legacy_marker_count))
+    payload += pack_section(major, minor, legacy_marker_count, body)
+
+    # Rigid bodies
+    body = b''.join(pack_rigid_body(i + 1, rng, major, minor) for i in range(rigid_body_count))
+    payload += pack_section(major, minor, rigid_body_count, body)
+
+    # Skeletons
+    if (major == 2 and minor > 0) or major > 2:
+        body = b''
+        for i in range(skeleton_count):
+            bone_count = 4
+            body += struct.pack('<ii', 1000 + i, bone_count)
+            for j in range(bone_count):
+                body += pack_rigid_body(((1000 + i) << 16) + j, rng, major, minor)
+        payload += pack_section(major, minor, skeleton_count, body)
+
+    # Assets (4.1+)
+    if has_size_fields(major, minor):
+        body = b''
+        for i in range(asset_count):
+            body += struct.pack('<ii', 2000 + i, 2)
+            for j in range(2):
+                body += struct.pack('<i3f4ffh', j, rng.random(), rng.random(), rng.random(),
+                                    0.0, 0.0, 0.0, 1.0, 0.0005, 1)
+            body += struct.pack('<i', 3)
+            for j in range(3):
+                body += struct.pack('<i3ffhf', j, rng.random(), rng.random(), rng.random(),
+                                    0.014, 4, 0.0002)
+        payload += pack_section(major, minor, asset_count, body)
+
+    # Labeled markers
+    if (major == 2 and minor > 3) or major > 2:
+        body = b''
+        for i in range(labeled_marker_count):
+            body += struct.pack('<i3ff', ((i // 20 + 1) << 16) + i,
+                                rng.uniform(-5, 5), rng.uniform(0, 3), rng.uniform(-5, 5), 0.014)
+            if (major == 2 and minor >= 6) or major > 2:
+                body += struct.pack('<h', 4)
+            if major >= 3:
+                body += struct.pack('<f', rng.random() * 0.001)
+        payload += pack_section(major, minor, labeled_marker_count, body)
+
+    # Force plates
+    if (major == 2 and minor >= 9) or major > 2:
+        body = b''
+        for i in range(force_plate_count):
+            body += struct.pack('<ii', i + 1, 3)
+            for j in range(3):
+                body += struct.pack('<i', 2) + struct.pack('<2f', rng.random(), rng.random())
+        payload += pack_section(major, minor, force_plate_count, body)
+
+    # Devices
+    if (major == 2 and minor >= 11) or major > 2:
+        body = b''
+        for i in range(device_count):
+            body += struct.pack('<ii', i + 1, 2)
+            for j in range(2):
+                body += struct.pack('<i', 1) + struct.pack('<f', rng.random())
+        payload += pack_section(major, minor, device_count, body)
+
+    # Suffix
+    payload += struct.pack('<ii', 0, 0)
+    if (major == 2 and minor >= 7) or major > 2:
+        payload += struct.pack('<d', frame_number / FRAME_RATE_HZ)
+    else:
+        payload += struct.pack('<f', frame_number / FRAME_RATE_HZ)
+    if major >= 3:
+        stamp = 5844402979291 + frame_number * 41666
+        payload += struct.pack('<qqq', stamp, stamp + 20000, stamp + 30000)
+    if major >= 4:
+        payload += struct.pack('<ii', frame_number // FRAME_RATE_HZ, 0)
+    payload += struct.pack('<h', 0)
+
+    return pack_message(NAT_FRAMEOFDATA, payload)
+
+
+def create_client(major=4, minor=1, decoder_mode="offset"):
+    """ネットワーク送信を行わないベンチマーク用クライアント"""
+    with contextlib.redirect_stdout(io.StringIO()):
+        client = NatNetClient()
+    client.udp_targets = {}
+    client.rigid_body_listener = None
+    client.new_frame_listener = None
+    client.set_decoder_mode(decoder_mode)
+    process_message = client._NatNetClient__process_message
+    with contextlib.redirect_stdout(io.StringIO()):
+        process_message(pack_server_info(major, minor))
+    return client, process_message
+
+
+def time_frames(process_message, packets, repeat=5):
+    """packets を repeat 回流し、最速回の1フレームあたり時間 [us] を返す"""
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for packet in packets:
+            process_message(packet)
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best / len(packets) * 1e6
+
+
+def bench_decoders(rigid_body_count=50, labeled_marker_count=500, frame_count=240, major=4, minor=1):
+    print("==================================================")
+    print("デコーダ比較: %d rigid bodies / %d labeled markers / NatNet %d.%d"%(
+        rigid_body_count, labeled_marker_count, major, minor))
+    print("==================================================")
+    packets = [pack_mocap_frame(i, rigid_body_count, labeled_marker_count, major, minor)
+               for i in range(frame_count)]
+    budget_us = 1e6 / FRAME_RATE_HZ
+    results = {}
+    decoder_modes = ["legacy", "offset"]
+    if NatNetClientModule.numpy is not None:
+        decoder_modes.append("numpy")
+    for decoder_mode in decoder_modes:
+        client, process_message = create_client(major, minor, decoder_mode)
+        results[decoder_mode] = time_frames(process_message, packets)
+        print("  %-8s: %8.1f us/frame (%5.1f%% of %d Hz budget)"%(
+            decoder_mode, results[decoder_mode], 100.0 * results[decoder_mode] / budget_us, FRAME_RATE_HZ))
+    for decoder_mode in decoder_modes[1:]:
+        print("  speedup : x%.2f (%s)"%(results["legacy"] / results[decoder_mode], decoder_mode))
+    return results
+
+
+def bench_decode_sections(rigid_body_count=50, labeled_marker_count=500, frame_count=240,
+                          decode_sections=("rigid_bodies", "suffix")):
+    print("==================================================")
+    print("セクション選択デコード: %s"%(", ".join(decode_sections)))
+    print("==================================================")
+    results = {}
+    for major, minor in ((4, 1), (4, 0)):
+        packets = [pack_mocap_frame(i, rigid_body_count, labeled_marker_count, major, minor,
+                                    skeleton_count=2, force_plate_count=2, device_count=2)
+                   for i in range(frame_count)]
+        client, process_message = create_client(major, minor, "offset")
+        full = time_frames(process_message, packets)
+        client.set_decode_sections(decode_sections)
+        selected = time_frames(process_message, packets)
+        results[(major, minor)] = (full, selected)
+        print("  NatNet %d.%d: all %8.1f us/frame, selected %8.1f us/frame (x%.2f)"%(
+            major, minor, full, selected, full / selected))
+    return results
+
+
+def bench_lazy_frames(rigid_body_count=50, labeled_marker_count=500, frame_count=240, major=4, minor=1):
+    """全セクションのデコードと lazy_frames（セクションを参照しない / 剛体のみ参照）の1フレームあたり時間"""
+    print("==================================================")
+    print("遅延デコード: %d rigid bodies / %d labeled markers / NatNet %d.%d"%(
+        rigid_body_count, labeled_marker_count, major, minor))
+    print("==================================================")
+    packets = [pack_mocap_frame(i, rigid_body_count, labeled_marker_count, major, minor,
+                                skeleton_count=2, force_plate_count=2, device_count=2)
+               for i in range(frame_count)]
+    results = {}
+    decoder_modes = ["offset"]
+    if NatNetClientModule.numpy is not None:
+        decoder_modes.append("numpy")
+    for decoder_mode in decoder_modes:
+        client, process_message = create_client(major, minor, decoder_mode)
+        full = time_frames(process_message, packets)
+        client.set_lazy_frames(True)
+        lazy = time_frames(process_message, packets)
+        client.mocap_data_listener = lambda mocap_data: mocap_data.rigid_body_data
+        lazy_rigid_bodies = time_frames(process_message, packets)
+        results[decoder_mode] = (full, lazy, lazy_rigid_bodies)
+        print("  %-8s: all %7.1f us/frame, lazy %7.1f us/frame (x%.2f), lazy + rigid_body_data %7.1f us/frame (x%.2f)"%(
+            decoder_mode, full, lazy, full / lazy, lazy_rigid_bodies, full / lazy_rigid_bodies))
+    return results
+
+
+def bench_rigid_body_subscription(rigid_body_count=48, subscribed_count=4, frame_count=240, major=4, minor=1):
+    print("==================================================")
+    print("剛体IDフィルタ: %d rigid bodies 中 %d を購読 / NatNet %d.%d"%(
+        rigid_body_count, subscribed_count, major, minor))
+    print("==================================================")
+    packets = [pack_mocap_frame(i, rigid_body_count, 0, major, minor, marker_set_count=0)
+               for i in range(frame_count)]
+    results = {}
+    for decoder_mode in ("offset", "numpy"):
+        if decoder_mode == "numpy" and NatNetClientModule.numpy is None:
+            continue
+        client, process_message = create_client(major, minor, decoder_mode)
+        client.set_decode_sections(("rigid_bodies", "suffix"))
+        full = time_frames(process_message, packets)
+        client.set_rigid_body_subscription(range(1, subscribed_count + 1))
+        subscribed = time_frames(process_message, packets)
+        results[decoder_mode] = (full, subscribed)
+        print("  %-8s: all %7.1f us/frame, subscribed %7.1f us/frame (x%.2f)"%(
+            decoder_mode, full, subscribed, full / subscribed))
+    return results
+
+
+def bench_receive(burst_size=16, round_count=300, rigid_body_count=50):
+    """ループバックで burst_size 個ずつ溜めたフレームを読み切るまでの1フレームあたり時間を比較"""
+    print("==================================================")
+    print("受信方式比較 (loopback): %d frames/burst, %d bursts"%(burst_size, round_count))
+    print("==================================================")
+    packets = [pack_mocap_frame(i, rigid_body_count, 0, marker_set_count=0) for i in range(burst_size)]
+
+    rx = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    rx.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4 * 1024 * 1024)
+    rx.bind(("127.0.0.1", 0))
+    rx.settimeout(1.0)
+    tx = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    address = rx.getsockname()
+
+    buffer = memoryview(bytearray(64 * 1024))
+    def receive_recvfrom():
+        data, addr = rx.recvfrom(64 * 1024)
+        return 1
+    def receive_recvfrom_into():
+        nbytes, addr = rx.recvfrom_into(buffer)
+        return 1
+    receivers = [("recvfrom", receive_recvfrom), ("recvfrom_into", receive_recvfrom_into)]
+    batch_receiver = BatchSocket.BatchReceiver(rx, burst_size, use_recvmmsg=False)
+    receivers.append(("batch(socket)", lambda: len(batch_receiver.receive())))
+    if BatchSocket.has_recvmmsg():
+        mmsg_receiver = BatchSocket.BatchReceiver(rx, burst_size)
+        receivers.append(("recvmmsg", lambda: len(mmsg_receiver.receive())))
+
+    results = {}
+    for name, receive in receivers:
+        elapsed = 0.0
+        for _ in range(round_count):
+            for packet in packets:
+                tx.sendto(packet, address)
+            received = 0
+            start = time.perf_counter()
+            while received < burst_size:
+                received += receive()
+            elapsed += time.perf_counter() - start
+        results[name] = elapsed / (round_count * burst_size) * 1e6
+        print("  %-14s: %6.2f us/frame"%(name, results[name]))
+    rx.close()
+    tx.close()
+    return results
+
+
+def bench_fanout(target_counts=(10, 50, 200), frame_count=500):
+    """1フレーム分の fan-out（送信先毎に23バイト1個）の1フレームあたり時間を比較（loopback）"""
+    print("==================================================")
+    print("送信方式比較 (loopback): %d frames"%frame_count)
+    print("==================================================")
+    rx = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    rx.bind(("0.0.0.0", 0))
+    port = rx.getsockname()[1]
+    packed = struct.pack('<BiiiHd', 1, 356812345, 1397654321, 12345, 9000, time.time())
+
+    results = {}
+    for target_count in target_counts:
+        # 127.0.0.0/8 は全てループバック。送信先毎に別アドレス
+        addresses = [("127.0.%d.%d"%(i // 250, i % 250 + 1), port) for i in range(target_count)]
+        target_sockets = []
+        for address in addresses:
+            sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            sock.setblocking(False)
+            target_sockets.append((sock, address))
+        batch_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        batch_socket.setblocking(False)
+        datagrams = [(packed, address) for address in addresses]
+
+        def send_per_socket():
+            for sock, address in target_sockets:
+                try:
+                    sock.sendto(packed, address)
+                except OSError:
+                    pass
+        senders = [("per-socket", send_per_socket)]
+        fallback_sender = BatchSocket.BatchSender(batch_socket, use_sendmmsg=False)
+        senders.append(("batch(sendto)", lambda: fallback_sender.send(datagrams)))
+        if BatchSocket.has_sendmmsg():
+            mmsg_sender = BatchSocket.BatchSender(batch_socket)
+            senders.append(("sendmmsg", lambda: mmsg_sender.send(datagrams)))
+
+        results[target_count] = {}
+        for name, send in senders:
+            start = time.perf_counter()
+            for _ in range(frame_count):
+                send()
+            elapsed = (time.perf_counter() - start) / frame_count * 1e6
+            results[target_count][name] = elapsed
+            print("  %3d targets %-14s: %8.1f us/frame (%.2f us/target)"%(target_count, name, elapsed, elapsed / target_count))
+        for sock, address in target_sockets:
+            sock.close()
+        batch_socket.close()
+    rx.close()
+    return results
+
+
+def bench_geo(body_counts=(1, 2, 10, 50, 200), frame_count=2000):
+    """1フレーム分の剛体の NED → 緯度・経度・高度 変換の1フレームあたり時間を比較"""
+    print("==================================================")
+    print("NED → GPS 変換: %d frames"%frame_count)
+    print("==================================================")
+    ref_lat, ref_lon, ref_alt = 36.07578, 136.21329, 0.0
+    converter = GeoConversion.NedToLla(ref_lat, ref_lon, ref_alt)
+    linear_converter = GeoConversion.LinearNedToLla(ref_lat, ref_lon, ref_alt, 50.0, converter)
+    pyned2lla = GeoConversion.pyned2lla
+    if pyned2lla is not None:
+        wgs84 = pyned2lla.wgs84()
+    rng = random.Random(1)
+
+    results = {}
+    for body_count in body_counts:
+        points = [( rng.uniform(-30, 30), rng.uniform(-30, 30), rng.uniform(-10, 0) ) for i in range(body_count)]
+
+        def convert_pyned2lla():
+            for north, east, down in points:
+                pyned2lla.ned2lla(ref_lat * math.pi / 180.0, ref_lon * math.pi / 180.0, ref_alt, north, east, down, wgs84)
+
+        def convert_each(convert):
+            for north, east, down in points:
+                convert(north, east, down)
+        # "pyned2lla" は従来の ned_to_gps と同じく毎回基準点をラジアンに変換して呼ぶ
+        converters = []
+        if pyned2lla is not None:
+            converters.append(("pyned2lla", convert_pyned2lla))
+            converters.append(("engine", lambda: convert_each(converter.convert_pyned2lla)))
+        converters.append(("python", lambda: convert_each(converter.convert_python)))
+        converters.append(("linear", lambda: convert_each(linear_converter.convert)))
+        if GeoConversion.numpy is not None:
+            columns = GeoConversion.numpy.array(points).T.copy()
+            converters.append(("numpy", lambda: converter.convert_array(columns[0], columns[1], columns[2])))
+            converters.append(("numpy-lin", lambda: linear_converter.convert_array(columns[0], columns[1], columns[2])))
+
+        results[body_count] = {}
+        for name, convert in converters:
+            start = time.perf_counter()
+            for _ in range(frame_count):
+                convert()
+            elapsed = (time.perf_counter() - start) / frame_count * 1e6
+            results[body_count][name] = elapsed
+            print("  %3d bodies %-10s: %8.1f us/frame (%.2f us/body)"%(body_count, name, elapsed, elapsed / body_count))
+    return results
+
+
+def bench_history(body_count=10, frame_count=24000, queries=(( 1, 0.1 ), ( 1, 1.0 ), ( 1, 10.0 ))):
+    """1剛体あたりの履歴への追加時間と、直近 N 秒の読み出し・速度推定の時間"""
+    print("==================================================")
+    print("剛体データの履歴: %d bodies x %d frames (%d Hz)"%(body_count, frame_count, FRAME_RATE_HZ))
+    print("==================================================")
+    rng = random.Random(2)
+    pos = ( rng.uniform(-5, 5), rng.uniform(0, 2), rng.uniform(-5, 5) )
+    rot = ( 0.0, 0.0, 0.0, 1.0 )
+    fields = ( 360757800, 1362132900, 1000, 9000 )
+    record_count = body_count * frame_count
+    period_ns = 1000000000 // FRAME_RATE_HZ
+
+    # 従来の data_buffer（剛体毎の dict、ID 1 と 2 が揃ったらクリア）
+    data_buffer = {}
+    start = time.perf_counter()
+    for frame_number in range(frame_count):
+        for rigid_body_id in range(1, body_count + 1):
+            data_buffer[rigid_body_id] = {
+                'id': rigid_body_id,
+                'position': pos,
+                'rotation': rot,
+                'fields': fields,
+                'data_no': frame_number,
+                'time': None
+            }
+            if 1 in data_buffer and 2 in data_buffer:
+                data_buffer.clear()
+    elapsed = (time.perf_counter() - start) / record_count * 1e6
+    print("  %-24s: %6.3f us/body"%("dict (data_buffer)", elapsed))
+
+    history = FrameHistory.FrameHistory(record_count + 1)
+    start = time.perf_counter()
+    for frame_number in range(frame_count):
+        time_ns = frame_number * period_ns
+        for rigid_body_id in range(1, body_count + 1):
+            history.append(time_ns, frame_number, rigid_body_id, pos, rot, fields)
+    elapsed = (time.perf_counter() - start) / record_count * 1e6
+    print("  %-24s: %6.3f us/body (%d records, %d bytes)"%(
+        "FrameHistory.append", elapsed, record_count, record_count * FrameHistory.HistoryStruct.size))
+
+    if FrameHistory.numpy is None:
+        print("  NumPy がないため読み出しは省略")
+        return
+    def time_query(query, repeat=5):
+        """最速回の時間 [ms] と結果"""
+        best = None
+        for _ in range(repeat):
+            start = time.perf_counter()
+            result = query()
+            elapsed = time.perf_counter() - start
+            if best is None or elapsed < best:
+                best = elapsed
+        return best * 1e3, result
+
+    now_ns = ( frame_count - 1 ) * period_ns
+    for rigid_body_id, seconds in queries:
+        elapsed, columns = time_query(lambda: history.get_last(rigid_body_id, seconds, now_ns))
+        print("  get_last(%d, %5.1f s)       : %7.3f ms (%d records)"%(rigid_body_id, seconds, elapsed, len(columns['time_ns'])))
+    elapsed, velocities = time_query(lambda: history.get_velocities(0.1, now_ns))
+    print("  get_velocities(0.1 s)      : %7.3f ms (%d bodies)"%(elapsed, len(velocities)))
+
+
+def bench_memory(rigid_body_count=50, labeled_marker_count=500, frame_count=20, major=4, minor=1):
+    """デコード結果（MoCapData）を保持したときの1フレームあたりの確保バイト数・ブロック数とデコード時間"""
+    print("==================================================")
+    print("デコード結果のメモリ: %d rigid bodies / %d labeled markers / NatNet %d.%d"%(
+        rigid_body_count, labeled_marker_count, major, minor))
+    print("==================================================")
+    packet = pack_mocap_frame(1, rigid_body_count, labeled_marker_count, major, minor)
+    # メッセージID・サイズ（4バイト）の後からフレーム本体
+    data = memoryview(packet)
+    packet_size = len(packet) - 4
+    decoder_modes = ["legacy", "offset"]
+    if NatNetClientModule.numpy is not None:
+        decoder_modes.append("numpy")
+    results = {}
+    for decoder_mode in decoder_modes:
+        client, process_message = create_client(major, minor, decoder_mode)
+        if decoder_mode == "legacy":
+            unpack = client._NatNetClient__unpack_mocap_data
+            decode = lambda: unpack(data[4:], packet_size, major, minor)[1]
+        else:
+            decode_mocap_data = client._NatNetClient__decode_mocap_data
+            decode = lambda: decode_mocap_data(data, 4, packet_size, major, minor)[1]
+        with contextlib.redirect_stdout(io.StringIO()):
+            decode()
+            tracemalloc.start()
+            before = tracemalloc.take_snapshot()
+            frames = [decode() for _ in range(frame_count)]
+            after = tracemalloc.take_snapshot()
+            tracemalloc.stop()
+            del frames
+            start = time.perf_counter()
+            for _ in range(frame_count * 10):
+                decode()
+            elapsed = (time.perf_counter() - start) / (frame_count * 10) * 1e6
+        stats = after.compare_to(before, "filename")
+        size = sum(stat.size_diff for stat in stats) / frame_count
+        blocks = sum(stat.count_diff for stat in stats) / frame_count
+        results[decoder_mode] = size
+        print("  %-8s: %9.0f bytes/frame, %6.0f blocks/frame, decode %7.1f us/frame"%(
+            decoder_mode, size, blocks, elapsed))
+
+    # 1オブジェクトあたり（__slots__ と、同じ属性を持つ __dict__ のクラス）
+    class RigidBodyDict:
+        def __init__(self, new_id, pos, rot):
+            self.id_num = new_id
+            self.pos = pos
+            self.rot = rot
+            self.rb_marker_list = []
+            self.tracking_valid = False
+            self.error = 0.0
+            self.marker_num = -1
+    slotted = MoCapData.RigidBody(1, ( 0.0, 0.0, 0.0 ), ( 0.0, 0.0, 0.0, 1.0 ))
+    plain = RigidBodyDict(1, ( 0.0, 0.0, 0.0 ), ( 0.0, 0.0, 0.0, 1.0 ))
+    plain_size = sys.getsizeof(plain) + sys.getsizeof(plain.__dict__)
+    print("  RigidBody: __slots__ %d bytes / __dict__ %d bytes"%(sys.getsizeof(slotted), plain_size))
+    return results
+
+
+BENCHMARKS = {
+    "decode": bench_decoders,
+    "sections": bench_decode_sections,
+    "lazy": bench_lazy_frames,
+    "subscription": bench_rigid_body_subscription,
+    "receive": bench_receive,
+    "fanout": bench_fanout,
+    "geo": bench_geo,
+    "history": bench_history,
+    "memory": bench_memory,
+}
+
+if __name__ == "__main__":
+    names = sys.argv[1:] or list(BENCHMARKS)
+    for name in names:
+        BENCHMARKS[name]()
+        print("")
@@ -0,0 +1,224 @@
+# Motive 座標系 → NED 座標系の変換
+#
+# MotiveToNed : NED の各軸（north / east / down）に対応する Motive の軸と符号（"x", "-y" など）を指定する。
+#               デフォルトは従来の motive_to_ned と同じ north = +x, east = +z, down = -y。
+#   transform       : Motive の位置 (x, y, z)・クオータニオン (qx, qy, qz, qw) → (北, 東, 下, Yaw [deg]) を1回で求める
+#   transform_array : NumPy 版（pos: N×3, rot: N×4）
+#   quaternion      : NED のクオータニオン (qw, qx, qy, qz)
+#
+# 手系: 軸の対応（符号付き置換行列 R）の行列式が +1 なら Motive も NED と同じ右手系、-1 なら左手系として扱う。
+# クオータニオンのベクトル部は回転軸（擬ベクトル）なので det(R) * R * (qx, qy, qz)、w はそのまま
+# （回転行列 M に対して R M R^T と同じ）。
+# Motive の既定（Y-up: X, Y, Z）は右手系。
+#
+# test_all() : 従来の変換との一致と、回転行列を経由した Yaw との比較（右手系・左手系の全 48 通りの軸対応）
+
+import itertools
+import math
+import random
+
+# NumPy はオプション（transform_array でのみ使用）
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+NED_AXES = ( "north", "east", "down" )
+MOTIVE_AXES = ( "x", "y", "z" )
+DEFAULT_AXES = { "north": "x", "east": "z", "down": "-y" }
+
+K_SKIP = [0, 0, 1]
+K_FAIL = [0, 1, 0]
+K_PASS = [1, 0, 0]
+
+
+# "x" / "+x" / "-y" → (Motive の軸番号, 符号)
+def parse_axis(value):
+    value = str(value).strip().lower()
+    sign = 1.0
+    if value[:1] in ( "+", "-" ):
+        sign = -1.0 if value[0] == "-" else 1.0
+        value = value[1:]
+    if value not in MOTIVE_AXES:
+        raise ValueError("unknown Motive axis: %r"%value)
+    return MOTIVE_AXES.index(value), sign
+
+
+class MotiveToNed:
+    def __init__(self, axes=None):
+        if axes is None:
+            axes = DEFAULT_AXES
+        if set(axes) != set(NED_AXES):
+            raise ValueError("axes must have exactly %s: %r"%( ", ".join(NED_AXES), sorted(axes) ))
+        self.axes = { name: axes[name] for name in NED_AXES }
+        mapping = [parse_axis(axes[name]) for name in NED_AXES]
+        indices = [index for index, sign in mapping]
+        if sorted(indices) != [0, 1, 2]:
+            raise ValueError("each Motive axis must be used once: %r"%self.axes)
+
+        # 置換の符号 × 各軸の符号 = det(R)
+        inversions = sum(1 for i in range(3) for j in range(i + 1, 3) if indices[i] > indices[j])
+        determinant = -1.0 if inversions % 2 else 1.0
+        for index, sign in mapping:
+            determinant *= sign
+        self.handedness = "right" if determinant > 0 else "left"
+
+        ( self.north_index, self.north_sign ), ( self.east_index, self.east_sign ), ( self.down_index, self.down_sign ) = mapping
+        # クオータニオンのベクトル部の符号（det(R) * 軸の符号）
+        self.qn_sign = determinant * self.north_sign
+        self.qe_sign = determinant * self.east_sign
+        self.qd_sign = determinant * self.down_sign
+        # yaw = atan2(2 (w qd + qn qe), 1 - 2 (qe^2 + qd^2)) の係数
+        self.yaw_wd = 2.0 * self.qd_sign
+        self.yaw_ne = 2.0 * self.qn_sign * self.qe_sign
+
+    # (北, 東, 下, Yaw [deg]（-180 ～ 180）)
+    def transform(self, pos, rot):
+        north_index = self.north_index
+        east_index = self.east_index
+        down_index = self.down_index
+        q_north = rot[north_index]
+        q_east = rot[east_index]
+        q_down = rot[down_index]
+        yaw_rad = math.atan2(self.yaw_wd * rot[3] * q_down + self.yaw_ne * q_north * q_east,
+                             1.0 - 2.0 * ( q_east * q_east + q_down * q_down ))
+        return ( self.north_sign * pos[north_index], self.east_sign * pos[east_index], self.down_sign * pos[down_index],
+                 math.degrees(yaw_rad) )
+
+    # 列毎の配列 (北, 東, 下, Yaw [deg])
+    def transform_array(self, pos, rot):
+        if numpy is None:
+            raise RuntimeError("transform_array には NumPy が必要です")
+        pos = numpy.asarray(pos, dtype=numpy.float64)
+        rot = numpy.asarray(rot, dtype=numpy.float64)
+        q_north = rot[:, self.north_index]
+        q_east = rot[:, self.east_index]
+        q_down = rot[:, self.down_index]
+        yaw_rad = numpy.arctan2(self.yaw_wd * rot[:, 3] * q_down + self.yaw_ne * q_north * q_east,
+                                1.0 - 2.0 * ( q_east * q_east + q_down * q_down ))
+        return ( self.north_sign * pos[:, self.north_index], self.east_sign * pos[:, self.east_index],
+                 self.down_sign * pos[:, self.down_index], numpy.degrees(yaw_rad) )
+
+    # NED の位置 (北, 東, 下)
+    def position(self, pos):
+        return self.north_sign * pos[self.north_index], self.east_sign * pos[self.east_index], self.down_sign * pos[self.down_index]
+
+    # NED のクオータニオン (qw, qx, qy, qz)
+    def quaternion(self, rot):
+        return rot[3], self.qn_sign * rot[self.north_index], self.qe_sign * rot[self.east_index], self.qd_sign * rot[self.down_index]
+
+    def get_as_string(self):
+        axes = []
+        for name in NED_AXES:
+            index, sign = parse_axis(self.axes[name])
+            axes.append("%s=%s%s"%(name, "+" if sign > 0 else "-", MOTIVE_AXES[index]))
+        return "%s (Motive %s-handed)"%(", ".join(axes), self.handedness)
+
+
+# ---- テスト ----
+
+# クオータニオン (qx, qy, qz, qw) → 回転行列
+def quaternion_to_matrix(qx, qy, qz, qw):
+    return (
+        ( 1 - 2 * ( qy * qy + qz * qz ), 2 * ( qx * qy - qz * qw ), 2 * ( qx * qz + qy * qw ) ),
+        ( 2 * ( qx * qy + qz * qw ), 1 - 2 * ( qx * qx + qz * qz ), 2 * ( qy * qz - qx * qw ) ),
+        ( 2 * ( qx * qz - qy * qw ), 2 * ( qy * qz + qx * qw ), 1 - 2 * ( qx * qx + qy * qy ) ),
+    )
+
+
+# NED での回転行列 M' = R M R^T から Yaw = atan2(M'[1][0], M'[0][0]) を求める
+def get_reference_yaw(converter, rot):
+    qx, qy, qz, qw = rot
+    matrix = quaternion_to_matrix(qx, qy, qz, qw)
+    axes = [parse_axis(converter.axes[name]) for name in NED_AXES]
+    r = [[sign if column == index else 0.0 for column in range(3)] for index, sign in axes]
+    rm = [[sum(r[i][k] * matrix[k][j] for k in range(3)) for j in range(3)] for i in range(3)]
+    ned = [[sum(rm[i][k] * r[j][k] for k in range(3)) for j in range(3)] for i in range(3)]
+    return math.degrees(math.atan2(ned[1][0], ned[0][0]))
+
+
+def get_random_rotation(rng):
+    qx, qy, qz, qw = ( rng.gauss(0, 1) for i in range(4) )
+    norm = math.sqrt(qx * qx + qy * qy + qz * qz + qw * qw)
+    return qx / norm, qy / norm, qz / norm, qw / norm
+
+
+def angle_difference(a, b):
+    return abs(( a - b + 180.0 ) % 360.0 - 180.0)
+
+
+# 既定の軸対応が従来の motive_to_ned + quaternion_to_yaw_degrees（丸め前）と一致すること
+def test_default(run_test=True, count=2000):
+    test_name = "MotiveToNed default axes"
+    if not run_test:
+        print("[SKIP] %s"%test_name)
+        return K_SKIP
+    converter = MotiveToNed()
+    rng = random.Random(19)
+    ok = converter.handedness == "right"
+    for i in range(count):
+        pos = ( rng.uniform(-30, 30), rng.uniform(0, 10), rng.uniform(-30, 30) )
+        rot = get_random_rotation(rng)
+        qx, qy, qz, qw = rot
+        ned_qw, ned_qx, ned_qy, ned_qz = qw, qx, qz, -qy
+        yaw = math.degrees(math.atan2(2.0 * (ned_qw * ned_qz + ned_qx * ned_qy), 1.0 - 2.0 * (ned_qy**2 + ned_qz**2)))
+        north, east, down, yaw_deg = converter.transform(pos, rot)
+        ok &= ( north, east, down ) == ( pos[0], pos[2], -pos[1] ) and angle_difference(yaw_deg, yaw) < 1e-9
+        ok &= converter.quaternion(rot) == ( ned_qw, ned_qx, ned_qy, ned_qz )
+    if ok:
+        print("[PASS] %s: %d rotations"%(test_name, count))
+        return K_PASS
+    print("[FAIL] %s"%test_name)
+    return K_FAIL
+
+
+# 全ての軸対応（符号付き置換 48 通り）で Yaw が回転行列経由の値と一致し、NumPy 版がスカラー版と一致すること
+def test_all_axes(run_test=True, count=200):
+    test_name = "MotiveToNed all axis mappings"
+    if not run_test:
+        print("[SKIP] %s"%test_name)
+        return K_SKIP
+    rng = random.Random(48)
+    rotations = [get_random_rotation(rng) for i in range(count)]
+    positions = [( rng.uniform(-30, 30), rng.uniform(-30, 30), rng.uniform(-30, 30) ) for i in range(count)]
+    max_error = 0.0
+    mapping_count = 0
+    handedness_count = { "right": 0, "left": 0 }
+    ok = True
+    for permutation in itertools.permutations(MOTIVE_AXES):
+        for signs in itertools.product(( "", "-" ), repeat=3):
+            axes = { name: sign + axis for name, sign, axis in zip(NED_AXES, signs, permutation) }
+            converter = MotiveToNed(axes)
+            mapping_count += 1
+            handedness_count[converter.handedness] += 1
+            results = [converter.transform(pos, rot) for pos, rot in zip(positions, rotations)]
+            for rot, result in zip(rotations, results):
+                max_error = max(max_error, angle_difference(result[3], get_reference_yaw(converter, rot)))
+            if numpy is not None:
+                columns = converter.transform_array(numpy.array(positions), numpy.array(rotations))
+                for i, result in enumerate(results):
+                    ok &= all(abs(float(columns[k][i]) - result[k]) < 1e-9 for k in range(4))
+    ok &= max_error < 1e-9 and handedness_count == { "right": 24, "left": 24 }
+    detail = "%d mappings (%d right / %d left-handed), max yaw error %.3g deg"%(
+        mapping_count, handedness_count["right"], handedness_count["left"], max_error)
+    if ok:
+        print("[PASS] %s: %s"%(test_name, detail))
+        return K_PASS
+    print("[FAIL] %s: %s"%(test_name, detail))
+    return K_FAIL
+
+
+def test_all(run_test=True):
+    totals = [0, 0, 0]
+    for test in ( test_default, test_all_axes ):
+        result = test(run_test)
+        totals = [total + value for total, value in zip(totals, result)]
+    print("--------------------")
+    print("[PASS] Count = %3.1d"%totals[0])
+    print("[FAIL] Count = %3.1d"%totals[1])
+    print("[SKIP] Count = %3.1d"%totals[2])
+    return totals
+
+
+if __name__ == "__main__":
+    test_all(True)
@@ -128,6 +128,8 @@ def get_data_sub_packet_type(new_data):
 
 # cMarkerSetDescription
 class MarkerSetDescription:
+    __slots__ = ('marker_set_name', 'marker_names_list')
+
     def __init__(self):
         self.marker_set_name="Not Set"
         self.marker_names_list=[]
@@ -155,6 +157,8 @@ class MarkerSetDescription:
         return out_string
 
 class RBMarker:
+    __slots__ = ('marker_name', 'active_label', 'pos')
+
     def __init__(self, marker_name="", active_label=0, pos=[0.0,0.0,0.0]):
         self.marker_name = marker_name
         self.active_label = active_label
@@ -169,6 +173,8 @@ class RBMarker:
 
 
 class RigidBodyDescription:
+    __slots__ = ('sz_name', 'id_num', 'parent_id', 'pos', 'rb_marker_list', 'rb_num')
+
     def __init__(self,sz_name="", new_id=0, parent_id=0,pos=[0.0,0.0,0.0]):
         self.sz_name=sz_name
         self.id_num = new_id
@@ -220,6 +226,8 @@ class RigidBodyDescription:
 
 
 class SkeletonDescription:
+    __slots__ = ('name', 'id_num', 'rigid_body_description_list')
+
     def __init__(self, name="", new_id=0):
         self.name = name
         self.id_num = new_id
@@ -250,6 +258,9 @@ class SkeletonDescription:
 
 
 class ForcePlateDescription:
+    __slots__ = ('id_num', 'serial_number', 'width', 'length', 'position',
+                 'cal_matrix', 'corners', 'plate_type', 'channel_data_type', 'channel_list')
+
     def __init__(self, new_id=0, serial_number=""):
         self.id_num = new_id
         self.serial_number = serial_number
@@ -352,6 +363,8 @@ class ForcePlateDescription:
 
 class DeviceDescription:
     """Device Description class"""
+    __slots__ = ('id_num', 'name', 'serial_number', 'device_type', 'channel_data_type', 'channel_list')
+
     def __init__(self,new_id,name, serial_number,device_type,channel_data_type):
         self.id_num=new_id
         self.name=name
@@ -392,6 +405,8 @@ class DeviceDescription:
 
 class CameraDescription:
     """Camera Description class"""
+    __slots__ = ('name', 'position', 'orientation')
+
     def __init__(self, name, position_vec3, orientation_quat):
         self.name=name
         self.position=position_vec3
@@ -412,6 +427,8 @@ class CameraDescription:
 
 class MarkerDescription:
     """Marker Description class"""
+    __slots__ = ('name', 'marker_id', 'position', 'marker_size', 'marker_params')
+
     def __init__(self, name, marker_id, position, marker_size, marker_params):
         self.name=name
         self.marker_id=marker_id
@@ -434,6 +451,8 @@ class MarkerDescription:
 
 class AssetDescription:
     """Asset Description class"""
+    __slots__ = ('name', 'assetType', 'assetID', 'rigidbodyArray', 'markerArray')
+
     def __init__(self, name, assetType, assetID, rigidbodyArray, markerArray):
         self.name=name
         self.assetType=assetType
@@ -472,8 +491,11 @@ class AssetDescription:
 # Full data descriptions
 class DataDescriptions():
     """Data Descriptions class"""
-    order_num = 0
+    __slots__ = ('data_order_dict', 'marker_set_list', 'rigid_body_list', 'skeleton_list', 'asset_list',
+                 'force_plate_list', 'device_list', 'camera_list', 'order_num')
+
     def __init__(self):
+        self.order_num = 0
         self.data_order_dict={}
         self.marker_set_list=[]
         self.rigid_body_list=[]
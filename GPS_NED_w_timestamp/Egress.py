@@ -0,0 +1,343 @@
+# 送信先（Raspi）毎の UDP 送信ワーカー
+#
+# TargetSender : 送信先1つにつき1スレッド。剛体ID毎のスロットに最新の送信データだけを保持し（latest-value-wins）、
+#                未送信のデータは新しいデータで上書きする。送信が遅い・届かない送信先は自分のデータを失うだけで、
+#                デコードや他の送信先の送信を止めない。close() 時はスロットに残っている最新値を送信してから終了し、
+#                close() 後の put は送信せず dropped_count に数える。
+# EgressPool   : 送信先 IP → TargetSender の集合。
+# TargetHealth : 送信結果から送信先の状態（ok / refused / unreachable / error）を判定する。
+#                送信先ソケットは connect 済みなので、ICMP port unreachable などが次の send のエラーとして返る。
+#                connect に失敗した送信先は connected = False とし、再接続できるまで sendto で送る。
+#
+# 送信処理は send_function(item) で行い、失敗時は OSError を送出させる。エラー表示は送信先毎に1秒に1回まで。
+#
+# pack_coalesced_datagram / unpack_coalesced_datagram : 1フレーム分の同じ送信先の剛体をまとめたデータグラム（egress_coalesce）
+
+import errno
+import struct
+import threading
+import time
+
+import Stats
+
+# まとめ送信のデータグラム: ヘッダ（マジック "GN", バージョン, レコード数, NatNet フレーム番号）+ 23バイトのレコード × N
+CoalescedHeader = struct.Struct('<2sBBi')
+RigidBodyRecord = struct.Struct('<BiiiHd')
+COALESCED_MAGIC = b"GN"
+COALESCED_VERSION = 1
+# IP フラグメントを避けるため 1472 バイト（MTU 1500 - IP/UDP ヘッダ）に収まる件数
+COALESCED_MAX_RECORDS = ( 1472 - CoalescedHeader.size ) // RigidBodyRecord.size
+
+# 送信先毎の遅延計測の段階
+#   wait   : put → 送信開始（スロットでの待ち）
+#   sendto : send_function の呼び出し
+EGRESS_STAGES = ( "wait", "sendto" )
+
+ERROR_PRINT_INTERVAL_NS = 1000 * 1000 * 1000
+
+# 送信先の状態
+#   unknown     : まだ送信していない
+#   ok          : 直近 HEALTH_HOLD_NS の間エラーなし
+#   refused     : ICMP port unreachable（Raspi は応答するが受信プログラムが動いていない）
+#   unreachable : ICMP host / network unreachable（Raspi に届かない）
+#   error       : その他の送信エラー
+HEALTH_STATES = ( "unknown", "ok", "refused", "unreachable", "error" )
+# ICMP エラーはカーネルで間引かれ（1秒に1回程度）、間の送信は成功するため、エラー状態を保持する時間
+HEALTH_HOLD_NS = 3 * 1000 * 1000 * 1000
+# connect に失敗した送信先の再接続を試みる間隔
+CONNECT_RETRY_NS = 1000 * 1000 * 1000
+
+
+class TargetSender:
+    def __init__(self, name, send_function, sample_count=1024):
+        self.name = name
+        self.send_function = send_function
+        self.__slots = {}                       # key -> (put time, item)
+        self.__cond = threading.Condition()
+        self.__closed = False
+        self.__thread = None
+
+        self.put_count = 0
+        self.sent_count = 0
+        self.error_count = 0
+        self.overwritten_count = 0              # 送信前に新しいデータで上書きされた件数
+        self.dropped_count = 0                  # close() 後に put され送信しなかった件数
+        self.last_error = None
+        self.__last_error_print_ns = None
+        self.__unprinted_error_count = 0
+        self.latency = Stats.LatencyTracer(sample_count, EGRESS_STAGES)
+
+    def start(self):
+        self.__thread = threading.Thread(target=self.__run, name="egress " + self.name, daemon=True)
+        self.__thread.start()
+
+    # key（剛体ID）のスロットに item を入れる。生産者はブロックしない
+    def put(self, key, item):
+        with self.__cond:
+            self.put_count += 1
+            if self.__closed:
+                self.dropped_count += 1
+                return
+            if key in self.__slots:
+                self.overwritten_count += 1
+            self.__slots[key] = (time.perf_counter_ns(), item)
+            self.__cond.notify()
+
+    def close(self):
+        with self.__cond:
+            self.__closed = True
+            self.__cond.notify_all()
+
+    def join(self, timeout=None):
+        if self.__thread is not None:
+            self.__thread.join(timeout)
+
+    def __run(self):
+        while True:
+            with self.__cond:
+                while not self.__slots and not self.__closed:
+                    self.__cond.wait()
+                # close() 後は put されないので、残っている分を送信して終了する
+                closed = self.__closed
+                pending = self.__slots
+                self.__slots = {}
+            for put_time_ns, item in pending.values():
+                send_start_ns = time.perf_counter_ns()
+                try:
+                    self.send_function(item)
+                except OSError as msg:
+                    self.__on_error(msg, send_start_ns)
+                    continue
+                self.sent_count += 1
+                self.latency.add("wait", send_start_ns - put_time_ns)
+                self.latency.add("sendto", time.perf_counter_ns() - send_start_ns)
+            if closed:
+                return
+
+    def __on_error(self, msg, now_ns):
+        self.error_count += 1
+        self.last_error = msg
+        self.__unprinted_error_count += 1
+        if self.__last_error_print_ns is None or now_ns - self.__last_error_print_ns >= ERROR_PRINT_INTERVAL_NS:
+            print(f"✗ UDP send error to {self.name}: {msg} ({self.__unprinted_error_count} errors)")
+            self.__last_error_print_ns = now_ns
+            self.__unprinted_error_count = 0
+
+    def get_as_string(self):
+        out_str = "%-16s: Put %d, Sent %d, Errors %d, Overwritten %d, Dropped %d"%(
+            self.name, self.put_count, self.sent_count, self.error_count, self.overwritten_count, self.dropped_count)
+        for stage in EGRESS_STAGES:
+            percentiles = self.latency.get_percentiles(stage, (50, 99))
+            if percentiles is not None:
+                out_str += ", %s p50 %.3f ms p99 %.3f ms"%(stage, percentiles[0] / 1e6, percentiles[1] / 1e6)
+        if self.last_error is not None:
+            out_str += ", last error: %s"%self.last_error
+        return out_str
+
+
+class TargetHealth:
+    def __init__(self, name):
+        self.name = name
+        self.state = "unknown"
+        self.last_ok_ns = None
+        self.last_error_ns = None
+        self.last_error = None
+        self.refused_count = 0
+        self.unreachable_count = 0
+        self.other_error_count = 0
+        # 送信先ソケットの connect 状態。False の間は sendto で送る
+        self.connected = False
+        self.connect_error = None
+        self.last_connect_attempt_ns = None
+
+    def record_connect(self, now_ns):
+        self.last_connect_attempt_ns = now_ns
+        if self.connect_error is not None:
+            print(f"[Egress] {self.name}: connected")
+        self.connected = True
+        self.connect_error = None
+
+    def record_connect_error(self, msg, now_ns):
+        self.last_connect_attempt_ns = now_ns
+        self.connected = False
+        self.connect_error = msg
+
+    def should_retry_connect(self, now_ns):
+        return not self.connected and ( self.last_connect_attempt_ns is None or now_ns - self.last_connect_attempt_ns >= CONNECT_RETRY_NS )
+
+    def record_success(self, now_ns):
+        self.last_ok_ns = now_ns
+        if self.state != "ok" and ( self.last_error_ns is None or now_ns - self.last_error_ns >= HEALTH_HOLD_NS ):
+            self.__set_state("ok")
+
+    def record_error(self, msg, now_ns):
+        self.last_error_ns = now_ns
+        self.last_error = msg
+        if isinstance(msg, ConnectionRefusedError):
+            self.refused_count += 1
+            state = "refused"
+        elif getattr(msg, "errno", None) in ( errno.EHOSTUNREACH, errno.ENETUNREACH ):
+            self.unreachable_count += 1
+            state = "unreachable"
+        else:
+            self.other_error_count += 1
+            state = "error"
+        if state != self.state:
+            self.__set_state(state, msg)
+
+    def __set_state(self, state, msg=None):
+        detail = "" if msg is None else " (%s)"%msg
+        print(f"[Egress] {self.name}: {self.state} → {state}{detail}")
+        self.state = state
+
+    def get_as_string(self, now_ns):
+        out_str = "%-16s: %s"%(self.name, self.state)
+        if self.last_ok_ns is not None:
+            out_str += ", last ok %.1f s ago"%( (now_ns - self.last_ok_ns) / 1e9 )
+        out_str += ", refused %d, unreachable %d, other errors %d"%(
+            self.refused_count, self.unreachable_count, self.other_error_count)
+        if not self.connected:
+            out_str += ", not connected (sendto"
+            if self.connect_error is not None:
+                out_str += ", connect error: %s"%self.connect_error
+            out_str += ")"
+        return out_str
+
+
+class EgressPool:
+    def __init__(self, target_names, send_function):
+        self.senders = {name: TargetSender(name, send_function) for name in target_names}
+
+    def start(self):
+        for sender in self.senders.values():
+            sender.start()
+
+    def put(self, target_name, key, item):
+        self.senders[target_name].put(key, item)
+
+    def close(self):
+        for sender in self.senders.values():
+            sender.close()
+
+    def join(self, timeout=None):
+        for sender in self.senders.values():
+            sender.join(timeout)
+
+    def get_sent_count(self):
+        return sum(sender.sent_count for sender in self.senders.values())
+
+    def get_error_count(self):
+        return sum(sender.error_count for sender in self.senders.values())
+
+    def get_as_string(self):
+        out_str = "Egress Statistics\n"
+        for sender in self.senders.values():
+            out_str += "  " + sender.get_as_string() + "\n"
+        return out_str
+
+
+# records は RigidBodyRecord でパック済みの bytes のリスト（COALESCED_MAX_RECORDS 件まで）
+def pack_coalesced_datagram(frame_number, records):
+    return CoalescedHeader.pack(COALESCED_MAGIC, COALESCED_VERSION, len(records), frame_number) + b"".join(records)
+
+
+# (フレーム番号, [(rigid_body_id, lat_e7, lon_e7, alt_mm, yaw_cdeg, unix_time_sec), ...]) を返す。
+# 23バイトの単独レコードは (None, [record]) として扱う
+def unpack_coalesced_datagram(data):
+    if len(data) == RigidBodyRecord.size:
+        return None, [RigidBodyRecord.unpack(data)]
+    magic, version, count, frame_number = CoalescedHeader.unpack_from(data, 0)
+    if magic != COALESCED_MAGIC or version != COALESCED_VERSION:
+        raise ValueError("unknown datagram: magic %r version %d"%(magic, version))
+    if len(data) != CoalescedHeader.size + count * RigidBodyRecord.size:
+        raise ValueError("datagram length %d does not match %d records"%(len(data), count))
+    records = [RigidBodyRecord.unpack_from(data, CoalescedHeader.size + i * RigidBodyRecord.size) for i in range(count)]
+    return frame_number, records
+
+
+# ---- テスト ----
+
+K_SKIP = [0, 0, 1]
+K_FAIL = [0, 1, 0]
+K_PASS = [1, 0, 0]
+
+
+# COALESCED_MAX_RECORDS 件のデータグラムが 1472 バイトに収まり、pack / unpack で元のレコードに戻ること
+def test_coalesced_round_trip(run_test=True):
+    test_name = "Egress coalesced datagram"
+    if not run_test:
+        print("[SKIP] %s"%test_name)
+        return K_SKIP
+    records = [( i + 1, 356000000 + i, 1397000000 - i, 1000 * i, ( 97 * i ) % 36000, 1717084800.0 + i / 100.0 )
+               for i in range(COALESCED_MAX_RECORDS)]
+    datagram = pack_coalesced_datagram(123456, [RigidBodyRecord.pack(*record) for record in records])
+    ok = len(datagram) <= 1472 and unpack_coalesced_datagram(datagram) == ( 123456, records )
+    # 単独の23バイトレコード
+    ok &= unpack_coalesced_datagram(RigidBodyRecord.pack(*records[0])) == ( None, records[:1] )
+    for broken in ( b"XX" + datagram[2:], datagram[:-1] ):
+        try:
+            unpack_coalesced_datagram(broken)
+            ok = False
+        except ValueError:
+            pass
+    if ok:
+        print("[PASS] %s: %d records in %d bytes"%(test_name, len(records), len(datagram)))
+        return K_PASS
+    print("[FAIL] %s"%test_name)
+    return K_FAIL
+
+
+# 送信中に同じキーへ put されたデータは最新の値だけが送信され、close() 時に残っている値も送信されること
+def test_latest_value_wins(run_test=True):
+    test_name = "Egress TargetSender latest value wins"
+    if not run_test:
+        print("[SKIP] %s"%test_name)
+        return K_SKIP
+    sent = []
+    sending = threading.Event()
+    gate = threading.Event()
+
+    def send(item):
+        sending.set()
+        # 最初の送信で止めて、その間に put する
+        gate.wait(5.0)
+        if item == "error":
+            raise OSError(errno.ECONNREFUSED, "refused")
+        sent.append(item)
+
+    sender = TargetSender("test", send)
+    sender.start()
+    sender.put(1, "a0")
+    ok = sending.wait(5.0)
+    for item in ( "a1", "a2" ):
+        sender.put(1, item)
+    sender.put(2, "b0")
+    sender.put(3, "error")
+    # 送信待ちの値が残ったまま close() する
+    sender.close()
+    gate.set()
+    sender.join(5.0)
+    sender.put(1, "a3")
+    ok &= sent == [ "a0", "a2", "b0" ]
+    ok &= ( sender.put_count, sender.sent_count, sender.error_count, sender.overwritten_count, sender.dropped_count ) == ( 6, 3, 1, 1, 1 )
+    if ok:
+        print("[PASS] %s: %s"%(test_name, sender.get_as_string()))
+        return K_PASS
+    print("[FAIL] %s: sent %r, %s"%(test_name, sent, sender.get_as_string()))
+    return K_FAIL
+
+
+def test_all(run_test=True):
+    totals = [0, 0, 0]
+    for test in ( test_coalesced_round_trip, test_latest_value_wins ):
+        result = test(run_test)
+        totals = [total + value for total, value in zip(totals, result)]
+    print("--------------------")
+    print("[PASS] Count = %3.1d"%totals[0])
+    print("[FAIL] Count = %3.1d"%totals[1])
+    print("[SKIP] Count = %3.1d"%totals[2])
+    return totals
+
+
+if __name__ == "__main__":
+    test_all(True)
@@ -0,0 +1,152 @@
+# 送信レコードの固定小数点フィールド（lat_e7 / lon_e7 / alt_mm / yaw_cdeg）への変換
+#
+# to_fields       : 緯度・経度 [deg]、高度 [m]、Yaw [deg] → (lat_e7, lon_e7, alt_mm, yaw_cdeg)
+#                   それぞれ最も近い整数に丸める（round / numpy.rint。ちょうど中間の場合は偶数側）。
+#                   yaw_cdeg は 0 ～ 35999 に正規化する。
+# to_fields_array : NumPy 配列版（同じ丸め）
+#
+# 従来の経路（round(lat, 7) → int(lat * 1e7)、round(yaw, 3) → int(yaw * 100)）は、丸めた値の2進表現が
+# 整数のわずかに下になると int() の切り捨てで1小さくなり、Yaw は 0.01 度未満を切り捨てていた。
+#
+# test_all() : 従来の経路・正確な丸め（fractions.Fraction）との比較
+
+import fractions
+import math
+import random
+
+# NumPy はオプション（to_fields_array でのみ使用）
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+LAT_LON_SCALE = 1e7
+ALT_SCALE = 1000.0
+YAW_SCALE = 100.0
+YAW_CDEG_FULL_TURN = 36000
+
+K_SKIP = [0, 0, 1]
+K_FAIL = [0, 1, 0]
+K_PASS = [1, 0, 0]
+
+
+# 位置が有限でない場合は None。Yaw が有限でない場合は 0
+def to_fields(lat_deg, lon_deg, alt_m, yaw_deg):
+    if not math.isfinite(lat_deg + lon_deg + alt_m):
+        return None
+    if math.isfinite(yaw_deg):
+        yaw_cdeg = round(yaw_deg * YAW_SCALE) % YAW_CDEG_FULL_TURN
+    else:
+        yaw_cdeg = 0
+    return round(lat_deg * LAT_LON_SCALE), round(lon_deg * LAT_LON_SCALE), round(alt_m * ALT_SCALE), yaw_cdeg
+
+
+# (lat_e7, lon_e7, alt_mm, yaw_cdeg, valid) の配列を返す。valid は位置が有限の要素
+def to_fields_array(lat_deg, lon_deg, alt_m, yaw_deg):
+    if numpy is None:
+        raise RuntimeError("to_fields_array には NumPy が必要です")
+    valid = numpy.isfinite(lat_deg) & numpy.isfinite(lon_deg) & numpy.isfinite(alt_m)
+    yaw_cdeg = numpy.rint(numpy.where(numpy.isfinite(yaw_deg), yaw_deg, 0.0) * YAW_SCALE)
+    with numpy.errstate(invalid="ignore"):
+        lat_e7 = numpy.where(valid, numpy.rint(lat_deg * LAT_LON_SCALE), 0).astype(numpy.int64)
+        lon_e7 = numpy.where(valid, numpy.rint(lon_deg * LAT_LON_SCALE), 0).astype(numpy.int64)
+        alt_mm = numpy.where(valid, numpy.rint(alt_m * ALT_SCALE), 0).astype(numpy.int64)
+    return lat_e7, lon_e7, alt_mm, yaw_cdeg.astype(numpy.int64) % YAW_CDEG_FULL_TURN, valid
+
+
+# 表示用（従来の GPS 表示と同じ桁数）
+def format_gps(fields):
+    return "(%.7f, %.7f, %.3f)"%(fields[0] / LAT_LON_SCALE, fields[1] / LAT_LON_SCALE, fields[2] / ALT_SCALE)
+
+
+# 従来の経路（ned_to_gps / quaternion_to_yaw_degrees の丸めと __handle_rigid_body の int()）
+def to_fields_legacy(lat_deg, lon_deg, alt_m, yaw_deg):
+    yaw_deg = yaw_deg % 360.0
+    return ( int(round(lat_deg, 7) * 1e7), int(round(lon_deg, 7) * 1e7), int(round(alt_m, 3) * 1000),
+             int(round(yaw_deg, 3) * 100) )
+
+
+# 正確な丸め（浮動小数点値をそのまま有理数として扱い、最も近い整数。中間は偶数側）
+def to_fields_exact(lat_deg, lon_deg, alt_m, yaw_deg):
+    return ( round(fractions.Fraction(lat_deg) * 10**7), round(fractions.Fraction(lon_deg) * 10**7),
+             round(fractions.Fraction(alt_m) * 1000), round(fractions.Fraction(yaw_deg) * 100) % YAW_CDEG_FULL_TURN )
+
+
+# 乱数の値と、丸めの境界（10進で最下位桁の中間・整数のすぐ下）付近の値
+def get_test_values(rng, count):
+    values = []
+    for i in range(count):
+        lat = rng.uniform(-90.0, 90.0)
+        lon = rng.uniform(-180.0, 180.0)
+        alt = rng.uniform(-500.0, 5000.0)
+        yaw = rng.uniform(-180.0, 180.0)
+        values.append(( lat, lon, alt, yaw ))
+        # 最下位桁が整数付近・中間付近になる値（従来の経路が切り捨てで外れやすい）
+        k_lat = rng.randrange(-900000000, 900000000)
+        k_lon = rng.randrange(-1800000000, 1800000000)
+        k_alt = rng.randrange(-500000, 5000000)
+        k_yaw = rng.randrange(-18000, 18000)
+        offset = rng.choice(( 0.0, 1e-9, -1e-9, 0.4999, 0.5001 ))
+        values.append(( ( k_lat + offset ) / 1e7, ( k_lon + offset ) / 1e7, ( k_alt + offset ) / 1000.0, ( k_yaw + offset ) / 100.0 ))
+    return values
+
+
+def test_fields(run_test=True, count=20000):
+    test_name = "to_fields (%d values)"%( count * 2 )
+    if not run_test:
+        print("[SKIP] %s"%test_name)
+        return K_SKIP
+    rng = random.Random(18)
+    values = get_test_values(rng, count)
+    ok = True
+    exact_mismatch = 0
+    legacy_mismatch = 0
+    legacy_max_diff = 0
+    for value in values:
+        fields = to_fields(*value)
+        if fields != to_fields_exact(*value):
+            exact_mismatch += 1
+        legacy = to_fields_legacy(*value)
+        if legacy != fields:
+            legacy_mismatch += 1
+            for i in range(4):
+                diff = abs(legacy[i] - fields[i])
+                if i == 3:
+                    diff = min(diff, YAW_CDEG_FULL_TURN - diff)
+                legacy_max_diff = max(legacy_max_diff, diff)
+    ok &= exact_mismatch == 0 and legacy_max_diff <= 1
+
+    array_mismatch = 0
+    if numpy is not None:
+        columns = numpy.array(values).T
+        lat_e7, lon_e7, alt_mm, yaw_cdeg, valid = to_fields_array(columns[0], columns[1], columns[2], columns[3])
+        for i, value in enumerate(values):
+            if ( int(lat_e7[i]), int(lon_e7[i]), int(alt_mm[i]), int(yaw_cdeg[i]) ) != to_fields(*value):
+                array_mismatch += 1
+        ok &= array_mismatch == 0 and bool(valid.all())
+
+    ok &= to_fields(float("nan"), 0.0, 0.0, 0.0) is None and to_fields(0.0, 0.0, 0.0, float("nan")) == (0, 0, 0, 0)
+    ok &= to_fields(0.0, 0.0, 0.0, 359.996)[3] == 0 and to_fields(0.0, 0.0, 0.0, -0.004)[3] == 0
+
+    detail = "exact mismatch %d, array mismatch %d, legacy path differs in %d (max %d LSB)"%(
+        exact_mismatch, array_mismatch, legacy_mismatch, legacy_max_diff)
+    if ok:
+        print("[PASS] %s: %s"%(test_name, detail))
+        return K_PASS
+    print("[FAIL] %s: %s"%(test_name, detail))
+    return K_FAIL
+
+
+def test_all(run_test=True):
+    totals = [0, 0, 0]
+    result = test_fields(run_test)
+    totals = [total + value for total, value in zip(totals, result)]
+    print("--------------------")
+    print("[PASS] Count = %3.1d"%totals[0])
+    print("[FAIL] Count = %3.1d"%totals[1])
+    print("[SKIP] Count = %3.1d"%totals[2])
+    return totals
+
+
+if __name__ == "__main__":
+    test_all(True)
@@ -0,0 +1,319 @@
+# 受信した剛体データの履歴（固定容量のリング）
+#
+# FrameHistory : 剛体1個分を固定長レコード（HistoryStruct）として事前確保した bytearray に pack_into で書き込む
+#                （データスレッドから1剛体あたり1回。dict などの確保なし）。容量を超えると最も古いレコードから上書きする。
+#                読み出しは NumPy の構造化配列ビュー（列毎のビュー）でまとめて行う。
+#   append         : time_ns, NatNet フレーム番号, 剛体ID, 位置・クオータニオン（Motive）, 送信フィールド
+#                    （lat_e7, lon_e7, alt_mm, yaw_cdeg。変換していない剛体は None）
+#   get_last       : 剛体 k の直近 N 秒分を列毎の配列で返す（時刻順）。NED と Yaw は位置・クオータニオンから
+#                    transform（CoordinateTransform.MotiveToNed）で求め、緯度・経度・高度は送信フィールドから求める
+#   get_velocity   : 剛体 k の直近 N 秒分の NED 速度 [m/s]（最小二乗の傾き）
+#   get_velocities : 直近 N 秒に記録された全剛体の NED 速度
+#   get_latest     : 剛体 k の最新レコード（NumPy 不要）
+#
+# 書き込みはデータスレッド1つ、読み出しは任意のスレッドから行う。読み出し中に上書きされたレコードは結果から除く。
+#
+# test_all() : 上書き・時間窓・速度推定・読み出し中の上書き
+
+import random
+import struct
+import threading
+import time
+
+import CoordinateTransform
+import FixedPoint
+
+# NumPy はオプション（append / get_latest 以外で使用）
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# time_ns, frame_number, rigid_body_id, pos_x, pos_y, pos_z, quat_x, quat_y, quat_z, quat_w,
+# lat_e7, lon_e7, alt_mm, yaw_cdeg, flags
+HistoryStruct = struct.Struct('<qii7fiiiHB')
+FLAG_FIELDS = 0x01                              # 送信フィールドが有効
+
+if numpy is not None:
+    HISTORY_DTYPE = numpy.dtype([
+        ( "time_ns", "<i8" ), ( "frame_number", "<i4" ), ( "rigid_body_id", "<i4" ),
+        ( "pos", "<f4", ( 3, ) ), ( "quat", "<f4", ( 4, ) ),
+        ( "lat_e7", "<i4" ), ( "lon_e7", "<i4" ), ( "alt_mm", "<i4" ), ( "yaw_cdeg", "<u2" ), ( "flags", "u1" ),
+    ])
+    assert HISTORY_DTYPE.itemsize == HistoryStruct.size
+
+K_SKIP = [0, 0, 1]
+K_FAIL = [0, 1, 0]
+K_PASS = [1, 0, 0]
+
+
+class FrameHistory:
+    def __init__(self, capacity=64*1024, transform=None):
+        if capacity < 2:
+            raise ValueError("capacity must be at least 2: %r"%capacity)
+        if transform is None:
+            transform = CoordinateTransform.MotiveToNed()
+        self.capacity = capacity
+        self.transform = transform
+        self.__buffer = bytearray(capacity * HistoryStruct.size)
+        self.__write_index = 0                  # 次に書くレコード（データスレッドだけが進める）
+
+    # ---- データスレッド側 ----
+
+    def append(self, time_ns, frame_number, rigid_body_id, pos, rot, fields=None):
+        write_index = self.__write_index
+        offset = ( write_index % self.capacity ) * HistoryStruct.size
+        if fields is None:
+            HistoryStruct.pack_into(self.__buffer, offset, time_ns, frame_number, rigid_body_id,
+                                    pos[0], pos[1], pos[2], rot[0], rot[1], rot[2], rot[3], 0, 0, 0, 0, 0)
+        else:
+            HistoryStruct.pack_into(self.__buffer, offset, time_ns, frame_number, rigid_body_id,
+                                    pos[0], pos[1], pos[2], rot[0], rot[1], rot[2], rot[3],
+                                    fields[0], fields[1], fields[2], fields[3], FLAG_FIELDS)
+        self.__write_index = write_index + 1
+
+    # ---- 読み出し側 ----
+
+    # 読み出せるレコード数（書き込み位置のスロットを除く）
+    def get_count(self):
+        return min(self.__write_index, self.capacity - 1)
+
+    # 剛体 k の最新レコードを dict で返す（無い場合は None）
+    def get_latest(self, rigid_body_id):
+        write_index = self.__write_index
+        for index in range(write_index - 1, max(write_index + 1 - self.capacity, 0) - 1, -1):
+            record = HistoryStruct.unpack_from(self.__buffer, ( index % self.capacity ) * HistoryStruct.size)
+            if record[2] != rigid_body_id:
+                continue
+            # 読んでいる間に上書きされた（または上書き中）
+            if index < self.__write_index + 1 - self.capacity:
+                return None
+            return self.__get_record_dict(record)
+        return None
+
+    def __get_record_dict(self, record):
+        fields = tuple(record[10:14]) if record[14] & FLAG_FIELDS else None
+        return {
+            'time_ns': record[0],
+            'frame_number': record[1],
+            'id': record[2],
+            'position': record[3:6],
+            'rotation': record[6:10],
+            'fields': fields,
+        }
+
+    # since_ns 以降（time_ns >= since_ns）のレコードを時刻順（書き込み順）に返す。rigid_body_id が None の場合は全剛体
+    def __select(self, rigid_body_id, since_ns):
+        if numpy is None:
+            raise RuntimeError("FrameHistory の読み出しには NumPy が必要です")
+        # 書き込み位置のスロット（= 最も古いレコード）は書き込み中の可能性があるため読まない
+        write_index = self.__write_index
+        count = min(write_index, self.capacity - 1)
+        first_index = write_index - count
+        records = numpy.frombuffer(self.__buffer, dtype=HISTORY_DTYPE)
+        # リング上で古い順に [start, capacity) → [0, start)
+        start = first_index % self.capacity
+        if start + count <= self.capacity:
+            segments = ( ( records[start:start + count], first_index ), )
+        else:
+            segments = ( ( records[start:], first_index ), ( records[:start + count - self.capacity], first_index + self.capacity - start ) )
+        selected = []
+        indices = []
+        for segment, segment_first_index in segments:
+            mask = segment["time_ns"] >= since_ns
+            if rigid_body_id is not None:
+                mask &= segment["rigid_body_id"] == rigid_body_id
+            positions = numpy.flatnonzero(mask)
+            selected.append(segment[positions])
+            indices.append(positions + segment_first_index)
+        selected = numpy.concatenate(selected)
+        indices = numpy.concatenate(indices)
+        # コピー中にデータスレッドが上書きした（または上書き中の）レコードを除く
+        overwritten_before = self.__write_index + 1 - self.capacity
+        if len(indices) and indices[0] < overwritten_before:
+            selected = selected[indices >= overwritten_before]
+        return selected
+
+    # 剛体 k の直近 seconds 秒分（now_ns は基準時刻、省略時は time.time_ns()）を列毎の配列の dict で返す
+    def get_last(self, rigid_body_id, seconds, now_ns=None):
+        if now_ns is None:
+            now_ns = time.time_ns()
+        return self.get_columns(self.__select(rigid_body_id, now_ns - int(seconds * 1e9)))
+
+    # 構造化配列 → 列毎の配列（NED・Yaw・緯度・経度・高度を追加）
+    def get_columns(self, records):
+        pos = records["pos"].astype(numpy.float64)
+        quat = records["quat"].astype(numpy.float64)
+        north, east, down, yaw_deg = self.transform.transform_array(pos.reshape(-1, 3), quat.reshape(-1, 4))
+        has_fields = ( records["flags"] & FLAG_FIELDS ) != 0
+        return {
+            'time_ns': records["time_ns"].copy(),
+            'frame_number': records["frame_number"].copy(),
+            'rigid_body_id': records["rigid_body_id"].copy(),
+            'position': pos,
+            'rotation': quat,
+            'north': north,
+            'east': east,
+            'down': down,
+            'yaw_deg': yaw_deg,
+            'has_fields': has_fields,
+            'lat': numpy.where(has_fields, records["lat_e7"] / FixedPoint.LAT_LON_SCALE, numpy.nan),
+            'lon': numpy.where(has_fields, records["lon_e7"] / FixedPoint.LAT_LON_SCALE, numpy.nan),
+            'alt': numpy.where(has_fields, records["alt_mm"] / FixedPoint.ALT_SCALE, numpy.nan),
+            'yaw_cdeg': records["yaw_cdeg"].astype(numpy.int64),
+        }
+
+    # 剛体 k の直近 seconds 秒分の NED 速度 (v_north, v_east, v_down) [m/s]。2レコード未満・時刻が同じ場合は None
+    def get_velocity(self, rigid_body_id, seconds=0.1, now_ns=None):
+        if now_ns is None:
+            now_ns = time.time_ns()
+        records = self.__select(rigid_body_id, now_ns - int(seconds * 1e9))
+        return self.__get_velocity(records)
+
+    # 直近 seconds 秒に記録された全剛体の {剛体ID: NED 速度 or None}
+    def get_velocities(self, seconds=0.1, now_ns=None):
+        if now_ns is None:
+            now_ns = time.time_ns()
+        records = self.__select(None, now_ns - int(seconds * 1e9))
+        ids = records["rigid_body_id"]
+        return { int(rigid_body_id): self.__get_velocity(records[ids == rigid_body_id]) for rigid_body_id in numpy.unique(ids) }
+
+    # 位置の時間に対する最小二乗の傾き
+    def __get_velocity(self, records):
+        if len(records) < 2:
+            return None
+        t = ( records["time_ns"] - records["time_ns"][0] ) * 1e-9
+        t = t - t.mean()
+        denominator = float(numpy.dot(t, t))
+        if denominator <= 0.0:
+            return None
+        north, east, down = self.transform.position(records["pos"].astype(numpy.float64).T)
+        return tuple(float(numpy.dot(t, value - value.mean()) / denominator) for value in ( north, east, down ))
+
+    def get_as_string(self):
+        return "FrameHistory - Capacity %d, Records %d (%d bytes)"%(self.capacity, self.__write_index, len(self.__buffer))
+
+
+# ---- テスト ----
+
+# 剛体毎に一定速度で動くレコードを frame_count フレーム分書き込み、(期待する速度, 最後の時刻) を返す
+def fill_history(history, body_count, frame_count, frame_period_ns, start_ns, rng):
+    velocities = {}
+    for rigid_body_id in range(1, body_count + 1):
+        velocities[rigid_body_id] = ( rng.uniform(-2, 2), rng.uniform(-1, 1), rng.uniform(-2, 2) )
+    time_ns = start_ns
+    for frame_number in range(frame_count):
+        time_ns = start_ns + frame_number * frame_period_ns
+        t = frame_number * frame_period_ns * 1e-9
+        for rigid_body_id, velocity in velocities.items():
+            pos = tuple(rigid_body_id + v * t for v in velocity)
+            fields = ( 360757800 + frame_number, 1362132900, rigid_body_id, frame_number % 36000 ) if rigid_body_id % 2 else None
+            history.append(time_ns, frame_number, rigid_body_id, pos, ( 0.0, 0.0, 0.0, 1.0 ), fields)
+    return velocities, time_ns
+
+
+def test_history(run_test=True):
+    test_name = "FrameHistory"
+    if not run_test:
+        print("[SKIP] %s"%test_name)
+        return K_SKIP
+    if numpy is None:
+        print("[SKIP] %s: NumPy is not installed"%test_name)
+        return K_SKIP
+    rng = random.Random(22)
+    capacity = 1000
+    body_count = 4
+    frame_count = 600
+    period_ns = 10000000                        # 100 Hz
+    history = FrameHistory(capacity)
+    velocities, last_ns = fill_history(history, body_count, frame_count, period_ns, 1717084800000000000, rng)
+    ok = history.get_count() == capacity - 1
+
+    # 読み出せるのは最後の 999 レコード（書き込み位置の1つを除く）。最も古いのは剛体1のため剛体1は 249 フレーム分
+    columns = history.get_last(1, 10.0, last_ns)
+    ok &= len(columns['time_ns']) == capacity // body_count - 1
+    ok &= bool(numpy.all(numpy.diff(columns['frame_number']) == 1)) and int(columns['frame_number'][-1]) == frame_count - 1
+
+    # 直近 0.5 秒 = 51 フレーム（両端を含む）
+    columns = history.get_last(2, 0.5, last_ns)
+    ok &= len(columns['time_ns']) == 51 and bool(numpy.all(columns['rigid_body_id'] == 2))
+    ok &= not bool(columns['has_fields'].any()) and bool(numpy.isnan(columns['lat']).all())
+    columns = history.get_last(3, 0.5, last_ns)
+    ok &= bool(columns['has_fields'].all()) and float(columns['lat'][-1]) == ( 360757800 + frame_count - 1 ) / 1e7
+    # 既定の軸対応: north = x, east = z, down = -y
+    ok &= bool(numpy.array_equal(columns['north'], columns['position'][:, 0]))
+    ok &= bool(numpy.array_equal(columns['down'], -columns['position'][:, 1]))
+
+    latest = history.get_latest(3)
+    ok &= latest['frame_number'] == frame_count - 1 and latest['fields'] == ( 360757800 + frame_count - 1, 1362132900, 3, ( frame_count - 1 ) % 36000 )
+    ok &= history.get_latest(2)['fields'] is None and history.get_latest(99) is None
+
+    # 速度: 位置は float32 で保存するため 1e-3 m/s 以内
+    max_error = 0.0
+    estimated = history.get_velocities(0.2, last_ns)
+    ok &= sorted(estimated) == list(range(1, body_count + 1))
+    for rigid_body_id, velocity in velocities.items():
+        expected = ( velocity[0], velocity[2], -velocity[1] )
+        for value in ( estimated[rigid_body_id], history.get_velocity(rigid_body_id, 0.2, last_ns) ):
+            max_error = max(max_error, max(abs(a - b) for a, b in zip(value, expected)))
+    ok &= max_error < 1e-3
+    ok &= history.get_velocity(1, 0.0, last_ns) is None
+
+    detail = "capacity %d, max velocity error %.2g m/s"%(capacity, max_error)
+    if ok:
+        print("[PASS] %s: %s"%(test_name, detail))
+        return K_PASS
+    print("[FAIL] %s: %s"%(test_name, detail))
+    return K_FAIL
+
+
+# 書き込み中に読み出しても、返すレコードが時刻順で剛体ID・フレーム番号が一貫していること
+def test_concurrent_read(run_test=True, read_count=300):
+    test_name = "FrameHistory read while writing"
+    if not run_test:
+        print("[SKIP] %s"%test_name)
+        return K_SKIP
+    if numpy is None:
+        print("[SKIP] %s: NumPy is not installed"%test_name)
+        return K_SKIP
+    history = FrameHistory(512)
+    finished = threading.Event()
+
+    def write():
+        frame_number = 0
+        while not finished.is_set():
+            # time_ns = フレーム番号、位置 x = フレーム番号（上書き途中のレコードを検出する）
+            history.append(frame_number, frame_number, 1, ( float(frame_number % 1000000), 0.0, 0.0 ), ( 0.0, 0.0, 0.0, 1.0 ))
+            frame_number += 1
+
+    writer = threading.Thread(target=write)
+    writer.start()
+    ok = True
+    for i in range(read_count):
+        columns = history.get_last(1, 1.0, 10**9)
+        frame_numbers = columns['frame_number']
+        ok &= bool(numpy.all(numpy.diff(frame_numbers) == 1))
+        ok &= bool(numpy.array_equal(columns['north'], ( frame_numbers % 1000000 ).astype(numpy.float64)))
+    finished.set()
+    writer.join()
+    if ok:
+        print("[PASS] %s: %d reads"%(test_name, read_count))
+        return K_PASS
+    print("[FAIL] %s"%test_name)
+    return K_FAIL
+
+
+def test_all(run_test=True):
+    totals = [0, 0, 0]
+    for test in ( test_history, test_concurrent_read ):
+        result = test(run_test)
+        totals = [total + value for total, value in zip(totals, result)]
+    print("--------------------")
+    print("[PASS] Count = %3.1d"%totals[0])
+    print("[FAIL] Count = %3.1d"%totals[1])
+    print("[SKIP] Count = %3.1d"%totals[2])
+    return totals
+
+
+if __name__ == "__main__":
+    test_all(True)
@@ -0,0 +1,109 @@
+# NatNet フレームのレコードレイアウト
+#
+# ビットストリームバージョン（major, minor）が確定した時点で一度だけコンパイルし、
+# レコード種別ごとに事前コンパイル済みの struct.Struct と固定ストライドを保持する。
+# デコーダの要素ループは unpack_from を1回呼ぶだけになり、要素毎のバージョン分岐が不要になる。
+#
+# 固定長で全フィールドが揃うのは NatNet 3.x 以降。それより古いバージョン（剛体に
+# マーカー配列が埋め込まれる 2.x など）は該当レコードを None とし、従来の逐次デコードを使う。
+
+import struct
+
+# NumPy はオプション（decoder_mode="numpy" でのみ使用）
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+class FrameLayout:
+    def __init__(self, major=0, minor=0):
+        self.major = major
+        self.minor = minor
+
+        # 4.1以降は各セクションの件数の後にバイト数が付く
+        self.has_size_fields = ((major == 4) and (minor > 0)) or (major > 4)
+
+        # 先頭に件数が付くセクション（このバージョンのフレームに含まれるもの）
+        counted_sections = ["marker_sets", "legacy_markers", "rigid_bodies"]
+        if (major == 2 and minor > 0) or major > 2:
+            counted_sections.append("skeletons")
+        if self.has_size_fields:
+            counted_sections.append("assets")
+        if (major == 2 and minor > 3) or major > 2:
+            counted_sections.append("labeled_markers")
+        if (major == 2 and minor >= 9) or major > 2:
+            counted_sections.append("force_plates")
+        if (major == 2 and minor >= 11) or major > 2:
+            counted_sections.append("devices")
+        self.counted_sections = frozenset(counted_sections)
+
+        # Rigid body: id, pos(3), rot(4), mean error, params
+        self.rigid_body = None
+        if major >= 3:
+            self.rigid_body = struct.Struct('<i3f4ffh')
+
+        # Labeled marker: id, pos(3), size, params, residual
+        self.labeled_marker = None
+        if major >= 3:
+            self.labeled_marker = struct.Struct('<i3ffhf')
+
+        # 上記と同じバイト配置の NumPy 構造化 dtype（numpy.frombuffer 用）
+        self.rigid_body_dtype = None
+        self.labeled_marker_dtype = None
+        if np is not None and major >= 3:
+            self.rigid_body_dtype = np.dtype([('id', '<i4'), ('pos', '<f4', (3,)), ('rot', '<f4', (4,)),
+                                              ('error', '<f4'), ('param', '<i2')])
+            self.labeled_marker_dtype = np.dtype([('id', '<i4'), ('pos', '<f4', (3,)), ('size', '<f4'),
+                                                  ('param', '<i2'), ('residual', '<f4')])
+
+        # Frame suffix: timecode, timecode_sub の後ろは timestamp 以降がある場合のみ
+        self.timecode = struct.Struct('<ii')
+        suffix_format = '<ii'
+        suffix_fields = ['timecode', 'timecode_sub']
+        if (major == 2 and minor >= 7) or (major > 2):
+            suffix_format += 'd'
+        else:
+            suffix_format += 'f'
+        suffix_fields.append('timestamp')
+        if major >= 3:
+            suffix_format += 'qqq'
+            suffix_fields += ['stamp_camera_mid_exposure', 'stamp_data_received', 'stamp_transmit']
+        if major >= 4:
+            suffix_format += 'ii'
+            suffix_fields += ['prec_timestamp_secs', 'prec_timestamp_frac_secs']
+        suffix_format += 'h'
+        suffix_fields.append('param')
+        self.frame_suffix = struct.Struct(suffix_format)
+        self.frame_suffix_fields = tuple(suffix_fields)
+
+    def get_rigid_body_stride(self):
+        if self.rigid_body is None:
+            return -1
+        return self.rigid_body.size
+
+    def get_labeled_marker_stride(self):
+        if self.labeled_marker is None:
+            return -1
+        return self.labeled_marker.size
+
+    def get_as_string(self):
+        out_str = "Frame Layout NatNet %d.%d\n"%(self.major, self.minor)
+        if self.rigid_body is not None:
+            out_str += "  Rigid Body     : %-12s stride %3.1d\n"%(self.rigid_body.format, self.rigid_body.size)
+        if self.labeled_marker is not None:
+            out_str += "  Labeled Marker : %-12s stride %3.1d\n"%(self.labeled_marker.format, self.labeled_marker.size)
+        out_str += "  Frame Suffix   : %-12s stride %3.1d\n"%(self.frame_suffix.format, self.frame_suffix.size)
+        return out_str
+
+
+# バージョン毎にコンパイル済みレイアウトを再利用する
+_layout_cache = {}
+
+def compile_frame_layout(major, minor):
+    key = (major, minor)
+    layout = _layout_cache.get(key)
+    if layout is None:
+        layout = FrameLayout(major, minor)
+        _layout_cache[key] = layout
+    return layout
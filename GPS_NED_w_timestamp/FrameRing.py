@@ -0,0 +1,243 @@
+# 受信とデコードを分離するための有界バッファ
+#
+# FrameRing : 受信スレッド（1つ）→ デコードワーカー（1つ）の SPSC リング。
+#             事前確保した bytearray のプールに recv_into で直接受信し、バッファ番号だけを受け渡す。
+# ReceiveBufferPool : 受信からデコードまで同じスレッドで行うループ用の受信バッファプール。
+#
+# FrameRing は満杯時の動作を overflow_policy で選択し、破棄した件数を数える。
+#   "drop_oldest" : 最も古い未処理要素を捨てて新しい要素を入れる（最新データ優先、デフォルト）
+#   "drop_newest" : 新しい要素を捨てる（受信済みデータを優先）
+# 生産者は決してブロックしない。
+
+import collections
+import threading
+import time
+
+OVERFLOW_POLICIES = ( "drop_oldest", "drop_newest" )
+
+
+class FrameRing:
+    def __init__(self, capacity=64, slot_size=64*1024, overflow_policy="drop_oldest"):
+        if overflow_policy not in OVERFLOW_POLICIES:
+            raise ValueError("unknown overflow policy: %s"%overflow_policy)
+        self.capacity = capacity
+        self.slot_size = slot_size
+        self.overflow_policy = overflow_policy
+
+        # capacity 個のキュー分 + 受信中 1 + デコード中 1
+        self.__slots = [bytearray(slot_size) for i in range(capacity + 2)]
+        self.__free = collections.deque(range(1, capacity + 2))
+        self.__queue = collections.deque()      # (slot index, length, receive time)
+        self.__write_index = 0                  # 受信スレッドが書き込み中のスロット
+        self.__read_index = None                # デコードワーカーが処理中のスロット
+        self.__cond = threading.Condition()
+        self.__closed = False
+
+        self.published_count = 0
+        self.dropped_oldest_count = 0
+        self.dropped_newest_count = 0
+        self.high_water = 0
+
+    # ---- 受信スレッド側 ----
+
+    def get_write_buffer(self):
+        return self.__slots[self.__write_index]
+
+    # get_write_buffer() に受信した length バイトをデコードワーカーへ渡す
+    # receive_time_ns は受信時刻（time.perf_counter_ns()）。そのまま get() で返す
+    def publish(self, length, receive_time_ns=None):
+        with self.__cond:
+            self.published_count += 1
+            if len(self.__queue) >= self.capacity:
+                if self.overflow_policy == "drop_newest":
+                    # 受信したバッファをそのまま次の受信に再利用
+                    self.dropped_newest_count += 1
+                    return False
+                # 最古のバッファを捨て、それを次の受信に使う
+                oldest_index, oldest_length, oldest_time_ns = self.__queue.popleft()
+                self.__queue.append((self.__write_index, length, receive_time_ns))
+                self.__write_index = oldest_index
+                self.dropped_oldest_count += 1
+            else:
+                self.__queue.append((self.__write_index, length, receive_time_ns))
+                self.__write_index = self.__free.popleft()
+                if len(self.__queue) > self.high_water:
+                    self.high_water = len(self.__queue)
+            self.__cond.notify()
+        return True
+
+    # data を書き込み中のスロットへコピーして publish する（一括受信など、別バッファで受信した場合）
+    def publish_copy(self, data, receive_time_ns=None):
+        length = len(data)
+        self.__slots[self.__write_index][:length] = data
+        return self.publish(length, receive_time_ns)
+
+    # ---- デコードワーカー側 ----
+
+    # 次の受信データを (memoryview, 受信時刻) で返す。前回返したバッファはここで解放される。
+    # timeout 経過または close() 後に空になった場合は None
+    def get(self, timeout=None):
+        with self.__cond:
+            self.__release()
+            if not self.__queue and not self.__closed:
+                self.__cond.wait(timeout)
+            if not self.__queue:
+                return None
+            self.__read_index, length, receive_time_ns = self.__queue.popleft()
+        return memoryview(self.__slots[self.__read_index])[:length], receive_time_ns
+
+    def release(self):
+        with self.__cond:
+            self.__release()
+
+    def __release(self):
+        if self.__read_index is not None:
+            self.__free.append(self.__read_index)
+            self.__read_index = None
+
+    def close(self):
+        with self.__cond:
+            self.__closed = True
+            self.__cond.notify_all()
+
+    def get_queued_count(self):
+        return len(self.__queue)
+
+    def get_dropped_count(self):
+        return self.dropped_oldest_count + self.dropped_newest_count
+
+    def get_as_string(self):
+        return "Ring - Received: %d, Dropped(oldest): %d, Dropped(newest): %d, Max queued: %d/%d"%(
+            self.published_count, self.dropped_oldest_count, self.dropped_newest_count,
+            self.high_water, self.capacity)
+
+
+class ReceiveBufferPool:
+    def __init__(self, count=4, size=64*1024):
+        self.__views = [memoryview(bytearray(size)) for i in range(count)]
+        self.__index = 0
+
+    # 受信のたびに次のバッファを循環して返す（recvfrom_into 用の memoryview）
+    def get_next_buffer(self):
+        view = self.__views[self.__index]
+        self.__index = (self.__index + 1) % len(self.__views)
+        return view
+
+
+# ---- テスト ----
+
+K_SKIP = [0, 0, 1]
+K_FAIL = [0, 1, 0]
+K_PASS = [1, 0, 0]
+
+
+def get_all(ring):
+    items = []
+    while True:
+        item = ring.get(0)
+        if item is None:
+            return items
+        view, receive_time_ns = item
+        items.append(( bytes(view), receive_time_ns ))
+
+
+# 満杯の状態で publish したとき、overflow_policy に従って古い/新しい要素を捨て、件数を数えること
+def test_overflow(overflow_policy, run_test=True, capacity=4, count=10):
+    test_name = "FrameRing %s"%overflow_policy
+    if not run_test:
+        print("[SKIP] %s"%test_name)
+        return K_SKIP
+    ring = FrameRing(capacity, 64, overflow_policy)
+    results = [ring.publish_copy(b"frame %d"%i, i) for i in range(count)]
+    items = get_all(ring)
+    if overflow_policy == "drop_oldest":
+        kept = range(count - capacity, count)
+        ok = all(results) and ring.dropped_oldest_count == count - capacity and ring.dropped_newest_count == 0
+    else:
+        kept = range(capacity)
+        ok = results == [True] * capacity + [False] * ( count - capacity )
+        ok &= ring.dropped_newest_count == count - capacity and ring.dropped_oldest_count == 0
+    ok &= items == [( b"frame %d"%i, i ) for i in kept]
+    ok &= ring.published_count == count and ring.high_water == capacity and ring.get_dropped_count() == count - capacity
+    if ok:
+        print("[PASS] %s: %s"%(test_name, ring.get_as_string()))
+        return K_PASS
+    print("[FAIL] %s: %s, received %r"%(test_name, ring.get_as_string(), [item[0] for item in items]))
+    return K_FAIL
+
+
+# 取り出し中のバッファは次の get() まで上書きされず、解放されたスロットが再利用されること
+def test_slot_reuse(run_test=True, capacity=2, count=100):
+    test_name = "FrameRing slot reuse"
+    if not run_test:
+        print("[SKIP] %s"%test_name)
+        return K_SKIP
+    ring = FrameRing(capacity, 64)
+    slot_ids = set()
+    ok = True
+    for i in range(count):
+        ring.publish_copy(b"frame %d"%i)
+        view, receive_time_ns = ring.get(0)
+        slot_ids.add(id(view.obj))
+        # デコード中に満杯になるまで受信しても、取り出したバッファは変わらない
+        for j in range(capacity + 2):
+            ring.publish_copy(b"later %d"%j)
+        ok &= bytes(view) == b"frame %d"%i
+        get_all(ring)
+    ok &= len(slot_ids) <= capacity + 2 and ring.get_queued_count() == 0
+    if ok:
+        print("[PASS] %s: %d frames in %d slots"%(test_name, count, len(slot_ids)))
+        return K_PASS
+    print("[FAIL] %s: %d slots"%(test_name, len(slot_ids)))
+    return K_FAIL
+
+
+# close() で get() の待ちが解除され、残っている要素を取り出した後は None になること
+def test_close(run_test=True):
+    test_name = "FrameRing close unblocks get"
+    if not run_test:
+        print("[SKIP] %s"%test_name)
+        return K_SKIP
+    ring = FrameRing(4, 64)
+    results = []
+
+    def wait():
+        start_ns = time.perf_counter_ns()
+        results.append(ring.get(10.0))
+        results.append(time.perf_counter_ns() - start_ns)
+
+    waiter = threading.Thread(target=wait)
+    waiter.start()
+    time.sleep(0.05)
+    ring.close()
+    waiter.join(5.0)
+    ok = not waiter.is_alive() and results[0] is None and results[1] < 5 * 1000 * 1000 * 1000
+
+    ring = FrameRing(4, 64)
+    ring.publish_copy(b"last")
+    ring.close()
+    ok &= get_all(ring) == [( b"last", None )] and ring.get(10.0) is None
+    if ok:
+        print("[PASS] %s: unblocked after %.3f s"%(test_name, results[1] / 1e9))
+        return K_PASS
+    print("[FAIL] %s"%test_name)
+    return K_FAIL
+
+
+def test_all(run_test=True):
+    totals = [0, 0, 0]
+    for overflow_policy in OVERFLOW_POLICIES:
+        result = test_overflow(overflow_policy, run_test)
+        totals = [total + value for total, value in zip(totals, result)]
+    for test in ( test_slot_reuse, test_close ):
+        result = test(run_test)
+        totals = [total + value for total, value in zip(totals, result)]
+    print("--------------------")
+    print("[PASS] Count = %3.1d"%totals[0])
+    print("[FAIL] Count = %3.1d"%totals[1])
+    print("[SKIP] Count = %3.1d"%totals[2])
+    return totals
+
+
+if __name__ == "__main__":
+    test_all(True)
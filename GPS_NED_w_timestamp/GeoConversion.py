@@ -0,0 +1,312 @@
+# NED → GPS（緯度・経度・高度）変換
+#
+# NedToLla : 基準点（ref_lat / ref_lon / ref_alt）の WGS84 ECEF 座標と NED → ECEF の回転を初期化時に一度だけ計算し、
+#            NED 座標 [m] を緯度・経度 [deg]・高度 [m] に変換する。pyned2lla.ned2lla と同じ厳密な楕円体計算。
+#   convert          : 1点。pyned2lla があれば convert_pyned2lla、無ければ convert_python
+#   convert_pyned2lla: pyned2lla.ned2lla（Rust 実装）に基準点のラジアン値を渡すだけ。1点ならこれが最速
+#   convert_python   : 純 Python（math のみ）
+#   convert_array    : NumPy 配列で1フレーム分をまとめて変換。呼び出しのオーバーヘッドが大きいため、
+#                      剛体数が batch_min_count 以上の場合のみ速い（python Benchmark.py geo）
+#
+# ECEF → 緯度経度は Bowring の式（反復なし）。地表付近（高度 ±10 km）での誤差は 1e-9 m 程度。
+#
+# LinearNedToLla : 基準点の接平面で線形化した変換（gps_conversion = "linear"）。基準点の子午線・卯酉線の
+#                  1度あたりの長さを事前計算し、緯度 = 基準緯度 + 北 / (m/deg) のように積和だけで変換する。
+#                  基準点から radius_m を超える点（水平距離または高さ）は NedToLla の厳密な変換を使う。
+#                  get_max_error() で半径内の最大誤差 [m] を求める。
+#
+# test_all() : pyned2lla（インストールされている場合）との比較。緯度・経度 1e-7 度、高度 1 mm 以内で PASS
+#              線形化は半径内の最大誤差が送信分解能（緯度・経度 1e-7 度、高度 1 mm）未満であることを確認する
+
+import math
+
+# NumPy はオプション（convert_array でのみ使用）
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+try:
+    import pyned2lla
+except ImportError:
+    pyned2lla = None
+
+# WGS84 楕円体
+WGS84_A = 6378137.0
+WGS84_F = 1.0 / 298.257223563
+
+D2R = math.pi / 180.0
+R2D = 180.0 / math.pi
+
+# convert_array が剛体毎の convert より速くなる剛体数の目安
+BATCH_MIN_COUNT = 64
+LINEAR_BATCH_MIN_COUNT = 32
+
+K_SKIP = [0, 0, 1]
+K_FAIL = [0, 1, 0]
+K_PASS = [1, 0, 0]
+
+
+class NedToLla:
+    batch_min_count = BATCH_MIN_COUNT
+
+    def __init__(self, ref_lat_deg, ref_lon_deg, ref_alt_m, use_pyned2lla=True):
+        self.ref_lat_deg = ref_lat_deg
+        self.ref_lon_deg = ref_lon_deg
+        self.ref_alt_m = ref_alt_m
+        a = WGS84_A
+        f = WGS84_F
+
+        self.a = a
+        self.b = a * ( 1.0 - f )
+        self.e2 = f * ( 2.0 - f )                   # 第一離心率の2乗
+        self.ep2 = self.e2 / ( 1.0 - self.e2 )      # 第二離心率の2乗
+
+        lat0 = math.radians(ref_lat_deg)
+        lon0 = math.radians(ref_lon_deg)
+        sin_lat0, cos_lat0 = math.sin(lat0), math.cos(lat0)
+        sin_lon0, cos_lon0 = math.sin(lon0), math.cos(lon0)
+
+        # 基準点の ECEF 座標
+        n0 = a / math.sqrt(1.0 - self.e2 * sin_lat0 * sin_lat0)
+        self.x0 = ( n0 + ref_alt_m ) * cos_lat0 * cos_lon0
+        self.y0 = ( n0 + ref_alt_m ) * cos_lat0 * sin_lon0
+        self.z0 = ( n0 * ( 1.0 - self.e2 ) + ref_alt_m ) * sin_lat0
+
+        # NED → ECEF の回転行列（行: ECEF x, y, z / 列: 北, 東, 下）
+        self.rotation = (
+            ( -sin_lat0 * cos_lon0, -sin_lon0, -cos_lat0 * cos_lon0 ),
+            ( -sin_lat0 * sin_lon0,  cos_lon0, -cos_lat0 * sin_lon0 ),
+            (  cos_lat0,             0.0,      -sin_lat0            ),
+        )
+
+        if use_pyned2lla and pyned2lla is not None:
+            self.__ref_lat_rad = ref_lat_deg * D2R
+            self.__ref_lon_rad = ref_lon_deg * D2R
+            self.__wgs84 = pyned2lla.wgs84()
+            self.convert = self.convert_pyned2lla
+            self.backend = "pyned2lla"
+        else:
+            self.convert = self.convert_python
+            self.backend = "python"
+
+    # NED [m] → (緯度 [deg], 経度 [deg], 高度 [m])
+    def convert_pyned2lla(self, north, east, down):
+        lat_rad, lon_rad, alt = pyned2lla.ned2lla(self.__ref_lat_rad, self.__ref_lon_rad, self.ref_alt_m,
+                                                  north, east, down, self.__wgs84)
+        return lat_rad * R2D, lon_rad * R2D, alt
+
+    def convert_python(self, north, east, down):
+        ( r00, r01, r02 ), ( r10, r11, r12 ), ( r20, r21, r22 ) = self.rotation
+        x = self.x0 + r00 * north + r01 * east + r02 * down
+        y = self.y0 + r10 * north + r11 * east + r12 * down
+        z = self.z0 + r20 * north + r22 * down
+
+        a = self.a
+        b = self.b
+        p = math.sqrt(x * x + y * y)
+        theta = math.atan2(z * a, p * b)
+        sin_theta = math.sin(theta)
+        cos_theta = math.cos(theta)
+        lat = math.atan2(z + self.ep2 * b * sin_theta * sin_theta * sin_theta,
+                         p - self.e2 * a * cos_theta * cos_theta * cos_theta)
+        sin_lat = math.sin(lat)
+        n = a / math.sqrt(1.0 - self.e2 * sin_lat * sin_lat)
+        alt = p / math.cos(lat) - n
+        return lat * R2D, math.atan2(y, x) * R2D, alt
+
+    # north / east / down の配列（同じ長さ）→ (緯度 [deg], 経度 [deg], 高度 [m]) の float64 配列
+    def convert_array(self, north, east, down):
+        if numpy is None:
+            raise RuntimeError("convert_array には NumPy が必要です")
+        north = numpy.asarray(north, dtype=numpy.float64)
+        east = numpy.asarray(east, dtype=numpy.float64)
+        down = numpy.asarray(down, dtype=numpy.float64)
+        ( r00, r01, r02 ), ( r10, r11, r12 ), ( r20, r21, r22 ) = self.rotation
+        x = self.x0 + r00 * north + r01 * east + r02 * down
+        y = self.y0 + r10 * north + r11 * east + r12 * down
+        z = self.z0 + r20 * north + r22 * down
+
+        a = self.a
+        b = self.b
+        p = numpy.hypot(x, y)
+        theta = numpy.arctan2(z * a, p * b)
+        sin_theta = numpy.sin(theta)
+        cos_theta = numpy.cos(theta)
+        lat = numpy.arctan2(z + self.ep2 * b * sin_theta * sin_theta * sin_theta,
+                            p - self.e2 * a * cos_theta * cos_theta * cos_theta)
+        sin_lat = numpy.sin(lat)
+        n = a / numpy.sqrt(1.0 - self.e2 * sin_lat * sin_lat)
+        alt = p / numpy.cos(lat) - n
+        return lat * R2D, numpy.arctan2(y, x) * R2D, alt
+
+
+class LinearNedToLla:
+    batch_min_count = LINEAR_BATCH_MIN_COUNT
+
+    def __init__(self, ref_lat_deg, ref_lon_deg, ref_alt_m, radius_m=50.0, exact=None):
+        self.ref_lat_deg = ref_lat_deg
+        self.ref_lon_deg = ref_lon_deg
+        self.ref_alt_m = ref_alt_m
+        self.radius_m = radius_m
+        # 半径外で使う厳密な変換
+        self.exact = exact if exact is not None else NedToLla(ref_lat_deg, ref_lon_deg, ref_alt_m)
+        self.backend = "linear"
+
+        e2 = WGS84_F * ( 2.0 - WGS84_F )
+        sin_lat0 = math.sin(ref_lat_deg * D2R)
+        w2 = 1.0 - e2 * sin_lat0 * sin_lat0
+        # 子午線曲率半径 M と卯酉線曲率半径 N（基準高度を含む）
+        meridian_radius = WGS84_A * ( 1.0 - e2 ) / ( w2 * math.sqrt(w2) ) + ref_alt_m
+        normal_radius = WGS84_A / math.sqrt(w2) + ref_alt_m
+        self.meters_per_deg_lat = meridian_radius * D2R
+        self.meters_per_deg_lon = normal_radius * math.cos(ref_lat_deg * D2R) * D2R
+        self.deg_lat_per_meter = 1.0 / self.meters_per_deg_lat
+        self.deg_lon_per_meter = 1.0 / self.meters_per_deg_lon
+        self.__radius2 = radius_m * radius_m
+
+    def convert(self, north, east, down):
+        if north * north + east * east > self.__radius2 or abs(down) > self.radius_m:
+            return self.exact.convert(north, east, down)
+        return ( self.ref_lat_deg + north * self.deg_lat_per_meter,
+                 self.ref_lon_deg + east * self.deg_lon_per_meter,
+                 self.ref_alt_m - down )
+
+    def convert_array(self, north, east, down):
+        if numpy is None:
+            raise RuntimeError("convert_array には NumPy が必要です")
+        north = numpy.asarray(north, dtype=numpy.float64)
+        east = numpy.asarray(east, dtype=numpy.float64)
+        down = numpy.asarray(down, dtype=numpy.float64)
+        lats = self.ref_lat_deg + north * self.deg_lat_per_meter
+        lons = self.ref_lon_deg + east * self.deg_lon_per_meter
+        alts = self.ref_alt_m - down
+        outside = ( north * north + east * east > self.__radius2 ) | ( numpy.abs(down) > self.radius_m )
+        if outside.any():
+            lats[outside], lons[outside], alts[outside] = self.exact.convert_array(north[outside], east[outside], down[outside])
+        return lats, lons, alts
+
+    # 半径 radius_m 内（水平 radius_m の円、高さ ±radius_m）の線形化の最大誤差 [m]
+    # (水平誤差, 高度誤差) を返す。誤差は基準点から離れるほど大きいので円周上と中心軸上を調べる
+    def get_max_error(self, angle_count=72, step_count=8):
+        convert_exact = self.exact.convert_python
+        max_horizontal = 0.0
+        max_alt = 0.0
+        radius = self.radius_m
+        downs = [radius * ( 2.0 * i / step_count - 1.0 ) for i in range(step_count + 1)]
+        points = [( 0.0, 0.0, down ) for down in downs]
+        for i in range(angle_count):
+            angle = 2.0 * math.pi * i / angle_count
+            for down in downs:
+                points.append(( radius * math.cos(angle), radius * math.sin(angle), down ))
+        for north, east, down in points:
+            lat, lon, alt = convert_exact(north, east, down)
+            lat_lin = self.ref_lat_deg + north * self.deg_lat_per_meter
+            lon_lin = self.ref_lon_deg + east * self.deg_lon_per_meter
+            alt_lin = self.ref_alt_m - down
+            horizontal = math.hypot(( lat_lin - lat ) * self.meters_per_deg_lat, ( lon_lin - lon ) * self.meters_per_deg_lon)
+            max_horizontal = max(max_horizontal, horizontal)
+            max_alt = max(max_alt, abs(alt_lin - alt))
+        return max_horizontal, max_alt
+
+    def get_as_string(self):
+        max_horizontal, max_alt = self.get_max_error()
+        return "linear within %.1f m (max error horizontal %.2f mm, altitude %.2f mm), exact (%s) outside"%(
+            self.radius_m, max_horizontal * 1000.0, max_alt * 1000.0, self.exact.backend)
+
+
+# 比較に使う NED オフセット [m]（飛行範囲の数十 m から 10 km まで）
+TEST_OFFSETS = ( -10000.0, -1000.0, -50.0, -3.5, 0.0, 0.25, 12.0, 80.0, 2500.0, 10000.0 )
+TEST_DOWNS = ( -1000.0, -30.0, -1.5, 0.0, 2.0, 100.0 )
+TEST_REFERENCES = ( (36.07578, 136.21329, 0.0), (0.0, 0.0, 0.0), (-33.8688, 151.2093, 58.0), (64.1466, -21.9426, -20.0) )
+
+
+def get_test_points():
+    return [( north, east, down ) for north in TEST_OFFSETS for east in TEST_OFFSETS for down in TEST_DOWNS]
+
+
+def test_reference(ref, run_test=True, lat_lon_tolerance_deg=1e-7, alt_tolerance_m=1e-3):
+    test_name = "NedToLla %s"%( ref, )
+    if not run_test:
+        print("[SKIP] %s"%test_name)
+        return K_SKIP
+    if pyned2lla is None:
+        print("[SKIP] %s (pyned2lla not installed)"%test_name)
+        return K_SKIP
+    wgs84 = pyned2lla.wgs84()
+    ref_lat, ref_lon, ref_alt = ref
+    converter = NedToLla(ref_lat, ref_lon, ref_alt, use_pyned2lla=False)
+    points = get_test_points()
+
+    max_lat_lon_error = 0.0
+    max_alt_error = 0.0
+    expected = []
+    for north, east, down in points:
+        lat_rad, lon_rad, alt = pyned2lla.ned2lla(math.radians(ref_lat), math.radians(ref_lon), ref_alt, north, east, down, wgs84)
+        expected.append(( math.degrees(lat_rad), math.degrees(lon_rad), alt ))
+        lat, lon, alt2 = converter.convert_python(north, east, down)
+        max_lat_lon_error = max(max_lat_lon_error, abs(lat - expected[-1][0]), abs(lon - expected[-1][1]))
+        max_alt_error = max(max_alt_error, abs(alt2 - alt))
+
+    if numpy is not None:
+        columns = numpy.array(points).T
+        lats, lons, alts = converter.convert_array(columns[0], columns[1], columns[2])
+        expected_array = numpy.array(expected).T
+        max_lat_lon_error = max(max_lat_lon_error,
+            float(numpy.max(numpy.abs(lats - expected_array[0]))), float(numpy.max(numpy.abs(lons - expected_array[1]))))
+        max_alt_error = max(max_alt_error, float(numpy.max(numpy.abs(alts - expected_array[2]))))
+
+    detail = "max lat/lon error %.3g deg, max alt error %.3g m, %d points"%(max_lat_lon_error, max_alt_error, len(points))
+    if max_lat_lon_error <= lat_lon_tolerance_deg and max_alt_error <= alt_tolerance_m:
+        print("[PASS] %s: %s"%(test_name, detail))
+        return K_PASS
+    print("[FAIL] %s: %s"%(test_name, detail))
+    return K_FAIL
+
+
+# 線形化の半径内の最大誤差が送信分解能（緯度・経度 1e-7 度 ≒ 1 cm、高度 1 mm）未満で、
+# 半径外では厳密な変換と一致すること
+def test_linear(ref, radius_m, run_test=True):
+    test_name = "LinearNedToLla %s radius %g m"%( ref, radius_m )
+    if not run_test:
+        print("[SKIP] %s"%test_name)
+        return K_SKIP
+    ref_lat, ref_lon, ref_alt = ref
+    converter = LinearNedToLla(ref_lat, ref_lon, ref_alt, radius_m, NedToLla(ref_lat, ref_lon, ref_alt, use_pyned2lla=False))
+    max_horizontal, max_alt = converter.get_max_error()
+    horizontal_resolution = 1e-7 * min(converter.meters_per_deg_lat, converter.meters_per_deg_lon)
+    ok = max_horizontal < horizontal_resolution and max_alt < 1e-3
+
+    outside = ( radius_m * 1.5, -radius_m, 1.0 )
+    ok &= converter.convert(*outside) == converter.exact.convert(*outside)
+    if numpy is not None:
+        points = numpy.array([( 1.0, 2.0, -3.0 ), outside])
+        lats, lons, alts = converter.convert_array(points[:, 0], points[:, 1], points[:, 2])
+        ok &= ( lats[0], lons[0], alts[0] ) == converter.convert(1.0, 2.0, -3.0)
+        ok &= abs(lats[1] - converter.exact.convert(*outside)[0]) < 1e-12
+
+    detail = "max error horizontal %.3g m (resolution %.3g m), altitude %.3g m"%(max_horizontal, horizontal_resolution, max_alt)
+    if ok:
+        print("[PASS] %s: %s"%(test_name, detail))
+        return K_PASS
+    print("[FAIL] %s: %s"%(test_name, detail))
+    return K_FAIL
+
+
+def test_all(run_test=True):
+    totals = [0, 0, 0]
+    for ref in TEST_REFERENCES:
+        result = test_reference(ref, run_test)
+        totals = [total + value for total, value in zip(totals, result)]
+    for ref in TEST_REFERENCES:
+        result = test_linear(ref, 30.0, run_test)
+        totals = [total + value for total, value in zip(totals, result)]
+    print("--------------------")
+    print("[PASS] Count = %3.1d"%totals[0])
+    print("[FAIL] Count = %3.1d"%totals[1])
+    print("[SKIP] Count = %3.1d"%totals[2])
+    return totals
+
+
+if __name__ == "__main__":
+    test_all(True)
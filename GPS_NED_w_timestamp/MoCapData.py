@@ -114,7 +114,11 @@ def get_as_string(input_str):
 
 
 #MoCap Frame Classes
+# Hundreds of these objects are created per frame, so every class declares
+# __slots__ (no per-instance __dict__). Attributes must be listed there.
 class FramePrefixData:
+    __slots__ = ('frame_number',)
+
     def __init__(self, frame_number):
         self.frame_number=frame_number
 
@@ -124,6 +128,8 @@ class FramePrefixData:
         return out_str
 
 class MarkerData:
+    __slots__ = ('model_name', 'marker_pos_list')
+
     def __init__(self):
         self.model_name=""
         self.marker_pos_list=[]
@@ -155,6 +161,8 @@ class MarkerData:
         return out_str
 
 class MarkerSetData:
+    __slots__ = ('marker_data_list', 'unlabeled_markers')
+
     def __init__(self):
         self.marker_data_list=[]
         self.unlabeled_markers=MarkerData()
@@ -191,6 +199,8 @@ class MarkerSetData:
         return out_str
 
 class LegacyMarkerData:
+    __slots__ = ('marker_pos_list',)
+
     def __init__(self):
         self.marker_pos_list=[]
 
@@ -213,6 +223,8 @@ class LegacyMarkerData:
         return out_str
 
 class RigidBodyMarker:
+    __slots__ = ('pos', 'id_num', 'size', 'error', 'marker_num')
+
     def __init__(self):
         self.pos = [0.0,0.0,0.0]
         self.id_num = 0
@@ -235,6 +247,8 @@ class RigidBodyMarker:
 
 
 class RigidBody:
+    __slots__ = ('id_num', 'pos', 'rot', 'rb_marker_list', 'tracking_valid', 'error', 'marker_num')
+
     def __init__(self, new_id, pos, rot):
         self.id_num = new_id
         self.pos=pos
@@ -288,6 +302,8 @@ class RigidBody:
 
 
 class RigidBodyData:
+    __slots__ = ('rigid_body_list',)
+
     def __init__(self):
         self.rigid_body_list=[]
 
@@ -314,7 +330,38 @@ class RigidBodyData:
         return out_str
 
 
+# Columnar rigid body data (decoder_mode="numpy")
+# records is a NumPy structured array with fields id, pos[3], rot[4], error, param.
+class RigidBodyArrays:
+    __slots__ = ('records', 'id', 'pos', 'rot', 'error', 'tracking_valid')
+
+    def __init__(self, records):
+        self.records = records
+        self.id = records['id']
+        self.pos = records['pos']
+        self.rot = records['rot']
+        self.error = records['error']
+        self.tracking_valid = ( records['param'] & 0x01 ) != 0
+
+    def get_rigid_body_count(self):
+        return len(self.records)
+
+    def to_rigid_body_data(self):
+        rigid_body_data = RigidBodyData()
+        for i in range(len(self.records)):
+            rigid_body = RigidBody(int(self.id[i]), tuple(self.pos[i].tolist()), tuple(self.rot[i].tolist()))
+            rigid_body.error = float(self.error[i])
+            rigid_body.tracking_valid = bool(self.tracking_valid[i])
+            rigid_body_data.rigid_body_list.append(rigid_body)
+        return rigid_body_data
+
+    def get_as_string(self, tab_str="  ", level=0):
+        return self.to_rigid_body_data().get_as_string(tab_str, level)
+
+
 class Skeleton:
+    __slots__ = ('id_num', 'rigid_body_list')
+
     def __init__(self, new_id=0):
         self.id_num=new_id
         self.rigid_body_list=[]
@@ -339,6 +386,8 @@ class Skeleton:
 
 
 class SkeletonData:
+    __slots__ = ('skeleton_list',)
+
     def __init__(self):
         self.skeleton_list=[]
 
@@ -364,6 +413,8 @@ class SkeletonData:
         return out_str
 
 class AssetMarkerData:
+    __slots__ = ('marker_id', 'pos', 'marker_size', 'marker_params', 'residual', 'marker_num')
+
     def __init__(self, marker_id, pos, marker_size=0.0, marker_params=0, residual=0.0, marker_num=-1):
         self.marker_id=marker_id
         self.pos=pos
@@ -399,6 +450,8 @@ class AssetMarkerData:
         return out_str
 
 class AssetRigidBodyData:
+    __slots__ = ('id_num', 'pos', 'rot', 'mean_error', 'param', 'rb_num')
+
     def __init__(self, new_id, pos, rot, mean_error=0.0, param=0):
         self.id_num=new_id
         self.pos = pos
@@ -423,6 +476,8 @@ class AssetRigidBodyData:
         return out_str
 
 class Asset:
+    __slots__ = ('asset_id', 'rigid_body_list', 'marker_list')
+
     def __init__(self):
         self.asset_id=0
         self.rigid_body_list=[]
@@ -470,6 +525,8 @@ class Asset:
 
 
 class AssetData:
+    __slots__ = ('asset_list',)
+
     def __init__(self):
         self.asset_list=[]
 
@@ -494,6 +551,8 @@ class AssetData:
 
 
 class LabeledMarker:
+    __slots__ = ('id_num', 'pos', 'size', 'param', 'residual', 'marker_num')
+
     def __init__(self, new_id, pos, size=0.0, param = 0, residual=0.0):
         self.id_num=new_id
         self.pos = pos
@@ -537,6 +596,8 @@ class LabeledMarker:
 
 
 class LabeledMarkerData:
+    __slots__ = ('labeled_marker_list',)
+
     def __init__(self):
         self.labeled_marker_list=[]
 
@@ -560,7 +621,39 @@ class LabeledMarkerData:
             out_str += labeled_marker.get_as_string(tab_str, level+2)
         return out_str
 
+# Columnar labeled marker data (decoder_mode="numpy")
+# records is a NumPy structured array with fields id, pos[3], size, param, residual.
+# residual is converted to the same scale as LabeledMarker.residual (x1000).
+class LabeledMarkerArrays:
+    __slots__ = ('records', 'id', 'model_id', 'marker_id', 'pos', 'size', 'param', 'residual')
+
+    def __init__(self, records):
+        self.records = records
+        self.id = records['id']
+        self.model_id = self.id >> 16
+        self.marker_id = self.id & 0x0000ffff
+        self.pos = records['pos']
+        self.size = records['size']
+        self.param = records['param']
+        self.residual = records['residual'].astype('f8') * 1000.0
+
+    def get_labeled_marker_count(self):
+        return len(self.records)
+
+    def to_labeled_marker_data(self):
+        labeled_marker_data = LabeledMarkerData()
+        for i in range(len(self.records)):
+            labeled_marker = LabeledMarker(int(self.id[i]), tuple(self.pos[i].tolist()), float(self.size[i]),
+                                           int(self.param[i]), float(self.residual[i]))
+            labeled_marker_data.labeled_marker_list.append(labeled_marker)
+        return labeled_marker_data
+
+    def get_as_string(self, tab_str = "  ", level = 0):
+        return self.to_labeled_marker_data().get_as_string(tab_str, level)
+
 class ForcePlateChannelData:
+    __slots__ = ('frame_list',)
+
     def __init__(self):
         # list of floats
         self.frame_list=[]
@@ -590,6 +683,8 @@ class ForcePlateChannelData:
         return out_str
 
 class ForcePlate:
+    __slots__ = ('id_num', 'channel_data_list')
+
     def __init__(self, new_id=0):
         self.id_num = new_id
         self.channel_data_list=[]
@@ -610,6 +705,8 @@ class ForcePlate:
         return out_str
 
 class ForcePlateData:
+    __slots__ = ('force_plate_list',)
+
     def __init__(self):
         self.force_plate_list=[]
 
@@ -636,6 +733,8 @@ class ForcePlateData:
         return out_str
 
 class DeviceChannelData:
+    __slots__ = ('frame_list',)
+
     def __init__(self):
         # list of floats
         self.frame_list=[]
@@ -666,6 +765,8 @@ class DeviceChannelData:
 
 
 class Device:
+    __slots__ = ('id_num', 'channel_data_list')
+
     def __init__(self, new_id):
         self.id_num=new_id
         self.channel_data_list = []
@@ -688,6 +789,8 @@ class Device:
 
 
 class DeviceData:
+    __slots__ = ('device_list',)
+
     def __init__(self):
         self.device_list=[]
 
@@ -712,6 +815,11 @@ class DeviceData:
         return out_str
 
 class FrameSuffixData:
+    __slots__ = ('timecode', 'timecode_sub', 'timestamp',
+                 'stamp_camera_mid_exposure', 'stamp_data_received', 'stamp_transmit',
+                 'prec_timestamp_secs', 'prec_timestamp_frac_secs',
+                 'param', 'is_recording', 'tracked_models_changed')
+
     def __init__(self):
         self.timecode=-1
         self.timecode_sub=-1
@@ -751,6 +859,9 @@ class FrameSuffixData:
         return out_str
 
 class MoCapData:
+    __slots__ = ('prefix_data', 'marker_set_data', 'legacy_other_markers', 'rigid_body_data', 'asset_data',
+                 'skeleton_data', 'labeled_marker_data', 'force_plate_data', 'device_data', 'suffix_data')
+
     def __init__(self):
         #Packet Parts
         self.prefix_data = None
@@ -848,6 +959,162 @@ class MoCapData:
 
         return out_str
 
+# Frame section name (NatNetClient.FRAME_SECTIONS) -> MoCapData attribute
+FRAME_SECTION_ATTRIBUTES = {
+    "marker_sets" : "marker_set_data",
+    "legacy_markers" : "legacy_other_markers",
+    "rigid_bodies" : "rigid_body_data",
+    "skeletons" : "skeleton_data",
+    "assets" : "asset_data",
+    "labeled_markers" : "labeled_marker_data",
+    "force_plates" : "force_plate_data",
+    "devices" : "device_data",
+    "suffix" : "suffix_data",
+}
+
+# Property that decodes the section on first read and caches it on the view
+def lazy_section(section_name):
+    def get_section(self):
+        sections = self.sections
+        if section_name in sections:
+            return sections[section_name]
+        offset = self.section_offsets.get(section_name)
+        section_data = None
+        if offset is not None:
+            section_data = self.decode_section(section_name, self.data, offset, self.decode_state)
+        sections[section_name] = section_data
+        return section_data
+
+    def set_section(self, section_data):
+        self.sections[section_name] = section_data
+
+    return property(get_section, set_section)
+
+# Lazily decoded frame (NatNetClient lazy_frames)
+# data is a copy of the received packet and section_offsets maps a section name to its
+# absolute offset in data. A section is decoded by decode_section(section_name, data, offset, decode_state)
+# the first time its attribute is read, then cached. decode_state is whatever the decoder needs to
+# decode this frame later (NatNetClient keeps the layout, decoder mode and subscription of the scan). Sections missing from section_offsets
+# read as None, like sections skipped by decode_sections.
+# section_counts holds the element count at the head of each section, readable without decoding.
+# Two threads reading the same section for the first time may both decode it; either result is kept.
+class MoCapDataView(MoCapData):
+    __slots__ = ('data', 'section_offsets', 'section_counts', 'decode_section', 'decode_state', 'sections')
+
+    # MoCapData.__init__ is not called: the section attributes are the properties below
+    def __init__(self, data, prefix_data, section_offsets, section_counts, decode_section, decode_state=None):
+        self.data = data
+        self.section_offsets = section_offsets
+        self.section_counts = section_counts
+        self.decode_section = decode_section
+        self.decode_state = decode_state
+        self.sections = {}
+        self.prefix_data = prefix_data
+
+    marker_set_data = lazy_section("marker_sets")
+    legacy_other_markers = lazy_section("legacy_markers")
+    rigid_body_data = lazy_section("rigid_bodies")
+    skeleton_data = lazy_section("skeletons")
+    asset_data = lazy_section("assets")
+    labeled_marker_data = lazy_section("labeled_markers")
+    force_plate_data = lazy_section("force_plates")
+    device_data = lazy_section("devices")
+    suffix_data = lazy_section("suffix")
+
+    def get_count(self, section_name):
+        return self.section_counts.get(section_name, 0)
+
+    def is_decoded(self, section_name):
+        return section_name in self.sections
+
+# Fields of FrameSummary (the keys of the former new_frame_listener dict)
+FRAME_SUMMARY_FIELDS = ('frame_number', 'marker_set_count', 'unlabeled_markers_count', 'rigid_body_count',
+                        'skeleton_count', 'asset_count', 'labeled_marker_count',
+                        'timecode', 'timecode_sub', 'timestamp', 'is_recording', 'tracked_models_changed')
+
+# Per-frame summary handed to NatNetClient.new_frame_listener
+# The client refills the same instance every frame, so use copy() to keep a summary after the
+# listener returns. Counts of sections that were not decoded are 0, and the suffix fields are
+# None when the suffix was not decoded. summary["frame_number"] works like the former dict.
+class FrameSummary:
+    __slots__ = FRAME_SUMMARY_FIELDS
+
+    def __init__(self):
+        self.frame_number = -1
+        self.marker_set_count = 0
+        self.unlabeled_markers_count = 0
+        self.rigid_body_count = 0
+        self.skeleton_count = 0
+        self.asset_count = 0
+        self.labeled_marker_count = 0
+        self.timecode = None
+        self.timecode_sub = None
+        self.timestamp = None
+        self.is_recording = None
+        self.tracked_models_changed = None
+
+    def set_from_frame(self, mocap_data, asset_count=0):
+        self.frame_number = mocap_data.prefix_data.frame_number
+        if isinstance(mocap_data, MoCapDataView):
+            # Counts from the section headers, without decoding the sections.
+            # The offset decoders never fill the unlabeled markers.
+            get_count = mocap_data.get_count
+            self.marker_set_count = get_count("marker_sets")
+            self.unlabeled_markers_count = 0
+            self.rigid_body_count = get_count("rigid_bodies")
+            self.skeleton_count = get_count("skeletons")
+            self.labeled_marker_count = get_count("labeled_markers")
+        else:
+            marker_set_data = mocap_data.marker_set_data
+            rigid_body_data = mocap_data.rigid_body_data
+            skeleton_data = mocap_data.skeleton_data
+            labeled_marker_data = mocap_data.labeled_marker_data
+            self.marker_set_count = marker_set_data.get_marker_set_count() if marker_set_data is not None else 0
+            self.unlabeled_markers_count = marker_set_data.get_unlabeled_marker_count() if marker_set_data is not None else 0
+            self.rigid_body_count = rigid_body_data.get_rigid_body_count() if rigid_body_data is not None else 0
+            self.skeleton_count = skeleton_data.get_skeleton_count() if skeleton_data is not None else 0
+            self.labeled_marker_count = labeled_marker_data.get_labeled_marker_count() if labeled_marker_data is not None else 0
+        self.asset_count = asset_count
+
+        suffix_data = mocap_data.suffix_data
+        if suffix_data is not None:
+            self.timecode = suffix_data.timecode
+            self.timecode_sub = suffix_data.timecode_sub
+            self.timestamp = suffix_data.timestamp
+            self.is_recording = suffix_data.is_recording
+            self.tracked_models_changed = suffix_data.tracked_models_changed
+        else:
+            self.timecode = None
+            self.timecode_sub = None
+            self.timestamp = None
+            self.is_recording = None
+            self.tracked_models_changed = None
+        return self
+
+    def copy(self):
+        summary = FrameSummary()
+        for field_name in FRAME_SUMMARY_FIELDS:
+            setattr(summary, field_name, getattr(self, field_name))
+        return summary
+
+    def keys(self):
+        return FRAME_SUMMARY_FIELDS
+
+    def __iter__(self):
+        return iter(FRAME_SUMMARY_FIELDS)
+
+    def __getitem__(self, key):
+        if key not in FRAME_SUMMARY_FIELDS:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def get_as_string(self, tab_str="  ", level=0):
+        out_tab_str = get_tab_str(tab_str, level)
+        out_str = ""
+        for field_name in FRAME_SUMMARY_FIELDS:
+            out_str += "%s%-24s: %s\n"%(out_tab_str, field_name, getattr(self, field_name))
+        return out_str
+
 
 
 # test program
@@ -1036,6 +1303,16 @@ def generate_mocap_data(frame_num=0):
 
     return mocap_data
 
+# View whose sections "decode" from the matching attribute of generate_mocap_data()
+def generate_mocap_data_view(frame_num=0):
+    mocap_data=generate_mocap_data(frame_num)
+    section_offsets={section_name:0 for section_name in FRAME_SECTION_ATTRIBUTES}
+    decode_section=lambda section_name, data, offset, decode_state: getattr(data, FRAME_SECTION_ATTRIBUTES[section_name])
+    return MoCapDataView(mocap_data, mocap_data.prefix_data, section_offsets, {}, decode_section)
+
+def generate_frame_summary(frame_num=0):
+    return FrameSummary().set_from_frame(generate_mocap_data(frame_num), 0)
+
 def test_all(run_test=True):
     totals=[0,0,0]
     if run_test is True:
@@ -1048,6 +1325,8 @@ def test_all(run_test=True):
                     ["Test Device Data 0",          "be10f0b93a7ba3858dce976b7868c1f79fd719c3", "generate_device_data(0)",True],
                     ["Test Suffix Data 0", "005a1b3e1f9e7530255ca75f34e4786cef29fcdb", "generate_suffix_data(0)", True],
                     ["Test MoCap Data 0", "1f85afac1eb790d431a4f5936b44a8555a316122", "generate_mocap_data(0)", True],
+                    ["Test MoCap Data View 0", "1f85afac1eb790d431a4f5936b44a8555a316122", "generate_mocap_data_view(0)", True],
+                    ["Test Frame Summary 0", "304f930e52030269a91b890eca7af5049c1c7aeb", "generate_frame_summary(0)", True],
                     ]
         num_tests = len(test_cases)
         for i in range(num_tests):
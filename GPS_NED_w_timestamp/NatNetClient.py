@@ -6,11 +6,27 @@ import copy
 import time
 import DataDescriptions
 import MoCapData
+import FrameLayout
+import FrameHistory
+import FrameRing
+import Recorder
+import FixedPoint
+import GeoConversion
+import BatchSocket
+import CoordinateTransform
+import Egress
+import SocketStats
+import Stats
 import math
-import pyned2lla
 import json
 import os
 
+# NumPy はオプション（decoder_mode="numpy" でのみ使用）
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
 def trace( *args ):
     # uncomment the one you want to use
     #print( "".join(map(str,args)) )
@@ -32,12 +48,55 @@ def get_message_id(data):
     message_id = int.from_bytes( data[0:2], byteorder='little', signed=True )
     return message_id
 
+# NUL終端文字列を offset から読み出し、(文字列, 次のオフセット) を返す。
+# パケットの残り全体をコピーせず、文字列部分だけを bytes にする。
+def read_cstring(data, offset):
+    end = offset
+    data_len = len(data)
+    while end < data_len and data[end] != 0:
+        end += 1
+    return bytes(data[offset:end]), end + 1
+
+# ID列 ids のうち rigid_body_ids に含まれる要素の真偽マスク（decoder_mode="numpy" 用）。
+# 対象IDは数個なので numpy.isin より総当たり比較のほうが速い。
+def id_mask(ids, rigid_body_ids):
+    id_array = numpy.fromiter( rigid_body_ids, dtype=ids.dtype )
+    return ( ids[:, None] == id_array ).any( axis=1 )
+
+# MAVLink GPS_INPUT仕様に合わせて緯度・経度を7桁、高度を3桁精度に制限する。
+# 変換結果が有限でない場合（位置が NaN など）は (None, None, None)
+def round_gps(lat_deg, lon_deg, alt_m):
+    if not math.isfinite(lat_deg + lon_deg + alt_m):
+        return None, None, None
+    return round(lat_deg, 7), round(lon_deg, 7), round(alt_m, 3)
+
 # Create structs for reading various object types to speed up parsing.
 Vector2 = struct.Struct( '<ff' )
 Vector3 = struct.Struct( '<fff' )
 Quaternion = struct.Struct( '<ffff' )
 FloatValue = struct.Struct( '<f' )
 DoubleValue = struct.Struct( '<d' )
+Int16Value = struct.Struct( '<h' )
+Int32Value = struct.Struct( '<i' )
+Int64Value = struct.Struct( '<q' )
+
+# Asset records (NatNet 4.1+)
+AssetRigidBody = struct.Struct( '<i3f4ffh' )
+AssetMarker = struct.Struct( '<i3ffhf' )
+
+# Section count + size in bytes (NatNet 4.1+)
+SectionHeader = struct.Struct( '<ii' )
+
+# Frame decoder modes
+#   "offset" : walk the received buffer with an absolute cursor (struct.unpack_from)
+#   "numpy"  : same as "offset", but rigid bodies and labeled markers are decoded into
+#              columnar NumPy arrays with one numpy.frombuffer call (NatNet 3.x/4.x)
+#   "legacy" : original decoder that slices data[offset:] for every section/element
+DECODER_MODES = ( "offset", "numpy", "legacy" )
+
+# Frame sections in stream order, for decode_sections (offset / numpy decoders only)
+FRAME_SECTIONS = ( "marker_sets", "legacy_markers", "rigid_bodies", "skeletons", "assets",
+                   "labeled_markers", "force_plates", "devices", "suffix" )
 
 # Increased size for the newest force plate
 FPCalMatrixRow = struct.Struct( '<ffffffffffff' )
@@ -67,8 +126,12 @@ class NatNetClient:
 
         # Set this to a callback method of your choice to receive per-rigid-body data at each frame.
         self.rigid_body_listener = None
+        # Called with a MoCapData.FrameSummary at each frame (the decoded frame with set_new_frame_listener(..., full_frame=True)).
         self.new_frame_listener = None
 
+        # Set this to a callback method of your choice to receive the whole decoded frame (MoCapData).
+        self.mocap_data_listener = None
+
         # Set Application Name
         self.__application_name = "Not Set"
 
@@ -87,26 +150,29 @@ class NatNetClient:
         # Server has the ability to change bitstream version
         self.__can_change_bitstream_version = False
 
+        # Precompiled record layout for the current bitstream version
+        self.__frame_layout = FrameLayout.compile_frame_layout(0, 0)
+
         self.command_thread = None
         self.data_thread = None
+        self.decode_thread = None
         self.command_socket = None
         self.data_socket = None
         self.stop_threads=False
 
-        # データバッファとカウンタ
-        self.data_buffer = {}
+        # 剛体データの履歴（FrameHistory、frame_history_capacity = 0 の場合は None）とカウンタ
+        self.frame_history = None
         self.data_No = 0
         self.time_log = 0
         
         # **記録機能用変数**
         self.is_recording = False
-        self.recording_data = []  # 記録データバッファ
+        self.recorder = None  # データスレッド → 記録書き込みスレッドのリング（Recorder.Recorder、最初の記録開始時に作成）
         self.recording_start_time = None  # 記録開始時刻
 
         # **GPS変換用の設定**
         self.D2R = math.pi / 180.0
         self.R2D = 180.0 / math.pi
-        self.wgs84 = pyned2lla.wgs84()
         
         # **基準GPS座標（7桁精度）**
         self.ref_lat = 36.0757800  # 緯度（7桁精度）
@@ -123,29 +189,226 @@ class NatNetClient:
             self.udp_targets = {int(k): v for k, v in udp_targets_dict.items()}
             # 記録機能の有効/無効
             self.recording_enabled = config.get("recording_enabled", False)
+            # 記録停止時の出力（"csv" = バイナリ記録を record_*.csv に変換 / "binary" = バイナリ記録のみ）
+            self.recording_format = config.get("recording_format", "csv")
             self.udp_port = config.get("udp_port", 15769)
+            # フレームデコーダの選択（"offset" / "numpy" / "legacy"）
+            self.decoder_mode = config.get("decoder_mode", "offset")
+            # デコードするセクション（null/未指定 = 全セクション）
+            decode_sections = config.get("decode_sections", None)
+            # フレームのセクションを参照時にデコードする（MoCapData.MoCapDataView。offset / numpy デコーダのみ）
+            self.lazy_frames = config.get("lazy_frames", False)
+            # new_frame_listener に FrameSummary ではなくデコードしたフレーム（MoCapData / MoCapDataView）を渡す
+            self.new_frame_full_frame = config.get("new_frame_full_frame", False)
+            # デコードする剛体ID（null/未指定 = 全剛体）
+            rigid_body_subscription = config.get("rigid_body_subscription", None)
+            # 受信・デコード・UDP送信を別スレッドに分離するか
+            self.receive_pipeline = config.get("receive_pipeline", True)
+            self.ring_capacity = config.get("ring_capacity", 64)
+            self.ring_overflow_policy = config.get("ring_overflow_policy", "drop_oldest")
+            # UDP送信を送信先毎のワーカースレッドで行うか
+            self.egress_workers = config.get("egress_workers", True)
+            # 1フレーム分の同じ送信先の剛体を1つのデータグラムにまとめて送信するか（§4.3）
+            self.egress_coalesce = config.get("egress_coalesce", False)
+            # UDP送信方式（"socket" = 送信先毎のソケット / "sendmmsg" = 1フレーム分を1つのソケットから一括送信）
+            self.egress_backend = config.get("egress_backend", "socket")
+            # データソケットの受信方式（"socket" / "recvmmsg"）
+            self.receive_backend = config.get("receive_backend", "socket")
+            self.receive_batch_size = config.get("receive_batch_size", 32)
+            # ソケットバッファサイズ {"data"/"command"/"egress": {"rcvbuf": bytes, "sndbuf": bytes}}
+            self.socket_buffers = config.get("socket_buffers", {})
+            # 受信統計サマリの表示間隔 [秒]（0 = 表示しない。>0 で50フレーム毎の送信表示を置き換える）
+            self.stats_interval_sec = config.get("stats_interval_sec", 0)
+            # 露光から UDP 送信完了までの段階別遅延を計測する
+            latency_trace = config.get("latency_trace", False)
+            # NED → GPS の変換方式（"exact" = 楕円体の厳密な変換 / "linear" = 基準点の接平面で線形化）
+            self.gps_conversion = config.get("gps_conversion", "exact")
+            self.gps_linear_radius_m = config.get("gps_linear_radius_m", 50.0)
+            # NED の各軸に対応する Motive の軸（{"north": "x", "east": "z", "down": "-y"} など。null/未指定 = 既定）
+            motive_axes = config.get("motive_axes", None)
+            # 剛体データの履歴（FrameHistory）のレコード数。0 で履歴を持たない
+            self.frame_history_capacity = config.get("frame_history_capacity", 64*1024)
         except Exception as e:
             print(f"[警告] config.jsonの読み込みに失敗: {e}")
             self.udp_targets = {}
             self.recording_enabled = False
+            self.recording_format = "csv"
             self.udp_port = 15769
+            self.decoder_mode = "offset"
+            decode_sections = None
+            self.lazy_frames = False
+            self.new_frame_full_frame = False
+            rigid_body_subscription = None
+            self.receive_pipeline = True
+            self.ring_capacity = 64
+            self.egress_workers = True
+            self.egress_coalesce = False
+            self.egress_backend = "socket"
+            self.ring_overflow_policy = "drop_oldest"
+            self.receive_backend = "socket"
+            self.receive_batch_size = 32
+            self.socket_buffers = {}
+            self.stats_interval_sec = 0
+            latency_trace = False
+            self.gps_conversion = "exact"
+            self.gps_linear_radius_m = 50.0
+            motive_axes = None
+            self.frame_history_capacity = 64*1024
+
+        if self.decoder_mode not in DECODER_MODES:
+            print(f"[警告] 不明なdecoder_mode '{self.decoder_mode}' → 'offset' を使用")
+            self.decoder_mode = "offset"
+        elif self.decoder_mode == "numpy" and numpy is None:
+            print("[警告] decoder_mode 'numpy' にはNumPyが必要です → 'offset' を使用")
+            self.decoder_mode = "offset"
+
+        self.decode_sections = None
+        if decode_sections is not None:
+            unknown = set(decode_sections) - set(FRAME_SECTIONS)
+            if unknown:
+                print(f"[警告] 不明なdecode_sections {sorted(unknown)} → 全セクションをデコード")
+            else:
+                self.decode_sections = frozenset(decode_sections)
+
+        if not isinstance(self.lazy_frames, bool):
+            print(f"[警告] 不正なlazy_frames '{self.lazy_frames}' → false を使用")
+            self.lazy_frames = False
+
+        if not isinstance(self.new_frame_full_frame, bool):
+            print(f"[警告] 不正なnew_frame_full_frame '{self.new_frame_full_frame}' → false を使用")
+            self.new_frame_full_frame = False
+
+        # new_frame_listener に渡すフレーム概要（毎フレーム同じオブジェクトを上書きする）
+        self.__frame_summary = MoCapData.FrameSummary()
+
+        self.rigid_body_subscription = None
+        if rigid_body_subscription is not None:
+            self.rigid_body_subscription = frozenset(int(rb_id) for rb_id in rigid_body_subscription)
+
+        if self.ring_overflow_policy not in FrameRing.OVERFLOW_POLICIES:
+            print(f"[警告] 不明なring_overflow_policy '{self.ring_overflow_policy}' → 'drop_oldest' を使用")
+            self.ring_overflow_policy = "drop_oldest"
+
+        if self.receive_backend not in ( "socket", "recvmmsg" ):
+            print(f"[警告] 不明なreceive_backend '{self.receive_backend}' → 'socket' を使用")
+            self.receive_backend = "socket"
+        elif self.receive_backend == "recvmmsg" and not BatchSocket.has_recvmmsg():
+            print("[警告] recvmmsg が使用できません → socket による一括受信にフォールバック")
+
+        if self.egress_backend not in ( "socket", "sendmmsg" ):
+            print(f"[警告] 不明なegress_backend '{self.egress_backend}' → 'socket' を使用")
+            self.egress_backend = "socket"
+        elif self.egress_backend == "sendmmsg" and not BatchSocket.has_sendmmsg():
+            print("[警告] sendmmsg が使用できません → sendto のループによる一括送信にフォールバック")
+
+        if self.recording_format not in ( "csv", "binary" ):
+            print(f"[警告] 不明なrecording_format '{self.recording_format}' → 'csv' を使用")
+            self.recording_format = "csv"
+
+        if self.gps_conversion not in ( "exact", "linear" ):
+            print(f"[警告] 不明なgps_conversion '{self.gps_conversion}' → 'exact' を使用")
+            self.gps_conversion = "exact"
+        elif self.gps_conversion == "linear" and not ( isinstance(self.gps_linear_radius_m, (int, float)) and self.gps_linear_radius_m > 0 ):
+            print(f"[警告] 不正なgps_linear_radius_m '{self.gps_linear_radius_m}' → 50.0 を使用")
+            self.gps_linear_radius_m = 50.0
+
+        try:
+            self.motive_transform = CoordinateTransform.MotiveToNed(motive_axes)
+        except (ValueError, TypeError, AttributeError) as e:
+            print(f"[警告] 不正なmotive_axes {motive_axes}: {e} → 既定の軸対応を使用")
+            self.motive_transform = CoordinateTransform.MotiveToNed()
+
+        if not ( isinstance(self.frame_history_capacity, int) and ( self.frame_history_capacity == 0 or self.frame_history_capacity >= 2 ) ):
+            print(f"[警告] 不正なframe_history_capacity '{self.frame_history_capacity}' → {64*1024} を使用")
+            self.frame_history_capacity = 64*1024
+        if self.frame_history_capacity > 0:
+            self.frame_history = FrameHistory.FrameHistory(self.frame_history_capacity, self.motive_transform)
+
+        # 受信パイプライン（run() で receive_pipeline が有効な場合に生成）
+        self.frame_ring = None
+
+        # 送信先毎の送信ワーカー（run() で egress_workers が有効な場合に生成）
+        self.egress_pool = None
+
+        # egress_coalesce / egress_backend = "sendmmsg": デコード中のフレームの送信先毎のレコード
+        # {target_ip: [(rigid_body_id, packed, fields), ...]}。剛体セクションのデコード後にまとめて送信する
+        self.__collect_frame_egress = self.egress_coalesce or self.egress_backend == "sendmmsg"
+        self.__frame_egress = {}
+        self.__frame_number = 0
+
+        # lazy_frames: ストリーム順のセクション（suffix を除く）と、走査時の読み飛ばし方
+        self.__frame_section_walkers = (
+            ( "marker_sets", self.__walk_marker_sets ),
+            ( "legacy_markers", self.__walk_legacy_markers ),
+            ( "rigid_bodies", self.__walk_rigid_bodies ),
+            ( "skeletons", self.__walk_skeletons ),
+            ( "assets", None ),
+            ( "labeled_markers", self.__walk_labeled_markers ),
+            ( "force_plates", self.__walk_force_plates ),
+            ( "devices", self.__walk_devices ),
+        )
+
+        # egress_backend = "sendmmsg" の一括送信（__init__ で送信用ソケットと共に生成）
+        self.batch_sender = None
+        self.__last_batch_error_print_ns = None
+
+        # 一括受信（receive_backend = "recvmmsg" の場合にデータスレッドで生成）
+        self.batch_receiver = None
+
+        # フレーム番号の欠落・重複・順序入れ替わりと到着間隔の統計
+        self.frame_stats = Stats.FrameStats()
+        self.__last_stats_report_ns = None
+
+        # 段階別遅延（latency_trace が有効な場合のみ）
+        self.latency_tracer = Stats.LatencyTracer() if latency_trace else None
+        self.clock_offset = Stats.ClockOffsetEstimator()
+        self.__server_clock_frequency = 0       # サーバの高分解能クロック周波数 [Hz]（NatNet 3.0 以降）
+        self.__frame_receive_time_ns = None     # デコード中のフレームの受信時刻
         
         # UDP統計情報
         self.udp_send_count = 0
         self.udp_error_count = 0
 
+        # 基準点の WGS84 の値を事前計算した変換器（基準点を変える場合は set_gps_reference）
+        self.geo = self.__create_geo_converter()
+
         print(f"GPS reference initialized: ({self.ref_lat:.7f}, {self.ref_lon:.7f}, {self.ref_alt:.3f})")
+        if self.gps_conversion == "linear":
+            print(f"GPS conversion: {self.geo.get_as_string()}")
+        else:
+            print(f"GPS conversion: exact ({self.geo.backend})")
+        print(f"Motive axes: {self.motive_transform.get_as_string()}")
         print("UDP targets configured:")
         for rb_id, ip in self.udp_targets.items():
             print(f"  Rigid Body {rb_id} → {ip}:{self.udp_port}")
         print("UDP sending at 50Hz (every frame), Console display every 50 frames")
 
+        # ソケットバッファサイズ（要求値/実際の値）とカーネル破棄数の統計
+        self.socket_stats = SocketStats.SocketStats()
+
         # Persist UDP sockets (one per target IP)
+        # 宛先に connect しておき send() で送信する（送信毎の経路検索を省き、ICMP エラーを送信先の状態として受け取る）
         self.udp_sockets = {}
+        self.target_health = {}
+        egress_buffers = self.socket_buffers.get("egress", {})
         for rb_id, target_ip in self.udp_targets.items():
             if target_ip not in self.udp_sockets:
                 sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+                health = Egress.TargetHealth(target_ip)
+                if not self.__connect_target( sock, target_ip, health, time.perf_counter_ns() ):
+                    print(f"[警告] UDP送信先 {target_ip}:{self.udp_port} への connect に失敗: {health.connect_error}（再接続できるまで sendto で送信）")
                 self.udp_sockets[target_ip] = sock
+                self.target_health[target_ip] = health
+                self.socket_stats.register("egress " + target_ip, sock,
+                                           egress_buffers.get("rcvbuf"), egress_buffers.get("sndbuf"))
+
+        # 一括送信用の1つのソケット。デコードスレッドから送信するため非ブロッキング（送れない分はエラーとして数える）
+        if self.egress_backend == "sendmmsg":
+            batch_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            batch_socket.setblocking(False)
+            self.socket_stats.register("egress batch", batch_socket,
+                                       egress_buffers.get("rcvbuf"), egress_buffers.get("sndbuf"))
+            self.batch_sender = BatchSocket.BatchSender(batch_socket)
 
         # Client/server message ids
         self.NAT_CONNECT = 0
@@ -164,44 +427,48 @@ class NatNetClient:
 
     def motive_to_ned(self, motive_x, motive_y, motive_z, motive_qx, motive_qy, motive_qz, motive_qw):
         """
-        Motive座標系（左手系：X=北,Y=上,Z=東）からNED座標系（右手系：X=北,Y=東,Z=下）への変換
+        Motive座標系からNED座標系（右手系：X=北,Y=東,Z=下）への変換。
+        軸の対応は config.json の motive_axes（既定: X=北, Y=上, Z=東 の右手系）
         """
-        # 位置変換
-        ned_x = motive_x   # 北→北
-        ned_y = motive_z   # 東→東
-        ned_z = -motive_y  # 上→下（符号反転）
-        
-        # クオータニオン変換（順序に注意）
-        ned_qw = motive_qw   # w成分
-        ned_qx = motive_qx   # X軸（北）→X軸（北）
-        ned_qy = motive_qz   # Z軸（東）→Y軸（東）
-        ned_qz = -motive_qy  # Y軸（上）→Z軸（下）、符号反転
-        
+        ned_x, ned_y, ned_z = self.motive_transform.position((motive_x, motive_y, motive_z))
+        ned_qw, ned_qx, ned_qy, ned_qz = self.motive_transform.quaternion((motive_qx, motive_qy, motive_qz, motive_qw))
         return ned_x, ned_y, ned_z, ned_qw, ned_qx, ned_qy, ned_qz
 
     def ned_to_gps(self, ned_x, ned_y, ned_z):
         """
         NED座標をGPS座標に変換（MAVLink GPS_INPUT仕様に合わせて7桁精度）
         """
-        try:
-            lat_rad, lon_rad, alt = pyned2lla.ned2lla(
-                self.ref_lat * self.D2R,
-                self.ref_lon * self.D2R, 
-                self.ref_alt,
-                ned_x, ned_y, ned_z,
-                self.wgs84
-            )
-            
-            # MAVLink GPS_INPUT仕様に合わせて7桁精度に制限
-            lat_deg = round(lat_rad * self.R2D, 7)
-            lon_deg = round(lon_rad * self.R2D, 7) 
-            alt_m = round(alt, 3)  # 高度は3桁精度
-            
-            return lat_deg, lon_deg, alt_m
-            
-        except Exception as e:
-            print(f"GPS conversion error: {e}")
-            return None, None, None
+        lat_deg, lon_deg, alt_m = self.geo.convert(ned_x, ned_y, ned_z)
+        return round_gps(lat_deg, lon_deg, alt_m)
+
+    # GPS 変換の基準点を変更する
+    def set_gps_reference(self, ref_lat, ref_lon, ref_alt):
+        self.ref_lat = ref_lat
+        self.ref_lon = ref_lon
+        self.ref_alt = ref_alt
+        self.geo = self.__create_geo_converter()
+
+    def __create_geo_converter(self):
+        if self.gps_conversion == "linear":
+            return GeoConversion.LinearNedToLla(self.ref_lat, self.ref_lon, self.ref_alt, self.gps_linear_radius_m)
+        return GeoConversion.NedToLla(self.ref_lat, self.ref_lon, self.ref_alt)
+
+    def motive_to_fields(self, pos, rot):
+        """
+        Motiveの位置 (x, y, z)・クオータニオン (qx, qy, qz, qw) から送信フィールド
+        (lat_e7, lon_e7, alt_mm, yaw_cdeg) を1回で求める（位置が変換できない場合は None）
+        """
+        north, east, down, yaw_deg = self.motive_transform.transform(pos, rot)
+        lat_deg, lon_deg, alt_m = self.geo.convert(north, east, down)
+        return FixedPoint.to_fields(lat_deg, lon_deg, alt_m, yaw_deg)
+
+    def motive_to_fields_array(self, pos, rot):
+        """
+        motive_to_fields の NumPy 版（pos: N×3, rot: N×4）。(lat_e7, lon_e7, alt_mm, yaw_cdeg, valid) の配列を返す
+        """
+        north, east, down, yaw_deg = self.motive_transform.transform_array(pos, rot)
+        lat_deg, lon_deg, alt_m = self.geo.convert_array(north, east, down)
+        return FixedPoint.to_fields_array(lat_deg, lon_deg, alt_m, yaw_deg)
 
     def quaternion_to_yaw_degrees(self, ned_quat):
         """
@@ -226,11 +493,12 @@ class NatNetClient:
             return 0.0
 
     def send_udp_data(self, packed_data: bytes, target_ip: str):
-        """UDP送信（永続ソケット使用）"""
+        """UDP送信（永続ソケット使用。connect できていない送信先は sendto）"""
+        health = self.target_health[target_ip]
         try:
-            sock = self.udp_sockets[target_ip]
-            sock.sendto(packed_data, (target_ip, self.udp_port))
+            self.__send_to_target(target_ip, packed_data)
             self.udp_send_count += 1
+            health.record_success(time.perf_counter_ns())
             return True
         except socket.timeout:
             self.udp_error_count += 1
@@ -240,12 +508,15 @@ class NatNetClient:
             self.udp_error_count += 1
             print(f"✗ UDP address error to {target_ip}:{self.udp_port}: {e}")
             return False
-        except ConnectionRefusedError:
+        except ConnectionRefusedError as e:
+            # ICMP port unreachable。表示は送信先の状態が変わった時だけ（TargetHealth）
             self.udp_error_count += 1
-            print(f"✗ UDP connection refused by {target_ip}:{self.udp_port}")
+            health.record_error(e, time.perf_counter_ns())
             return False
         except Exception as e:
             self.udp_error_count += 1
+            if isinstance(e, OSError):
+                health.record_error(e, time.perf_counter_ns())
             print(f"✗ UDP send error to {target_ip}:{self.udp_port}: {e}")
             return False
 
@@ -258,13 +529,25 @@ class NatNetClient:
         if self.is_recording:
             print("すでに記録中です")
             return
-            
-        self.is_recording = True
-        self.recording_data = []
+
+        # ファイル名生成（記録開始時刻を使用）、ダウンロードフォルダに保存
+        from datetime import datetime
         self.recording_start_time = time.time()
+        start_dt = datetime.fromtimestamp(self.recording_start_time)
+        filepath = os.path.join(os.path.expanduser("~/Downloads"), start_dt.strftime("record_%Y%m%d_%H%M%S.bin"))
+        if self.recorder is None:
+            self.recorder = Recorder.Recorder()
+        try:
+            self.recorder.start(filepath, int(self.recording_start_time * 1e9))
+        except OSError as e:
+            print(f"[ERROR] 記録ファイルを作成できません: {e}")
+            return
+        # 開始マーカーを渡してから is_recording を立てる（データスレッドは is_recording を見て recorder を使う）
+        self.is_recording = True
         print("==================")
         print("記録開始！")
         print("==================")
+        print(f"[DEBUG] 記録ファイル: {filepath}")
 
     def stop_recording(self):
         """記録停止とCSV保存"""
@@ -276,41 +559,21 @@ class NatNetClient:
         print("==================")
         print("記録停止！")
         print("==================")
-        
-        # CSV保存
-        if len(self.recording_data) == 0:
+
+        # 停止マーカーまでのレコードを書き込みスレッドが書き出してファイルを閉じるまで待つ
+        session = self.recorder.stop()
+        print(session.get_as_string())
+        if session.written_count == 0:
             print("[DEBUG] 記録データがありません")
             return
-        
-        print(f"[DEBUG] 記録データ行数: {len(self.recording_data)}")
-        print(f"[DEBUG] 最初の3行のサンプル:")
-        for i, row in enumerate(self.recording_data[:3]):
-            print(f"  [行{i}]: {row}")
-            
-        # ファイル名生成（記録開始時刻を使用）
+        if self.recording_format != "csv":
+            print(f"記録保存完了: {os.path.basename(session.path)} ({session.written_count}行)")
+            return
+
+        # CSV保存（バイナリ記録から従来と同じ列で変換。バイナリ記録は残す）
         try:
-            from datetime import datetime
-            start_dt = datetime.fromtimestamp(self.recording_start_time)
-            filename = start_dt.strftime("record_%Y%m%d_%H%M%S.csv")
-            # ダウンロードフォルダに保存
-            download_folder = os.path.expanduser("~/Downloads")
-            filepath = os.path.join(download_folder, filename)
-            
-            print(f"[DEBUG] CSVファイル保存先: {filepath}")
-            
-            # CSV書き込み
-            import csv
-            with open(filepath, 'w', newline='', encoding='utf-8') as f:
-                writer = csv.writer(f)
-                # ヘッダー
-                writer.writerow(['timestamp', 'rigid_body_id', 
-                               'pos_x', 'pos_y', 'pos_z',
-                               'quat_x', 'quat_y', 'quat_z', 'quat_w'])
-                # データ
-                for row in self.recording_data:
-                    writer.writerow(row)
-            
-            print(f"CSV保存完了: {filename} ({len(self.recording_data)}行)")
+            filepath, row_count = Recorder.convert_to_csv(session.path)
+            print(f"CSV保存完了: {os.path.basename(filepath)} ({row_count}行)")
         except Exception as e:
             print(f"[ERROR] CSV保存エラー: {e}")
             import traceback
@@ -366,6 +629,7 @@ class NatNetClient:
                 self.__nat_net_requested_version[1] = minor
                 self.__nat_net_requested_version[2] = 0
                 self.__nat_net_requested_version[3] = 0
+                self.__update_frame_layout()
                 print("changing bitstream MAIN")
                 self.send_command("TimelinePlay")
                 time.sleep(0.1)
@@ -379,6 +643,15 @@ class NatNetClient:
                 print("Bitstream change request failed")
         return return_code
 
+    # ビットストリームバージョン確定時にレコードレイアウトを一度だけコンパイル
+    def __update_frame_layout(self):
+        self.__frame_layout = FrameLayout.compile_frame_layout(
+            self.__nat_net_requested_version[0], self.__nat_net_requested_version[1])
+        trace( self.__frame_layout.get_as_string() )
+
+    def get_frame_layout(self):
+        return self.__frame_layout
+
     def get_major(self):
         return self.__nat_net_requested_version[0]
 
@@ -393,6 +666,51 @@ class NatNetClient:
     def get_print_level(self):
         return self.print_level
 
+    def set_decoder_mode(self, decoder_mode):
+        if decoder_mode == "numpy" and numpy is None:
+            print("decoder_mode 'numpy' requires NumPy")
+        elif decoder_mode in DECODER_MODES:
+            self.decoder_mode = decoder_mode
+        return self.decoder_mode
+
+    def get_decoder_mode(self):
+        return self.decoder_mode
+
+    # sections: FRAME_SECTIONS の部分集合。None で全セクションをデコード
+    def set_decode_sections(self, sections):
+        if sections is None:
+            self.decode_sections = None
+        elif set(sections) <= set(FRAME_SECTIONS):
+            self.decode_sections = frozenset(sections)
+        else:
+            print("unknown decode sections: %s"%sorted(set(sections) - set(FRAME_SECTIONS)))
+        return self.decode_sections
+
+    # full_frame が True の場合は FrameSummary ではなくデコードしたフレームを渡す
+    def set_new_frame_listener(self, new_frame_listener, full_frame=False):
+        self.new_frame_listener = new_frame_listener
+        self.new_frame_full_frame = bool(full_frame)
+
+    # True でフレームを MoCapData.MoCapDataView として返し、各セクションを参照時にデコードする
+    def set_lazy_frames(self, lazy_frames):
+        self.lazy_frames = bool(lazy_frames)
+        return self.lazy_frames
+
+    def get_decode_sections(self):
+        return self.decode_sections
+
+    # rigid_body_ids: デコードする剛体IDの集合。None で全剛体
+    # 対象外の剛体はIDだけ読んでバイト単位で読み飛ばす（オブジェクト生成・UDP送信・リスナー呼び出しなし）
+    def set_rigid_body_subscription(self, rigid_body_ids):
+        if rigid_body_ids is None:
+            self.rigid_body_subscription = None
+        else:
+            self.rigid_body_subscription = frozenset(int(rb_id) for rb_id in rigid_body_ids)
+        return self.rigid_body_subscription
+
+    def get_rigid_body_subscription(self):
+        return self.rigid_body_subscription
+
     def connected(self):
         ret_value = True
         if self.command_socket == None:
@@ -509,6 +827,194 @@ class NatNetClient:
 
         return result
 
+    # 剛体1個分の受信処理（記録・NED/GPS変換・UDP送信・リスナー通知）
+    # fields はフレーム単位でまとめて変換済みの場合の送信フィールド（__decode_rigid_body_arrays）
+    def __handle_rigid_body( self, new_id, pos, rot, fields=None ):
+        # 公式タイムスタンプ（frame_suffix_data.timestamp）を取得
+        official_timestamp = None
+        if hasattr(self, 'current_frame_timestamp'):
+            official_timestamp = self.current_frame_timestamp
+        time_ns = time.time_ns()
+        # **記録機能: Motiveから受信した生データを記録**
+        if self.is_recording:
+            # time_ns, frame_number, rigid_body_id, pos, quat, Motive timestamp（書き込みは記録スレッド）
+            self.recorder.record(time_ns, self.__frame_number, new_id, pos, rot, official_timestamp)
+
+        # udp_targets.jsonに設定された剛体IDのデータを処理
+        if new_id in self.udp_targets:
+            if new_id == 1:
+                self.time_log = official_timestamp
+            tracer = self.latency_tracer
+            if tracer is not None:
+                convert_start_ns = time.perf_counter_ns()
+
+            # Motive座標系 → NED → GPS / Yaw → 送信フィールド (lat_e7, lon_e7, alt_mm, yaw_cdeg)
+            if fields is None:
+                fields = self.motive_to_fields(pos, rot)
+
+            # structバイナリ生成とUDP送信
+            if fields is not None:
+                lat_e7, lon_e7, alt_mm, yaw_cdeg = fields
+                unix_time_sec = time.time_ns() / 1e9
+
+                # struct パック (23バイト固定長)
+                packed = struct.pack('<BiiiHd',
+                    new_id, lat_e7, lon_e7, alt_mm, yaw_cdeg, unix_time_sec)
+                if tracer is not None:
+                    tracer.add("convert", time.perf_counter_ns() - convert_start_ns)
+
+                target_ip = self.udp_targets[new_id]
+                if self.__collect_frame_egress:
+                    # 剛体セクションのデコード後に送信先毎にまとめて送信する（__flush_frame_egress）
+                    self.__frame_egress.setdefault(target_ip, []).append((new_id, packed, fields))
+                elif self.egress_pool is not None:
+                    # 送信とコンソール表示は送信先の送信ワーカーで行う（未送信の同じ剛体のデータは上書き）
+                    self.egress_pool.put(target_ip, new_id, (new_id, target_ip, packed, self.data_No, fields, self.__frame_receive_time_ns))
+                else:
+                    self.__send_rigid_body(new_id, target_ip, packed, self.data_No, fields, self.__frame_receive_time_ns)
+            else:
+                print(f"ERROR: GPS conversion failed for ID {new_id}")
+
+            # データ番号をインクリメント
+            if new_id == 2:
+                self.data_No = self.data_No + 1
+
+        # 履歴に格納（送信対象外の剛体は fields = None）
+        history = self.frame_history
+        if history is not None:
+            history.append(time_ns, self.__frame_number, new_id, pos, rot, fields)
+
+        # Send information to any listener.
+        if self.rigid_body_listener is not None:
+            self.rigid_body_listener( new_id, pos, rot )
+
+    # __handle_rigid_body で溜めたレコードを送信する。egress_coalesce の場合は送信先毎に1つのデータグラムにまとめ、
+    # egress_backend = "sendmmsg" の場合は1フレーム分の全データグラムを一括送信する。
+    # 剛体セクションのデコード直後と、フレームの処理終了時に呼ぶ
+    def __flush_frame_egress( self ):
+        if not self.__frame_egress:
+            return
+        frame_egress = self.__frame_egress
+        self.__frame_egress = {}
+        # (送信先, 最新値スロットのキー, packed, 剛体ID, fields)
+        datagrams = []
+        for target_ip, records in frame_egress.items():
+            if not self.egress_coalesce:
+                datagrams.extend( (target_ip, new_id, packed, new_id, fields) for new_id, packed, fields in records )
+                continue
+            for start in range( 0, len(records), Egress.COALESCED_MAX_RECORDS ):
+                chunk = records[start:start + Egress.COALESCED_MAX_RECORDS]
+                packed = Egress.pack_coalesced_datagram( self.__frame_number, [record[1] for record in chunk] )
+                # 分割した場合は分割番号毎のスロット
+                datagrams.append( (target_ip, start, packed, tuple( record[0] for record in chunk ), chunk[0][2]) )
+
+        if self.batch_sender is not None:
+            self.__send_batch( datagrams )
+            return
+        for target_ip, key, packed, rigid_body_ids, fields in datagrams:
+            if self.egress_pool is not None:
+                self.egress_pool.put( target_ip, key, (rigid_body_ids, target_ip, packed, self.data_No, fields, self.__frame_receive_time_ns) )
+            else:
+                self.__send_rigid_body( rigid_body_ids, target_ip, packed, self.data_No, fields, self.__frame_receive_time_ns )
+
+    # egress_backend = "sendmmsg": 1フレーム分のデータグラムを1回の sendmmsg で送信し、送信数・エラー数に反映する
+    def __send_batch( self, datagrams ):
+        send_start_ns = time.perf_counter_ns() if self.latency_tracer is not None else 0
+        udp_port = self.udp_port
+        sent_count, errors = self.batch_sender.send( [(datagram[2], (datagram[0], udp_port)) for datagram in datagrams] )
+        self.__trace_send( send_start_ns, self.__frame_receive_time_ns )
+        self.udp_send_count += sent_count
+        self.udp_error_count += len(errors)
+
+        # 一括送信用ソケットは connect しないため ICMP エラーは返らない。ローカルの送信エラーのみ状態に反映する
+        now_ns = time.perf_counter_ns()
+        failed_indices = set()
+        for index, msg in errors:
+            failed_indices.add(index)
+            self.target_health[datagrams[index][0]].record_error(msg, now_ns)
+        for index, datagram in enumerate(datagrams):
+            if index not in failed_indices:
+                self.target_health[datagram[0]].record_success(now_ns)
+
+        if errors:
+            # エラー表示は1秒に1回まで
+            if self.__last_batch_error_print_ns is None or now_ns - self.__last_batch_error_print_ns >= 1000000000:
+                index, msg = errors[0]
+                print(f"✗ UDP send error to {datagrams[index][0]}:{udp_port}: {msg} ({len(errors)} errors in frame)")
+                self.__last_batch_error_print_ns = now_ns
+
+        if self.stats_interval_sec <= 0 and self.data_No % 50 == 0:
+            for target_ip, key, packed, rigid_body_ids, fields in datagrams:
+                print(f"[Frame {self.data_No}] Struct data sent to {target_ip} (50Hz), GPS: {FixedPoint.format_gps(fields)}")
+
+    # receive_time_ns は剛体を含むフレームの受信時刻（latency_trace の egress 段階に使用）
+    # fields は送信フィールド (lat_e7, lon_e7, alt_mm, yaw_cdeg)（コンソール表示用）
+    # egress_coalesce の場合、new_id はデータグラムに含まれる剛体IDのタプル、fields は先頭の剛体の値
+    def __send_rigid_body( self, new_id, target_ip, packed, data_no, fields, receive_time_ns=None ):
+        send_start_ns = time.perf_counter_ns() if self.latency_tracer is not None else 0
+        # 失敗時の表示は send_udp_data で行う
+        self.send_udp_data(packed, target_ip)
+        self.__trace_send( send_start_ns, receive_time_ns )
+
+        if self.stats_interval_sec <= 0 and data_no % 50 == 0:
+            print(f"[Frame {data_no}] Struct data sent to {target_ip} (50Hz), GPS: {FixedPoint.format_gps(fields)}")
+
+    # 送信ワーカー（Egress.TargetSender）から呼ばれる。失敗時は OSError を送出し、件数と表示はワーカー側で扱う
+    def __send_egress_item( self, item ):
+        new_id, target_ip, packed, data_no, fields, receive_time_ns = item
+        send_start_ns = time.perf_counter_ns() if self.latency_tracer is not None else 0
+        try:
+            self.__send_to_target(target_ip, packed)
+        except OSError as e:
+            self.target_health[target_ip].record_error(e, time.perf_counter_ns())
+            raise
+        self.target_health[target_ip].record_success(time.perf_counter_ns())
+        self.__trace_send( send_start_ns, receive_time_ns )
+
+        if self.stats_interval_sec <= 0 and data_no % 50 == 0:
+            print(f"[Frame {data_no}] Struct data sent to {target_ip} (50Hz), GPS: {FixedPoint.format_gps(fields)}")
+
+    def __connect_target( self, sock, target_ip, health, now_ns ):
+        try:
+            sock.connect((target_ip, self.udp_port))
+        except OSError as e:
+            health.record_connect_error(e, now_ns)
+            return False
+        health.record_connect(now_ns)
+        return True
+
+    # 送信先ソケットで1データグラム送信する。connect に失敗した送信先は CONNECT_RETRY_NS 毎に再接続を試み、
+    # 接続できるまでは sendto で送る（未接続のソケットの send は EDESTADDRREQ になる）
+    def __send_to_target( self, target_ip, packed ):
+        sock = self.udp_sockets[target_ip]
+        health = self.target_health[target_ip]
+        if not health.connected:
+            now_ns = time.perf_counter_ns()
+            if not health.should_retry_connect(now_ns) or not self.__connect_target( sock, target_ip, health, now_ns ):
+                sock.sendto(packed, (target_ip, self.udp_port))
+                return
+        sock.send(packed)
+
+    def __trace_send( self, send_start_ns, receive_time_ns ):
+        tracer = self.latency_tracer
+        if tracer is not None:
+            send_end_ns = time.perf_counter_ns()
+            tracer.add("sendto", send_end_ns - send_start_ns)
+            if receive_time_ns is not None:
+                tracer.add("egress", send_end_ns - receive_time_ns)
+
+    # 送信先毎の状態 {target_ip: "unknown" / "ok" / "refused" / "unreachable" / "error"}
+    def get_target_health(self):
+        return {target_ip: health.state for target_ip, health in self.target_health.items()}
+
+    # (送信数, エラー数)。送信ワーカーの分を含む
+    def get_udp_counts(self):
+        sent_count, error_count = self.udp_send_count, self.udp_error_count
+        if self.egress_pool is not None:
+            sent_count += self.egress_pool.get_sent_count()
+            error_count += self.egress_pool.get_error_count()
+        return sent_count, error_count
+
     # Unpack a rigid body object from a data packet
     def __unpack_rigid_body( self, data, major, minor, rb_num):
         offset = 0
@@ -540,91 +1046,10 @@ class NatNetClient:
 
         trace_mf( "\tOrientation : [%3.2f, %3.2f, %3.2f, %3.2f]"% (rot[0], rot[1], rot[2], rot[3] ))
 
-        # 公式タイムスタンプ（frame_suffix_data.timestamp）を取得
-        official_timestamp = None
-        if hasattr(self, 'current_frame_timestamp'):
-            official_timestamp = self.current_frame_timestamp
-        # **記録機能: Motiveから受信した生データを記録**
-        if self.is_recording:
-            # timestamp, rigid_body_id, pos_x, pos_y, pos_z, quat_x, quat_y, quat_z, quat_w
-            self.recording_data.append([
-                time.time_ns(),
-                new_id,
-                pos[0], pos[1], pos[2],
-                rot[0], rot[1], rot[2], rot[3]
-            ])
-
-        # udp_targets.jsonに設定された剛体IDのデータを処理
-        if new_id in self.udp_targets:
-            if new_id == 1:
-                self.time_log = official_timestamp
-
-            # Motive座標系 → NED座標系への変換
-            rel_x, rel_y, rel_z = pos
-            motive_qx, motive_qy, motive_qz, motive_qw = rot
-            
-            ned_x, ned_y, ned_z, ned_qw, ned_qx, ned_qy, ned_qz = self.motive_to_ned(
-                rel_x, rel_y, rel_z,
-                motive_qx, motive_qy, motive_qz, motive_qw
-            )
-
-            # NED → GPS（緯度・経度・高度）の変換
-            gps_lat, gps_lon, gps_alt = self.ned_to_gps(ned_x, ned_y, ned_z)
-            
-            # Yaw角の計算
-            yaw_deg = self.quaternion_to_yaw_degrees([ned_qw, ned_qx, ned_qy, ned_qz])
-
-            # structバイナリ生成とUDP送信
-            if gps_lat is not None:
-                # 単位変換
-                lat_e7 = int(gps_lat * 1e7)
-                lon_e7 = int(gps_lon * 1e7)
-                alt_mm = int(gps_alt * 1000)
-                yaw_cdeg = int(yaw_deg * 100)
-                unix_time_sec = time.time_ns() / 1e9
-
-                # struct パック (23バイト固定長)
-                packed = struct.pack('<BiiiHd',
-                    new_id, lat_e7, lon_e7, alt_mm, yaw_cdeg, unix_time_sec)
-
-                target_ip = self.udp_targets[new_id]
-                success = self.send_udp_data(packed, target_ip)
-
-                if self.data_No % 50 == 0:
-                    print(f"[Frame {self.data_No}] Struct data sent to {target_ip} (50Hz), GPS: ({gps_lat:.7f}, {gps_lon:.7f}, {gps_alt:.3f})")
-
-                if not success:
-                    print(f"Failed to send UDP data for RB{new_id} to {target_ip}")
-            else:
-                print(f"ERROR: GPS conversion failed for ID {new_id}")
-
-            # データをバッファに格納（コンソール表示用）
-            self.data_buffer[new_id] = {
-                'id': new_id,
-                'position': pos,
-                'rotation': rot,
-                'ned_position': [ned_x, ned_y, ned_z],
-                'ned_rotation': [ned_qw, ned_qx, ned_qy, ned_qz],
-                'gps_coords': [gps_lat, gps_lon, gps_alt] if gps_lat is not None else None,
-                'yaw_degrees': yaw_deg,
-                'data_no': self.data_No,
-                'time': official_timestamp
-            }
-
-            # データ番号をインクリメント
-            if new_id == 2:
-                self.data_No = self.data_No + 1
-
-            # IDが1と2のデータが揃ったらコンソール表示（簡略化）
-            if 1 in self.data_buffer and 2 in self.data_buffer:
-                self.data_buffer.clear()
+        self.__handle_rigid_body( new_id, pos, rot )
 
         rigid_body = MoCapData.RigidBody(new_id, pos, rot)
 
-        # Send information to any listener.
-        if self.rigid_body_listener is not None:
-            self.rigid_body_listener( new_id, pos, rot )
-
         # RB Marker Data処理（簡略化）
         if( major < 3 and major != 0) :
             if len(data) < offset + 4:
@@ -653,7 +1078,7 @@ class NatNetClient:
                         break
                     new_id_m = int.from_bytes( data[offset:offset+4], byteorder='little', signed=True )
                     offset += 4
-                    rb_marker_list[i].id=new_id_m
+                    rb_marker_list[i].id_num=new_id_m
 
                 # Marker sizes
                 for i in marker_count_range:
@@ -838,10 +1263,11 @@ class NatNetClient:
                 return offset, force_plate_data
             force_plate_count = int.from_bytes( data[offset:offset+4], byteorder='little', signed=True )
             offset += 4
-            if force_plate_count <= 0:
-                return offset, force_plate_data
+            # 4.1以降はプレート数0でもサイズフィールドが付く
             offset_tmp, unpackedDataSize = self.__unpack_data_size(data[offset:],major, minor)
             offset += offset_tmp
+            if force_plate_count <= 0:
+                return offset, force_plate_data
             for i in range( 0, force_plate_count ):
                 if len(data) < offset + 8:
                     break
@@ -948,42 +1374,40 @@ class NatNetClient:
         rel_offset, frame_prefix_data = self.__unpack_frame_prefix_data(data[offset:])
         offset += rel_offset
         mocap_data.set_prefix_data(frame_prefix_data)
-        frame_number = frame_prefix_data.frame_number
 
         #Markerset Data
         rel_offset, marker_set_data =self.__unpack_marker_set_data(data[offset:], (packet_size - offset),major, minor)
         offset += rel_offset
         mocap_data.set_marker_set_data(marker_set_data)
-        marker_set_count = marker_set_data.get_marker_set_count()
-        unlabeled_markers_count = marker_set_data.get_unlabeled_marker_count()
 
         # Legacy Other Markers
         rel_offset, legacy_other_markers =self.__unpack_legacy_other_markers(data[offset:], (packet_size - offset),major, minor)
         offset += rel_offset
         mocap_data.set_legacy_other_markers(legacy_other_markers)
-        marker_set_count = legacy_other_markers.get_marker_count()
-        legacy_other_markers_count = marker_set_data.get_unlabeled_marker_count()
 
         # Rigid Body Data
         rel_offset, rigid_body_data = self.__unpack_rigid_body_data(data[offset:], (packet_size - offset),major, minor)
         offset += rel_offset
         mocap_data.set_rigid_body_data(rigid_body_data)
-        rigid_body_count = rigid_body_data.get_rigid_body_count()
+        self.__flush_frame_egress()
 
         # Skeleton Data
         rel_offset, skeleton_data = self.__unpack_skeleton_data(data[offset:], (packet_size - offset),major, minor)
         offset += rel_offset
         mocap_data.set_skeleton_data(skeleton_data)
-        skeleton_count = skeleton_data.get_skeleton_count()
 
-        # Assets処理（簡略化）
+        # Assets処理（簡略化）: 4.1以降はサイズフィールドを使って読み飛ばす
         asset_count=0
+        if ( (major == 4) and (minor > 0) ) or (major > 4):
+            asset_count = int.from_bytes( data[offset:offset+4], byteorder='little', signed=True )
+            offset += 4
+            rel_offset, asset_data_size = self.__unpack_data_size(data[offset:],major, minor)
+            offset += rel_offset + asset_data_size
 
         # Labeled Marker Data
         rel_offset, labeled_marker_data = self.__unpack_labeled_marker_data(data[offset:], (packet_size - offset),major, minor)
         offset += rel_offset
         mocap_data.set_labeled_marker_data(labeled_marker_data)
-        labeled_marker_count = labeled_marker_data.get_labeled_marker_count()
 
         # Force Plate Data
         rel_offset, force_plate_data = self.__unpack_force_plate_data(data[offset:], (packet_size - offset),major, minor)
@@ -999,35 +1423,688 @@ class NatNetClient:
         rel_offset, frame_suffix_data = self.__unpack_frame_suffix_data(data[offset:], (packet_size - offset),major, minor)
         offset += rel_offset
         mocap_data.set_suffix_data(frame_suffix_data)
-        timecode = frame_suffix_data.timecode
-        timecode_sub= frame_suffix_data.timecode_sub
-        timestamp = frame_suffix_data.timestamp
-        is_recording = frame_suffix_data.is_recording
-        tracked_models_changed = frame_suffix_data.tracked_models_changed
         # 公式タイムスタンプを剛体記録用に一時保存
-        self.current_frame_timestamp = timestamp
+        self.current_frame_timestamp = frame_suffix_data.timestamp
+
+        # Send information to any listener.
+        if self.new_frame_listener is not None:
+            self.__notify_new_frame( mocap_data, asset_count )
+
+        return offset, mocap_data
+
+    # new_frame_listener へフレーム概要（MoCapData.FrameSummary）を通知
+    # 概要は毎フレーム同じオブジェクトを上書きするので、リスナーの外で使う場合は copy() する。
+    # decode_sections で読み飛ばしたセクション（None）の件数は 0、サフィックスの値は None
+    # new_frame_full_frame の場合はデコードしたフレーム（MoCapData / MoCapDataView）をそのまま渡す
+    def __notify_new_frame( self, mocap_data, asset_count ):
+        if self.new_frame_full_frame:
+            self.new_frame_listener( mocap_data )
+            return
+        self.new_frame_listener( self.__frame_summary.set_from_frame( mocap_data, asset_count ) )
+
+    # ---- オフセット方式デコーダ（decoder_mode = "offset"）----
+    # 受信バッファ全体を絶対オフセットで走査し、struct.unpack_from で直接読み出す。
+    # 各メソッドは (data, offset, ...) を受け取り、(次の絶対オフセット, オブジェクト) を返す。
+    # セクション・要素ごとの data[offset:] スライスやパケット残りのコピーは行わない。
+    # 生成したオブジェクトは新規なので、add_*() の deepcopy を通さずリストへ直接追加する。
+
+    def __decode_data_size( self, data, offset, major, minor):
+        size_in_bytes = 0
+        if( ( (major == 4) and (minor>0) ) or (major > 4)):
+            size_in_bytes, = Int32Value.unpack_from( data, offset )
+            offset += 4
+        return offset, size_in_bytes
+
+    # handle が False の場合は __handle_rigid_body を呼ばない（lazy_frames で走査時に処理済みの剛体）
+    def __decode_rigid_body( self, data, offset, major, minor, rb_num, handle=True):
+        new_id, = Int32Value.unpack_from( data, offset )
+        pos = Vector3.unpack_from( data, offset + 4 )
+        rot = Quaternion.unpack_from( data, offset + 16 )
+        offset += 32
+
+        trace_mf( "RB: %3.1d ID: %3.1d"% (rb_num, new_id))
+
+        if handle:
+            self.__handle_rigid_body( new_id, pos, rot )
+
+        rigid_body = MoCapData.RigidBody(new_id, pos, rot)
+
+        # RB Marker Data (NatNet 2.x)
+        if( major < 3 and major != 0) :
+            marker_count, = Int32Value.unpack_from( data, offset )
+            offset += 4
+            rb_marker_list = rigid_body.rb_marker_list
+            for i in range( 0, marker_count ):
+                rb_marker = MoCapData.RigidBodyMarker()
+                rb_marker.pos = Vector3.unpack_from( data, offset )
+                offset += 12
+                rb_marker_list.append(rb_marker)
+            if major >= 2:
+                for rb_marker in rb_marker_list:
+                    rb_marker.id_num, = Int32Value.unpack_from( data, offset )
+                    offset += 4
+                for rb_marker in rb_marker_list:
+                    rb_marker.size, = FloatValue.unpack_from( data, offset )
+                    offset += 4
+
+        if major >= 2 :
+            rigid_body.error, = FloatValue.unpack_from( data, offset )
+            offset += 4
+
+        # Version 2.6 and later
+        if ( ( major == 2 ) and ( minor >= 6 ) ) or major > 2 :
+            param, = Int16Value.unpack_from( data, offset )
+            offset += 2
+            rigid_body.tracking_valid = ( param & 0x01 ) != 0
+
+        return offset, rigid_body
+
+    # rigid_body_count 個の剛体を rigid_body_list に追加する
+    # subscription が指定された場合、含まれないIDの剛体は読み飛ばす
+    def __decode_rigid_body_list( self, data, offset, major, minor, layout, rigid_body_count, rigid_body_list, subscription=None, handle=True):
+        rigid_body_struct = layout.rigid_body
+        if rigid_body_struct is None:
+            # 固定長レイアウトが無いバージョン（2.x など）は逐次デコード
+            for rb_num in range( 0, rigid_body_count ):
+                if subscription is not None and Int32Value.unpack_from( data, offset )[0] not in subscription:
+                    offset = self.__walk_rigid_body_list( data, offset, major, minor, layout, 1 )
+                    continue
+                offset, rigid_body = self.__decode_rigid_body( data, offset, major, minor, rb_num, handle )
+                rigid_body_list.append(rigid_body)
+            return offset
+
+        unpack_from = rigid_body_struct.unpack_from
+        stride = rigid_body_struct.size
+        handle_rigid_body = self.__handle_rigid_body
+        RigidBody = MoCapData.RigidBody
+        for rb_num in range( 0, rigid_body_count ):
+            if subscription is not None and Int32Value.unpack_from( data, offset )[0] not in subscription:
+                offset += stride
+                continue
+            new_id, x, y, z, qx, qy, qz, qw, error, param = unpack_from( data, offset )
+            offset += stride
+            pos = (x, y, z)
+            rot = (qx, qy, qz, qw)
+            if handle:
+                handle_rigid_body( new_id, pos, rot )
+            rigid_body = RigidBody(new_id, pos, rot)
+            rigid_body.error = error
+            rigid_body.tracking_valid = ( param & 0x01 ) != 0
+            rigid_body_list.append(rigid_body)
+        return offset
+
+    def __decode_skeleton( self, data, offset, major, minor, layout, skeleton_num=0, handle=True):
+        new_id, = Int32Value.unpack_from( data, offset )
+        rigid_body_count, = Int32Value.unpack_from( data, offset + 4 )
+        offset += 8
+        skeleton = MoCapData.Skeleton(new_id)
+        offset = self.__decode_rigid_body_list( data, offset, major, minor, layout, rigid_body_count, skeleton.rigid_body_list, handle=handle )
+        return offset, skeleton
+
+    def __decode_marker_set_data( self, data, offset, major, minor):
+        marker_set_data=MoCapData.MarkerSetData()
+        marker_set_count, = Int32Value.unpack_from( data, offset )
+        offset += 4
+        offset, size_in_bytes = self.__decode_data_size( data, offset, major, minor )
+        data_len = len(data)
+        for i in range( 0, marker_set_count ):
+            marker_data = MoCapData.MarkerData()
+            model_name, offset = read_cstring( data, offset )
+            marker_data.set_model_name(model_name)
+            marker_count, = Int32Value.unpack_from( data, offset )
+            offset += 4
+            # 従来デコーダと同じく、異常なマーカー数や途切れたパケットは以降を読み捨てる
+            if (marker_count < 0) or (marker_count > 10000) or (data_len < offset + 12 * marker_count):
+                return data_len, marker_set_data
+            marker_pos_list = marker_data.marker_pos_list
+            for j in range( 0, marker_count ):
+                marker_pos_list.append( Vector3.unpack_from( data, offset ) )
+                offset += 12
+            marker_set_data.marker_data_list.append(marker_data)
+        return offset, marker_set_data
+
+    def __decode_legacy_other_markers( self, data, offset, major, minor):
+        other_marker_data = MoCapData.LegacyMarkerData()
+        other_marker_count, = Int32Value.unpack_from( data, offset )
+        offset += 4
+        offset, size_in_bytes = self.__decode_data_size( data, offset, major, minor )
+        marker_pos_list = other_marker_data.marker_pos_list
+        for j in range( 0, other_marker_count ):
+            marker_pos_list.append( Vector3.unpack_from( data, offset ) )
+            offset += 12
+        return offset, other_marker_data
+
+    # 剛体セクションを NumPy 構造化配列として一括デコード（decoder_mode = "numpy"）
+    def __decode_rigid_body_arrays( self, data, offset, layout, rigid_body_count, subscription, handle=True):
+        # 受信バッファは再利用されるため、レコード部分だけを一度コピーする
+        records = numpy.frombuffer( data, layout.rigid_body_dtype, rigid_body_count, offset )
+        offset += rigid_body_count * layout.rigid_body.size
+        if subscription is not None:
+            # 購読対象外の剛体を除外（ブールインデックスなのでコピーを兼ねる）
+            records = records[ id_mask( records['id'], subscription ) ]
+            rigid_body_count = len(records)
+        else:
+            records = records.copy()
+        rigid_body_arrays = MoCapData.RigidBodyArrays(records)
+        if not handle:
+            return offset, rigid_body_arrays
+
+        # 記録中・履歴あり・リスナー設定時は全剛体、それ以外はUDP送信対象の剛体のみ個別処理
+        if self.is_recording or self.frame_history is not None or self.rigid_body_listener is not None:
+            indices = range( rigid_body_count )
+        else:
+            indices = numpy.flatnonzero( id_mask( rigid_body_arrays.id, self.udp_targets ) ).tolist()
+        rb_ids = rigid_body_arrays.id
+        rb_pos = rigid_body_arrays.pos
+        rb_rot = rigid_body_arrays.rot
+        fields_by_index = self.__convert_rigid_body_fields( rb_ids, rb_pos, rb_rot )
+        for i in indices:
+            self.__handle_rigid_body( int(rb_ids[i]), tuple(rb_pos[i].tolist()), tuple(rb_rot[i].tolist()), fields_by_index.get(i) )
+        return offset, rigid_body_arrays
+
+    # UDP送信対象の剛体が変換器の batch_min_count 個以上なら、送信フィールドへの変換を1回の NumPy 呼び出しで行い
+    # {行番号: (lat_e7, lon_e7, alt_mm, yaw_cdeg)} を返す。少ない場合は剛体毎に変換するほうが速いので空
+    def __convert_rigid_body_fields( self, rb_ids, rb_pos, rb_rot ):
+        batch_min_count = self.geo.batch_min_count
+        if len(self.udp_targets) < batch_min_count:
+            return {}
+        target_indices = numpy.flatnonzero( id_mask( rb_ids, self.udp_targets ) )
+        if len(target_indices) < batch_min_count:
+            return {}
+        lat_e7, lon_e7, alt_mm, yaw_cdeg, valid = self.motive_to_fields_array( rb_pos[target_indices], rb_rot[target_indices] )
+        # 位置が有限でない剛体は含めない（__handle_rigid_body で剛体毎に変換し、エラーを表示する）
+        return { i: fields for i, fields, is_valid in
+                 zip( target_indices.tolist(), zip( lat_e7.tolist(), lon_e7.tolist(), alt_mm.tolist(), yaw_cdeg.tolist() ), valid.tolist() )
+                 if is_valid }
+
+    # layout / decoder_mode / subscription はフレームを受信した時点の値（lazy_frames ではビューが保持する）
+    def __decode_rigid_body_data( self, data, offset, major, minor, layout, decoder_mode, subscription, handle=True):
+        rigid_body_count, = Int32Value.unpack_from( data, offset )
+        offset += 4
+        offset, size_in_bytes = self.__decode_data_size( data, offset, major, minor )
+        if decoder_mode == "numpy" and layout.rigid_body_dtype is not None and rigid_body_count > 0:
+            return self.__decode_rigid_body_arrays( data, offset, layout, rigid_body_count, subscription, handle )
+        rigid_body_data = MoCapData.RigidBodyData()
+        offset = self.__decode_rigid_body_list( data, offset, major, minor, layout, rigid_body_count, rigid_body_data.rigid_body_list,
+                                                subscription, handle )
+        return offset, rigid_body_data
+
+    def __decode_skeleton_data( self, data, offset, major, minor, layout, handle=True):
+        skeleton_data = MoCapData.SkeletonData()
+        if( ( major == 2 and minor > 0 ) or major > 2 ):
+            skeleton_count, = Int32Value.unpack_from( data, offset )
+            offset += 4
+            offset, size_in_bytes = self.__decode_data_size( data, offset, major, minor )
+            for skeleton_num in range( 0, skeleton_count ):
+                offset, skeleton = self.__decode_skeleton( data, offset, major, minor, layout, skeleton_num, handle )
+                skeleton_data.skeleton_list.append(skeleton)
+        return offset, skeleton_data
+
+    # Asset Data (NatNet 4.1+)
+    def __decode_asset_data( self, data, offset, major, minor):
+        asset_data = MoCapData.AssetData()
+        asset_count, = Int32Value.unpack_from( data, offset )
+        offset += 4
+        offset, size_in_bytes = self.__decode_data_size( data, offset, major, minor )
+        for asset_num in range( 0, asset_count ):
+            asset = MoCapData.Asset()
+            asset_id, = Int32Value.unpack_from( data, offset )
+            asset.set_id(asset_id)
+            rigid_body_count, = Int32Value.unpack_from( data, offset + 4 )
+            offset += 8
+            for rb_num in range( 0, rigid_body_count ):
+                rb_id, x, y, z, qx, qy, qz, qw, mean_error, param = AssetRigidBody.unpack_from( data, offset )
+                offset += AssetRigidBody.size
+                asset.rigid_body_list.append( MoCapData.AssetRigidBodyData( rb_id, (x, y, z), (qx, qy, qz, qw), mean_error, param ) )
+            marker_count, = Int32Value.unpack_from( data, offset )
+            offset += 4
+            for marker_num in range( 0, marker_count ):
+                marker_id, x, y, z, size, param, residual = AssetMarker.unpack_from( data, offset )
+                offset += AssetMarker.size
+                asset.marker_list.append( MoCapData.AssetMarkerData( marker_id, (x, y, z), size, param, residual ) )
+            asset_data.asset_list.append(asset)
+        return offset, asset_data
+
+    def __decode_labeled_marker_data( self, data, offset, major, minor, layout, decoder_mode):
+        labeled_marker_data = MoCapData.LabeledMarkerData()
+        if( ( major == 2 and minor > 3 ) or major > 2 ):
+            labeled_marker_count, = Int32Value.unpack_from( data, offset )
+            offset += 4
+            offset, size_in_bytes = self.__decode_data_size( data, offset, major, minor )
+            if decoder_mode == "numpy" and layout.labeled_marker_dtype is not None and labeled_marker_count > 0:
+                records = numpy.frombuffer( data, layout.labeled_marker_dtype, labeled_marker_count, offset ).copy()
+                offset += labeled_marker_count * layout.labeled_marker.size
+                return offset, MoCapData.LabeledMarkerArrays(records)
+            labeled_marker_list = labeled_marker_data.labeled_marker_list
+            labeled_marker_struct = layout.labeled_marker
+            if labeled_marker_struct is not None:
+                unpack_from = labeled_marker_struct.unpack_from
+                stride = labeled_marker_struct.size
+                LabeledMarker = MoCapData.LabeledMarker
+                for lm_num in range( 0, labeled_marker_count ):
+                    tmp_id, x, y, z, size, param, residual = unpack_from( data, offset )
+                    offset += stride
+                    labeled_marker_list.append( LabeledMarker(tmp_id, (x, y, z), size, param, residual * 1000.0) )
+                return offset, labeled_marker_data
+            # 固定長レイアウトが無いバージョン（2.x）は逐次デコード
+            for lm_num in range( 0, labeled_marker_count ):
+                tmp_id, = Int32Value.unpack_from( data, offset )
+                pos = Vector3.unpack_from( data, offset + 4 )
+                size, = FloatValue.unpack_from( data, offset + 16 )
+                offset += 20
+                param = 0
+                if( ( major == 2 and minor >= 6 ) or major > 2):
+                    param, = Int16Value.unpack_from( data, offset )
+                    offset += 2
+                residual = 0.0
+                if major >= 3 :
+                    residual, = FloatValue.unpack_from( data, offset )
+                    offset += 4
+                    residual = residual * 1000.0
+                labeled_marker_list.append( MoCapData.LabeledMarker(tmp_id,pos,size,param, residual) )
+        return offset, labeled_marker_data
+
+    def __decode_force_plate_data( self, data, offset, major, minor):
+        force_plate_data = MoCapData.ForcePlateData()
+        if( ( major == 2 and minor >= 9 ) or major > 2 ):
+            force_plate_count, = Int32Value.unpack_from( data, offset )
+            offset += 4
+            offset, size_in_bytes = self.__decode_data_size( data, offset, major, minor )
+            for i in range( 0, force_plate_count ):
+                force_plate_id, = Int32Value.unpack_from( data, offset )
+                force_plate = MoCapData.ForcePlate(force_plate_id)
+                force_plate_channel_count, = Int32Value.unpack_from( data, offset + 4 )
+                offset += 8
+                for j in range( force_plate_channel_count ):
+                    fp_channel_data = MoCapData.ForcePlateChannelData()
+                    frame_count, = Int32Value.unpack_from( data, offset )
+                    offset += 4
+                    frame_list = fp_channel_data.frame_list
+                    for k in range( frame_count ):
+                        frame_list.append( FloatValue.unpack_from( data, offset )[0] )
+                        offset += 4
+                    force_plate.channel_data_list.append(fp_channel_data)
+                force_plate_data.force_plate_list.append(force_plate)
+        return offset, force_plate_data
+
+    def __decode_device_data( self, data, offset, major, minor):
+        device_data = MoCapData.DeviceData()
+        if ( major == 2 and minor >= 11 ) or (major > 2) :
+            device_count, = Int32Value.unpack_from( data, offset )
+            offset += 4
+            offset, size_in_bytes = self.__decode_data_size( data, offset, major, minor )
+            for i in range( 0, device_count ):
+                device_id, = Int32Value.unpack_from( data, offset )
+                device = MoCapData.Device(device_id)
+                device_channel_count, = Int32Value.unpack_from( data, offset + 4 )
+                offset += 8
+                for j in range( 0, device_channel_count ):
+                    device_channel_data = MoCapData.DeviceChannelData()
+                    frame_count, = Int32Value.unpack_from( data, offset )
+                    offset += 4
+                    frame_list = device_channel_data.frame_list
+                    for k in range( 0, frame_count ):
+                        frame_list.append( FloatValue.unpack_from( data, offset )[0] )
+                        offset += 4
+                    device.channel_data_list.append(device_channel_data)
+                device_data.device_list.append(device)
+        return offset, device_data
+
+    def __decode_frame_suffix_data( self, data, offset, end, major, minor, layout):
+        frame_suffix_data = MoCapData.FrameSuffixData()
+        if offset + layout.timecode.size >= end:
+            # timecode のみ（timestamp 以降なし）
+            frame_suffix_data.timecode, frame_suffix_data.timecode_sub = layout.timecode.unpack_from( data, offset )
+            return offset + layout.timecode.size, frame_suffix_data
+        values = layout.frame_suffix.unpack_from( data, offset )
+        offset += layout.frame_suffix.size
+        for field_name, value in zip( layout.frame_suffix_fields, values ):
+            setattr( frame_suffix_data, field_name, value )
+        param = frame_suffix_data.param
+        frame_suffix_data.is_recording = ( param & 0x01 ) != 0
+        frame_suffix_data.tracked_models_changed = ( param & 0x02 ) != 0
+        return offset, frame_suffix_data
+
+    # ---- セクション読み飛ばし（decode_sections）----
+    # オブジェクトを生成せずに次のセクション先頭の絶対オフセットを返す。
+    # 4.1以降は件数の後のバイト数で一気に飛ばし、それより古いバージョンは件数を辿って歩く。
+
+    def __skip_section( self, data, offset, major, minor, walk):
+        if self.__frame_layout.has_size_fields:
+            count, size_in_bytes = SectionHeader.unpack_from( data, offset )
+            return offset + SectionHeader.size + size_in_bytes
+        return walk( data, offset, major, minor )
+
+    def __walk_marker_sets( self, data, offset, major, minor):
+        marker_set_count, = Int32Value.unpack_from( data, offset )
+        offset += 4
+        data_len = len(data)
+        for i in range( 0, marker_set_count ):
+            model_name, offset = read_cstring( data, offset )
+            marker_count, = Int32Value.unpack_from( data, offset )
+            offset += 4
+            if (marker_count < 0) or (marker_count > 10000) or (data_len < offset + 12 * marker_count):
+                return data_len
+            offset += 12 * marker_count
+        return offset
+
+    def __walk_legacy_markers( self, data, offset, major, minor):
+        other_marker_count, = Int32Value.unpack_from( data, offset )
+        return offset + 4 + 12 * other_marker_count
+
+    def __walk_rigid_body_list( self, data, offset, major, minor, layout, rigid_body_count):
+        if layout.rigid_body is not None:
+            return offset + rigid_body_count * layout.rigid_body.size
+        for rb_num in range( 0, rigid_body_count ):
+            offset += 32
+            # RB Marker Data (NatNet 2.x)
+            if( major < 3 and major != 0) :
+                marker_count, = Int32Value.unpack_from( data, offset )
+                offset += 4 + 12 * marker_count
+                if major >= 2:
+                    offset += 8 * marker_count
+            if major >= 2 :
+                offset += 4
+            if ( ( major == 2 ) and ( minor >= 6 ) ) or major > 2 :
+                offset += 2
+        return offset
+
+    def __walk_rigid_bodies( self, data, offset, major, minor):
+        rigid_body_count, = Int32Value.unpack_from( data, offset )
+        return self.__walk_rigid_body_list( data, offset + 4, major, minor, self.__frame_layout, rigid_body_count )
+
+    def __walk_skeletons( self, data, offset, major, minor):
+        if( ( major == 2 and minor > 0 ) or major > 2 ):
+            skeleton_count, = Int32Value.unpack_from( data, offset )
+            offset += 4
+            for skeleton_num in range( 0, skeleton_count ):
+                rigid_body_count, = Int32Value.unpack_from( data, offset + 4 )
+                offset = self.__walk_rigid_body_list( data, offset + 8, major, minor, self.__frame_layout, rigid_body_count )
+        return offset
+
+    def __walk_labeled_markers( self, data, offset, major, minor):
+        if( ( major == 2 and minor > 3 ) or major > 2 ):
+            labeled_marker_count, = Int32Value.unpack_from( data, offset )
+            stride = 20
+            if( ( major == 2 and minor >= 6 ) or major > 2):
+                stride += 2
+            if major >= 3 :
+                stride += 4
+            offset += 4 + stride * labeled_marker_count
+        return offset
+
+    # Force plates / devices: id, channel count, channels (frame count + floats)
+    def __walk_channel_objects( self, data, offset, major, minor):
+        object_count, = Int32Value.unpack_from( data, offset )
+        offset += 4
+        for i in range( 0, object_count ):
+            channel_count, = Int32Value.unpack_from( data, offset + 4 )
+            offset += 8
+            for j in range( 0, channel_count ):
+                frame_count, = Int32Value.unpack_from( data, offset )
+                offset += 4 + 4 * frame_count
+        return offset
+
+    def __walk_force_plates( self, data, offset, major, minor):
+        if( ( major == 2 and minor >= 9 ) or major > 2 ):
+            offset = self.__walk_channel_objects( data, offset, major, minor )
+        return offset
+
+    def __walk_devices( self, data, offset, major, minor):
+        if ( major == 2 and minor >= 11 ) or (major > 2) :
+            offset = self.__walk_channel_objects( data, offset, major, minor )
+        return offset
+
+    # ---- 遅延デコード（lazy_frames）----
+    # フレームを1回走査して各セクションの先頭オフセットと件数を記録し、MoCapData.MoCapDataView を返す。
+    # セクションのオブジェクトは参照された時に __decode_section で生成する。
+    # 剛体とスケルトンのボーンは送信・記録のため走査時に __handle_rigid_body へ渡す（numpy デコーダの
+    # 剛体配列は一括変換に使うので、そのままビューに格納する）。
+    # 受信バッファは再利用されるため、パケットを bytes に1回コピーしてビューに持たせる。
+    # 後からのデコードがその時点のバージョン・購読対象に左右されないよう、走査時のレイアウト
+    # （major / minor を含む）・decoder_mode・rigid_body_subscription をビューの decode_state に保持する。
+
+    def __decode_mocap_view( self, data, offset, packet_size, major, minor):
+        end = offset + packet_size
+        data = bytes( data[:end] )
+        frame_number, = Int32Value.unpack_from( data, offset )
+        offset += 4
+        layout = self.__frame_layout
+        decode_state = ( layout, self.decoder_mode, self.rigid_body_subscription )
+        mocap_data = MoCapData.MoCapDataView( data, MoCapData.FramePrefixData(frame_number), {}, {}, self.__decode_section, decode_state )
+        section_offsets = mocap_data.section_offsets
+        section_counts = mocap_data.section_counts
+        sections = self.decode_sections
+        counted_sections = layout.counted_sections
+        skip_section = self.__skip_section
+
+        for section_name, walk in self.__frame_section_walkers:
+            # Asset Data は NatNet 4.1 以降のみ
+            if section_name == "assets" and not layout.has_size_fields:
+                continue
+            if not ( sections is None or section_name in sections ):
+                offset = skip_section( data, offset, major, minor, walk )
+                continue
+            section_offsets[section_name] = offset
+            if section_name in counted_sections:
+                section_counts[section_name], = Int32Value.unpack_from( data, offset )
+            if section_name == "rigid_bodies":
+                offset = self.__handle_rigid_body_section( data, offset, major, minor, mocap_data )
+                self.__flush_frame_egress()
+            elif section_name == "skeletons":
+                offset = self.__handle_skeleton_section( data, offset, major, minor, layout )
+            else:
+                offset = skip_section( data, offset, major, minor, walk )
+
+        if offset > end:
+            raise ValueError( "frame sections end at %d, beyond the packet (%d bytes)"%( offset, end ) )
+
+        # Frame Suffix Data
+        if sections is None or "suffix" in sections:
+            section_offsets["suffix"] = offset
+            # 公式タイムスタンプを剛体記録用に一時保存
+            self.current_frame_timestamp = mocap_data.suffix_data.timestamp
+
+        # Send information to any listener.
+        if self.new_frame_listener is not None:
+            self.__notify_new_frame( mocap_data, mocap_data.get_count( "assets" ) )
+
+        return end, mocap_data
+
+    # 剛体セクションの剛体を __handle_rigid_body に渡し、ビューの件数を購読対象の剛体数にする
+    def __handle_rigid_body_section( self, data, offset, major, minor, mocap_data ):
+        layout, decoder_mode, subscription = mocap_data.decode_state
+        rigid_body_count, = Int32Value.unpack_from( data, offset )
+        if decoder_mode == "numpy" and layout.rigid_body_dtype is not None and rigid_body_count > 0:
+            offset, rigid_body_data = self.__decode_rigid_body_data( data, offset, major, minor, layout, decoder_mode, subscription )
+            mocap_data.rigid_body_data = rigid_body_data
+            mocap_data.section_counts["rigid_bodies"] = rigid_body_data.get_rigid_body_count()
+            return offset
+        offset, size_in_bytes = self.__decode_data_size( data, offset + 4, major, minor )
+        offset, handled_count = self.__handle_rigid_body_list( data, offset, major, minor, layout, rigid_body_count, subscription )
+        mocap_data.section_counts["rigid_bodies"] = handled_count
+        return offset
+
+    def __handle_skeleton_section( self, data, offset, major, minor, layout ):
+        if( ( major == 2 and minor > 0 ) or major > 2 ):
+            skeleton_count, = Int32Value.unpack_from( data, offset )
+            offset, size_in_bytes = self.__decode_data_size( data, offset + 4, major, minor )
+            for skeleton_num in range( 0, skeleton_count ):
+                rigid_body_count, = Int32Value.unpack_from( data, offset + 4 )
+                offset, handled_count = self.__handle_rigid_body_list( data, offset + 8, major, minor, layout, rigid_body_count )
+        return offset
+
+    # 剛体をオブジェクトにせず __handle_rigid_body に渡し、(次のオフセット, 渡した剛体数) を返す
+    def __handle_rigid_body_list( self, data, offset, major, minor, layout, rigid_body_count, subscription=None):
+        rigid_body_struct = layout.rigid_body
+        if rigid_body_struct is None:
+            # 固定長レイアウトが無いバージョン（2.x など）は通常のデコードで処理する
+            rigid_body_list = []
+            offset = self.__decode_rigid_body_list( data, offset, major, minor, layout, rigid_body_count, rigid_body_list, subscription )
+            return offset, len(rigid_body_list)
+
+        unpack_from = rigid_body_struct.unpack_from
+        stride = rigid_body_struct.size
+        handle_rigid_body = self.__handle_rigid_body
+        handled_count = 0
+        for rb_num in range( 0, rigid_body_count ):
+            new_id, x, y, z, qx, qy, qz, qw, error, param = unpack_from( data, offset )
+            offset += stride
+            if subscription is not None and new_id not in subscription:
+                continue
+            handle_rigid_body( new_id, (x, y, z), (qx, qy, qz, qw) )
+            handled_count += 1
+        return offset, handled_count
+
+    # MoCapDataView のセクションを初めて参照された時に、走査時の decode_state でデコードする。
+    # 剛体・ボーンは走査時に処理済みなので __handle_rigid_body は呼ばない
+    def __decode_section( self, section_name, data, offset, decode_state ):
+        layout, decoder_mode, subscription = decode_state
+        major = layout.major
+        minor = layout.minor
+        if section_name == "marker_sets":
+            offset, section_data = self.__decode_marker_set_data( data, offset, major, minor )
+        elif section_name == "legacy_markers":
+            offset, section_data = self.__decode_legacy_other_markers( data, offset, major, minor )
+        elif section_name == "rigid_bodies":
+            offset, section_data = self.__decode_rigid_body_data( data, offset, major, minor, layout, decoder_mode, subscription, handle=False )
+        elif section_name == "skeletons":
+            offset, section_data = self.__decode_skeleton_data( data, offset, major, minor, layout, handle=False )
+        elif section_name == "assets":
+            offset, section_data = self.__decode_asset_data( data, offset, major, minor )
+        elif section_name == "labeled_markers":
+            offset, section_data = self.__decode_labeled_marker_data( data, offset, major, minor, layout, decoder_mode )
+        elif section_name == "force_plates":
+            offset, section_data = self.__decode_force_plate_data( data, offset, major, minor )
+        elif section_name == "devices":
+            offset, section_data = self.__decode_device_data( data, offset, major, minor )
+        else:
+            offset, section_data = self.__decode_frame_suffix_data( data, offset, len(data), major, minor, layout )
+        return section_data
+
+    # data はパケット全体（ヘッダ含む）、offset はフレームデータ先頭の絶対位置
+    def __decode_mocap_data( self, data, offset, packet_size, major, minor):
+        mocap_data = MoCapData.MoCapData()
+        end = offset + packet_size
+
+        #Frame Prefix Data
+        frame_number, = Int32Value.unpack_from( data, offset )
+        offset += 4
+        mocap_data.set_prefix_data(MoCapData.FramePrefixData(frame_number))
+
+        # decode_sections に含まれないセクションは読み飛ばし、MoCapData 側は None のままにする
+        sections = self.decode_sections
+        skip_section = self.__skip_section
+        layout = self.__frame_layout
+
+        #Markerset Data
+        if sections is None or "marker_sets" in sections:
+            offset, marker_set_data = self.__decode_marker_set_data( data, offset, major, minor )
+            mocap_data.set_marker_set_data(marker_set_data)
+        else:
+            offset = skip_section( data, offset, major, minor, self.__walk_marker_sets )
+
+        # Legacy Other Markers
+        if sections is None or "legacy_markers" in sections:
+            offset, legacy_other_markers = self.__decode_legacy_other_markers( data, offset, major, minor )
+            mocap_data.set_legacy_other_markers(legacy_other_markers)
+        else:
+            offset = skip_section( data, offset, major, minor, self.__walk_legacy_markers )
+
+        # Rigid Body Data
+        if sections is None or "rigid_bodies" in sections:
+            offset, rigid_body_data = self.__decode_rigid_body_data( data, offset, major, minor, layout, self.decoder_mode,
+                                                                     self.rigid_body_subscription )
+            mocap_data.set_rigid_body_data(rigid_body_data)
+            self.__flush_frame_egress()
+        else:
+            offset = skip_section( data, offset, major, minor, self.__walk_rigid_bodies )
+
+        # Skeleton Data
+        if sections is None or "skeletons" in sections:
+            offset, skeleton_data = self.__decode_skeleton_data( data, offset, major, minor, layout )
+            mocap_data.set_skeleton_data(skeleton_data)
+        else:
+            offset = skip_section( data, offset, major, minor, self.__walk_skeletons )
+
+        # Asset Data (NatNet 4.1+)
+        asset_count = 0
+        if ( (major == 4) and (minor > 0) ) or (major > 4):
+            if sections is None or "assets" in sections:
+                offset, asset_data = self.__decode_asset_data( data, offset, major, minor )
+                mocap_data.set_asset_data(asset_data)
+                asset_count = asset_data.get_asset_count()
+            else:
+                offset = skip_section( data, offset, major, minor, None )
+
+        # Labeled Marker Data
+        if sections is None or "labeled_markers" in sections:
+            offset, labeled_marker_data = self.__decode_labeled_marker_data( data, offset, major, minor, layout, self.decoder_mode )
+            mocap_data.set_labeled_marker_data(labeled_marker_data)
+        else:
+            offset = skip_section( data, offset, major, minor, self.__walk_labeled_markers )
+
+        # Force Plate Data
+        if sections is None or "force_plates" in sections:
+            offset, force_plate_data = self.__decode_force_plate_data( data, offset, major, minor )
+            mocap_data.set_force_plate_data(force_plate_data)
+        else:
+            offset = skip_section( data, offset, major, minor, self.__walk_force_plates )
+
+        # Device Data
+        if sections is None or "devices" in sections:
+            offset, device_data = self.__decode_device_data( data, offset, major, minor )
+            mocap_data.set_device_data(device_data)
+        else:
+            offset = skip_section( data, offset, major, minor, self.__walk_devices )
+
+        # Frame Suffix Data
+        if sections is None or "suffix" in sections:
+            offset, frame_suffix_data = self.__decode_frame_suffix_data( data, offset, end, major, minor, layout )
+            mocap_data.set_suffix_data(frame_suffix_data)
+            # 公式タイムスタンプを剛体記録用に一時保存
+            self.current_frame_timestamp = frame_suffix_data.timestamp
+        else:
+            offset = end
 
         # Send information to any listener.
         if self.new_frame_listener is not None:
-            data_dict={}
-            data_dict["frame_number"]=frame_number
-            data_dict[ "marker_set_count"] = marker_set_count
-            data_dict[ "unlabeled_markers_count"] = unlabeled_markers_count
-            data_dict[ "rigid_body_count"] = rigid_body_count
-            data_dict[ "skeleton_count"] =skeleton_count
-            data_dict[ "asset_count"] =asset_count
-            data_dict[ "labeled_marker_count"] = labeled_marker_count
-            data_dict[ "timecode"] = timecode
-            data_dict[ "timecode_sub"] = timecode_sub
-            data_dict[ "timestamp"] = timestamp
-            data_dict[ "is_recording"] = is_recording
-            data_dict[ "tracked_models_changed"] = tracked_models_changed
-
-            self.new_frame_listener( data_dict )
+            self.__notify_new_frame( mocap_data, asset_count )
 
         return offset, mocap_data
 
-    def __process_message( self, data : bytes, print_level=0):
+    def __record_frame_stats( self, frame_number, receive_time_ns ):
+        self.frame_stats.record( frame_number, receive_time_ns )
+        if self.stats_interval_sec > 0:
+            if self.__last_stats_report_ns is None:
+                self.__last_stats_report_ns = receive_time_ns
+            elif receive_time_ns - self.__last_stats_report_ns >= self.stats_interval_sec * 1e9:
+                summary_line = self.frame_stats.get_summary_line( receive_time_ns ) +\
+                    " | udp sent %d err %d"%self.get_udp_counts() +\
+                    " | targets ok %d/%d"%( list( self.get_target_health().values() ).count( "ok" ), len( self.target_health ) )
+                if self.latency_tracer is not None:
+                    egress_percentiles = self.latency_tracer.get_percentiles( "egress", (50, 99) )
+                    if egress_percentiles is not None:
+                        summary_line += " | egress p50 %.2f ms p99 %.2f ms"%( egress_percentiles[0] / 1e6, egress_percentiles[1] / 1e6 )
+                print( summary_line )
+                self.frame_stats.reset_window( receive_time_ns )
+                self.__last_stats_report_ns = receive_time_ns
+
+    # サーバ側の時刻（suffix の stamp_*）から Motive 内部遅延とネットワーク遅延を記録する
+    def __trace_server_latency( self, suffix_data, receive_time_ns ):
+        frequency = self.__server_clock_frequency
+        if suffix_data is None or frequency <= 0 or\
+           suffix_data.stamp_transmit == -1 or suffix_data.stamp_camera_mid_exposure == -1:
+            return
+        tracer = self.latency_tracer
+        tracer.add( "motive", ( suffix_data.stamp_transmit - suffix_data.stamp_camera_mid_exposure ) * 1000000000 // frequency )
+        # 時計は同期していないので、受信時刻 - 送信時刻 の最小値をオフセットとみなし、そこからの増分を記録する
+        offset_ns = receive_time_ns - suffix_data.stamp_transmit * 1000000000 // frequency
+        tracer.add( "network", offset_ns - self.clock_offset.update( offset_ns, receive_time_ns ) )
+
+    # data は bytes または受信バッファの memoryview。デコード結果は data を参照しない
+    # receive_time_ns は受信直後の time.perf_counter_ns()（省略時は現在時刻）
+    def __process_message( self, data : bytes, print_level=0, receive_time_ns=None):
         major = self.get_major()
         minor = self.get_minor()
 
@@ -1036,8 +2113,37 @@ class NatNetClient:
         offset = 4
 
         if message_id == self.NAT_FRAMEOFDATA :
-            offset_tmp, mocap_data = self.__unpack_mocap_data( data[offset:], packet_size, major, minor )
-            offset += offset_tmp
+            if receive_time_ns is None:
+                receive_time_ns = time.perf_counter_ns()
+            if len(data) >= offset + 4:
+                self.__frame_number = Int32Value.unpack_from( data, offset )[0]
+                self.__record_frame_stats( self.__frame_number, receive_time_ns )
+            tracer = self.latency_tracer
+            if tracer is not None:
+                decode_start_ns = time.perf_counter_ns()
+                tracer.add( "queue", decode_start_ns - receive_time_ns )
+                self.__frame_receive_time_ns = receive_time_ns
+            if self.decoder_mode == "legacy":
+                offset_tmp, mocap_data = self.__unpack_mocap_data( data[offset:], packet_size, major, minor )
+                offset += offset_tmp
+            else:
+                try:
+                    if self.lazy_frames:
+                        offset, mocap_data = self.__decode_mocap_view( data, offset, packet_size, major, minor )
+                    else:
+                        offset, mocap_data = self.__decode_mocap_data( data, offset, packet_size, major, minor )
+                except (struct.error, ValueError) as msg:
+                    # 途中で途切れたフレームは破棄（それまでに処理した剛体は送信済み）
+                    trace_mf( "Truncated frame of data: %s"% msg )
+                    mocap_data = None
+            # スケルトンのボーンなど、剛体セクション以降に溜まったレコード（途切れたフレームの分を含む）
+            self.__flush_frame_egress()
+            if tracer is not None:
+                tracer.add( "decode", time.perf_counter_ns() - decode_start_ns )
+                if mocap_data is not None:
+                    self.__trace_server_latency( mocap_data.suffix_data, receive_time_ns )
+            if (mocap_data is not None) and (self.mocap_data_listener is not None):
+                self.mocap_data_listener( mocap_data )
 
         elif message_id == self.NAT_MODELDEF :
             pass
@@ -1097,6 +2203,11 @@ class NatNetClient:
         self.__nat_net_stream_version_server[2]=nnsvs[2]
         self.__nat_net_stream_version_server[3]=nnsvs[3]
 
+        # High resolution clock frequency (NatNet 3.0+)。suffix の stamp_* の単位
+        if (nnsvs[0] >= 3) and (len(data) >= offset + 8):
+            self.__server_clock_frequency = struct.unpack_from( '<Q', data, offset )[0]
+            offset += 8
+
         if (self.__nat_net_requested_version[0] == 0) and\
            (self.__nat_net_requested_version[1] == 0):
             print("resetting requested version to %d %d %d %d from %d %d %d %d"%(
@@ -1113,6 +2224,7 @@ class NatNetClient:
             self.__nat_net_requested_version[1] = self.__nat_net_stream_version_server[1]
             self.__nat_net_requested_version[2] = self.__nat_net_stream_version_server[2]
             self.__nat_net_requested_version[3] = self.__nat_net_stream_version_server[3]
+            self.__update_frame_layout()
 
         # Determine if the bitstream version can be changed
         if (self.__nat_net_stream_version_server[0] >= 4) and (self.use_multicast == False):
@@ -1122,7 +2234,8 @@ class NatNetClient:
 
     def __unpack_bitstream_info(self, data, packet_size, major, minor):
         nn_version=[]
-        inString = data.decode('utf-8')
+        message, separator, remainder = bytes(data).partition( b'\0' )
+        inString = message.decode('utf-8')
         messageList = inString.split(',')
 
         if( len(messageList) > 1 ):
@@ -1137,12 +2250,14 @@ class NatNetClient:
         if not self.use_multicast:
             in_socket.settimeout(2.0)
 
-        data=bytearray(0)
         recv_buffer_size=64*1024
+        buffer_pool = FrameRing.ReceiveBufferPool( 4, recv_buffer_size )
 
         while not stop():
+            buffer = buffer_pool.get_next_buffer()
+            nbytes = 0
             try:
-                data, addr = in_socket.recvfrom( recv_buffer_size )
+                nbytes, addr = in_socket.recvfrom_into( buffer )
             except socket.error as msg:
                 if stop():
                     break
@@ -1160,7 +2275,9 @@ class NatNetClient:
                     print("ERROR: command socket access timeout occurred. Server not responding")
                     return 4
 
-            if len( data ) > 0 :
+            if nbytes > 0 :
+                # 受信した長さ分の memoryview をそのままデコーダに渡す（コピーなし）
+                data = buffer[:nbytes]
                 message_id = get_message_id(data)
                 tmp_str="mi_%1.1d"%message_id
                 if tmp_str not in message_id_dict:
@@ -1174,7 +2291,6 @@ class NatNetClient:
                         else:
                             print_level = 0
                 message_id = self.__process_message( data , print_level)
-                data=bytearray(0)
 
             if not self.use_multicast:
                 if not stop():
@@ -1184,12 +2300,25 @@ class NatNetClient:
 
     def __data_thread_function( self, in_socket, stop, gprint_level):
         message_id_dict={}
-        data=bytearray(0)
         recv_buffer_size=64*1024
+        buffer_pool = FrameRing.ReceiveBufferPool( 4, recv_buffer_size )
+        batch_receiver = None
+        if self.receive_backend == "recvmmsg":
+            batch_receiver = BatchSocket.BatchReceiver( in_socket, self.receive_batch_size, recv_buffer_size )
+            self.batch_receiver = batch_receiver
 
         while not stop():
+            datagrams = ()
             try:
-                data, addr = in_socket.recvfrom( recv_buffer_size )
+                if batch_receiver is not None:
+                    # 溜まっているデータグラムをまとめて受信し、順にデコードする（受信時刻はバッチ共通）
+                    datagrams = batch_receiver.receive()
+                else:
+                    buffer = buffer_pool.get_next_buffer()
+                    nbytes, addr = in_socket.recvfrom_into( buffer )
+                    # 受信した長さ分の memoryview をそのままデコーダに渡す（コピーなし）
+                    datagrams = ( buffer[:nbytes], )
+                receive_time_ns = time.perf_counter_ns()
             except socket.error as msg:
                 if not stop():
                     print(f"ERROR: data socket access error occurred: {msg}")
@@ -1204,7 +2333,9 @@ class NatNetClient:
                 print("ERROR: data socket access timeout occurred. Server not responding")
                 return 4
 
-            if len( data ) > 0 :
+            for data in datagrams:
+                if len( data ) == 0 :
+                    continue
                 message_id = get_message_id(data)
                 tmp_str="mi_%1.1d"%message_id
                 if tmp_str not in message_id_dict:
@@ -1217,9 +2348,73 @@ class NatNetClient:
                             print_level = 1
                         else:
                             print_level = 0
-                message_id = self.__process_message( data , print_level)
-                data=bytearray(0)
+                message_id = self.__process_message( data , print_level, receive_time_ns)
+
+        return 0
+
+    # ---- 受信パイプライン（receive_pipeline = true）----
+    # 受信スレッドは recv_into と FrameRing への受け渡しだけを行い、デコード（座標変換・パック含む）と
+    # UDP送信はそれぞれ別のワーカーで実行する。下流の処理が遅れても受信ループは止まらない。
+
+    def __receive_thread_function( self, in_socket, stop, frame_ring):
+        batch_receiver = None
+        if self.receive_backend == "recvmmsg":
+            batch_receiver = BatchSocket.BatchReceiver( in_socket, self.receive_batch_size, frame_ring.slot_size )
+            self.batch_receiver = batch_receiver
+
+        while not stop():
+            nbytes = 0
+            try:
+                if batch_receiver is not None:
+                    # 一括受信したデータグラムをリングのスロットへコピーして渡す
+                    datagrams = batch_receiver.receive()
+                    receive_time_ns = time.perf_counter_ns()
+                    for data in datagrams:
+                        frame_ring.publish_copy( data, receive_time_ns )
+                else:
+                    nbytes = in_socket.recv_into( frame_ring.get_write_buffer() )
+                    receive_time_ns = time.perf_counter_ns()
+            except socket.timeout:
+                print("ERROR: data socket access timeout occurred. Server not responding")
+                frame_ring.close()
+                return 4
+            except socket.error as msg:
+                if not stop():
+                    print(f"ERROR: data socket access error occurred: {msg}")
+                    frame_ring.close()
+                    return 1
+                break
+
+            if nbytes > 0 :
+                frame_ring.publish( nbytes, receive_time_ns )
+
+        frame_ring.close()
+        return 0
+
+    def __decode_thread_function( self, frame_ring, stop, gprint_level):
+        message_id_dict={}
+
+        while not stop():
+            item = frame_ring.get( timeout=0.5 )
+            if item is None:
+                continue
+            data, receive_time_ns = item
+
+            message_id = get_message_id(data)
+            tmp_str="mi_%1.1d"%message_id
+            if tmp_str not in message_id_dict:
+                message_id_dict[tmp_str]=0
+            message_id_dict[tmp_str] += 1
+            print_level = gprint_level()
+            if message_id == self.NAT_FRAMEOFDATA:
+                if print_level > 0:
+                    if (message_id_dict[tmp_str] % print_level) == 0:
+                        print_level = 1
+                    else:
+                        print_level = 0
+            message_id = self.__process_message( data , print_level, receive_time_ns)
 
+        frame_ring.release()
         return 0
 
     def send_request( self, in_socket, command, command_str, address ):
@@ -1306,6 +2501,9 @@ class NatNetClient:
     def get_server_version(self):
         return self.__server_version
 
+    def get_server_clock_frequency(self):
+        return self.__server_clock_frequency
+
     def run( self ):
         print("Starting Dual Rigid Body GPS Transmission System...")
         print(f"GPS reference: ({self.ref_lat:.7f}, {self.ref_lon:.7f}, {self.ref_alt:.3f})")
@@ -1328,12 +2526,34 @@ class NatNetClient:
             print("Could not open command channel")
             return False
 
+        # ソケットバッファサイズの設定（config.json の socket_buffers）
+        for name, sock in ( ("data", self.data_socket), ("command", self.command_socket) ):
+            buffers = self.socket_buffers.get(name, {})
+            self.socket_stats.register(name, sock, buffers.get("rcvbuf"), buffers.get("sndbuf"))
+        print(self.socket_stats.get_as_string())
+
         self.__is_locked = True
         self.stop_threads = False
 
-        # Create a separate thread for receiving data packets
-        self.data_thread = Thread( target = self.__data_thread_function, args = (self.data_socket, lambda : self.stop_threads, lambda : self.print_level, ))
-        self.data_thread.start()
+        if self.egress_workers and self.batch_sender is None:
+            # 送信先毎の送信ワーカー。sendto がブロックしないよう非ブロッキングにする（送れない分はエラーとして数える）
+            for sock in self.udp_sockets.values():
+                sock.setblocking(False)
+            self.egress_pool = Egress.EgressPool( self.udp_sockets.keys(), self.__send_egress_item )
+            self.egress_pool.start()
+
+        if self.receive_pipeline:
+            self.frame_ring = FrameRing.FrameRing( self.ring_capacity, 64*1024, self.ring_overflow_policy )
+
+            # Receive-only thread and decode worker
+            self.data_thread = Thread( target = self.__receive_thread_function, args = (self.data_socket, lambda : self.stop_threads, self.frame_ring, ))
+            self.decode_thread = Thread( target = self.__decode_thread_function, args = (self.frame_ring, lambda : self.stop_threads, lambda : self.print_level, ))
+            self.data_thread.start()
+            self.decode_thread.start()
+        else:
+            # Create a separate thread for receiving data packets
+            self.data_thread = Thread( target = self.__data_thread_function, args = (self.data_socket, lambda : self.stop_threads, lambda : self.print_level, ))
+            self.data_thread.start()
 
         # Create a separate thread for receiving command packets
         self.command_thread = Thread( target = self.__command_thread_function, args = (self.command_socket, lambda : self.stop_threads, lambda : self.print_level,))
@@ -1353,21 +2573,237 @@ class NatNetClient:
 
     def shutdown(self):
         print("Shutdown called")
-        print(f"UDP Statistics - Sent: {self.udp_send_count}, Errors: {self.udp_error_count}")
+        print("UDP Statistics - Sent: %d, Errors: %d"%self.get_udp_counts())
+        if self.frame_ring is not None:
+            print(self.frame_ring.get_as_string())
+        if self.egress_pool is not None:
+            print(self.egress_pool.get_as_string())
+        print("Target Health")
+        now_ns = time.perf_counter_ns()
+        for health in self.target_health.values():
+            print("  " + health.get_as_string( now_ns ))
+        if self.batch_receiver is not None:
+            print(self.batch_receiver.get_as_string())
+        if self.batch_sender is not None:
+            print(self.batch_sender.get_as_string())
+        print(self.socket_stats.get_as_string())
+        print(self.frame_stats.get_as_string())
+        if self.frame_history is not None:
+            print(self.frame_history.get_as_string())
+        if self.latency_tracer is not None:
+            print(self.latency_tracer.get_as_string())
         self.stop_threads = True
 
         try:
             self.command_socket.close()
             self.data_socket.close()
-            for sock in self.udp_sockets.values():
-                sock.close()
         except:
             pass
 
+        # 記録中なら書き込み済みのレコードを保存してから終了する
+        if self.is_recording:
+            self.stop_recording()
+        if self.recorder is not None:
+            print(self.recorder.get_as_string())
+            self.recorder.close()
+
+        if self.frame_ring is not None:
+            self.frame_ring.close()
+
         try:
             self.command_thread.join()
             self.data_thread.join()
+            if self.decode_thread is not None:
+                self.decode_thread.join()
+        except:
+            pass
+
+        # デコード終了後に送信ワーカーを止める（各送信先に残っている最新値は送信してから終了する）
+        if self.egress_pool is not None:
+            self.egress_pool.close()
+            self.egress_pool.join()
+
+        # 送信ワーカー停止後にUDPソケットを閉じる
+        try:
+            for sock in self.udp_sockets.values():
+                sock.close()
+            if self.batch_sender is not None:
+                self.batch_sender.sock.close()
         except:
             pass
 
         sys.exit()
+
+
+# ---- テスト ----
+
+K_SKIP = [0, 0, 1]
+K_FAIL = [0, 1, 0]
+K_PASS = [1, 0, 0]
+
+
+# lazy_frames のビューを保持したままバージョン（4.1 → 3.0）と rigid_body_subscription を変更しても、
+# 後から参照した全セクションが受信時の設定での通常のデコードと一致すること
+def test_lazy_frames(run_test=True):
+    test_name = "lazy_frames view keeps its decode state"
+    if not run_test:
+        print("[SKIP] %s"%test_name)
+        return K_SKIP
+    # Benchmark は NatNetClient を import するので、ここで読み込む
+    import Benchmark
+    packet = Benchmark.pack_mocap_frame(11, 5, 20, 4, 1, legacy_marker_count=3, skeleton_count=2,
+                                        force_plate_count=2, device_count=2)
+    decoder_modes = ["offset"]
+    if numpy is not None:
+        decoder_modes.append("numpy")
+    ok = True
+    for decoder_mode in decoder_modes:
+        frames = {}
+        for lazy_frames in ( False, True ):
+            client, process_message = Benchmark.create_client(4, 1, decoder_mode)
+            client.set_rigid_body_subscription(( 1, 3, 4 ))
+            client.set_lazy_frames(lazy_frames)
+            received = []
+            client.mocap_data_listener = received.append
+            process_message(packet)
+            frames[lazy_frames] = received[0]
+        view = frames[True]
+        # 受信後にバージョンと購読対象を変更してからセクションを参照する
+        # （set_nat_net_version() と同じ更新。サーバへのコマンド送信は行わない）
+        client._NatNetClient__nat_net_requested_version[0:2] = [3, 0]
+        client._NatNetClient__update_frame_layout()
+        client.set_rigid_body_subscription(( 99, ))
+        ok &= client.get_major() == 3 and not any(view.is_decoded(name) for name in ( "labeled_markers", "skeletons", "devices" ))
+        eager = frames[False]
+        for section_name, attribute in MoCapData.FRAME_SECTION_ATTRIBUTES.items():
+            section_data = getattr(view, attribute)
+            expected = getattr(eager, attribute)
+            if section_name == "legacy_markers":
+                ok &= section_data.marker_pos_list == expected.marker_pos_list
+            else:
+                ok &= section_data.get_as_string() == expected.get_as_string()
+        ok &= view.get_as_string() == eager.get_as_string()
+        ok &= view.rigid_body_data.get_rigid_body_count() == view.get_count("rigid_bodies") == 3
+    if ok:
+        print("[PASS] %s: %s"%(test_name, ", ".join(decoder_modes)))
+        return K_PASS
+    print("[FAIL] %s"%test_name)
+    return K_FAIL
+
+
+# デコーダの一致を確認するバージョン（FrameLayout のレイアウトが変わる境界）
+DECODER_TEST_VERSIONS = ( (2, 5), (2, 6), (2, 7), (2, 9), (2, 11), (3, 0), (3, 1), (4, 0), (4, 1), (4, 2) )
+# 剛体ID 1, 3 のみ購読（99 はフレームに無いID）
+DECODER_TEST_SUBSCRIPTION = ( 1, 3, 99 )
+
+
+def get_section_string(mocap_data, section_name):
+    section_data = getattr(mocap_data, MoCapData.FRAME_SECTION_ATTRIBUTES[section_name])
+    if section_data is None:
+        return None
+    return section_data.get_as_string()
+
+
+# offset / numpy / lazy_frames（offset, numpy）の各デコーダで、全セクションを含むフレームが legacy デコーダ
+# （__unpack_mocap_data）と同じ内容になること。decode_sections と rigid_body_subscription の組み合わせも確認する。
+# legacy を基準とする際の例外:
+#   - 2.x の剛体マーカーの size が1要素のタプルのまま（get_as_string が失敗する）ため、値を取り出してから比較する
+#   - 4.1 以降の asset セクションを legacy は読み飛ばす（asset_data = None）ため、assets は offset の結果を基準とする
+def test_decoders(major, minor, run_test=True):
+    test_name = "Decoders match legacy (NatNet %d.%d)"%(major, minor)
+    if not run_test:
+        print("[SKIP] %s"%test_name)
+        return K_SKIP
+    # Benchmark は NatNetClient を import するので、ここで読み込む
+    import Benchmark
+    packet = Benchmark.pack_mocap_frame(21, 5, 20, major, minor, legacy_marker_count=3, skeleton_count=2,
+                                        asset_count=2, force_plate_count=2, device_count=2)
+    received = []
+
+    def decode(client, process_message):
+        del received[:]
+        client.mocap_data_listener = received.append
+        process_message(packet)
+        return received[0]
+
+    legacy = decode(*Benchmark.create_client(major, minor, "legacy"))
+    if major < 3:
+        for rigid_body in legacy.rigid_body_data.rigid_body_list + [rigid_body for skeleton in legacy.skeleton_data.skeleton_list
+                                                                    for rigid_body in skeleton.rigid_body_list]:
+            for marker in rigid_body.rb_marker_list:
+                marker.size = marker.size[0]
+    reference = {section_name: get_section_string(legacy, section_name) for section_name in FRAME_SECTIONS}
+    subscribed_rigid_bodies = MoCapData.RigidBodyData()
+    for rigid_body in legacy.rigid_body_data.rigid_body_list:
+        if rigid_body.id_num in DECODER_TEST_SUBSCRIPTION:
+            subscribed_rigid_bodies.add_rigid_body(rigid_body)
+    reference_rigid_bodies = subscribed_rigid_bodies.get_as_string()
+
+    decoders = [( "offset", False ), ( "offset", True )]
+    if numpy is not None:
+        decoders += [( "numpy", False ), ( "numpy", True )]
+    failures = []
+    reference_string = None
+    for decoder_mode, lazy_frames in decoders:
+        decoder_name = decoder_mode + ( " lazy" if lazy_frames else "" )
+        client, process_message = Benchmark.create_client(major, minor, decoder_mode)
+        client.set_lazy_frames(lazy_frames)
+        mocap_data = decode(client, process_message)
+        if reference_string is None:
+            if reference["assets"] is None:
+                reference["assets"] = get_section_string(mocap_data, "assets")
+            reference_string = mocap_data.get_as_string()
+        if mocap_data.get_as_string() != reference_string:
+            failures.append(decoder_name)
+        for section_name in FRAME_SECTIONS:
+            if get_section_string(mocap_data, section_name) != reference[section_name]:
+                failures.append("%s %s"%(decoder_name, section_name))
+
+        # 1セクションのみデコード: 他のセクションは None
+        for decode_section in FRAME_SECTIONS:
+            client.set_decode_sections(( decode_section, ))
+            mocap_data = decode(client, process_message)
+            for section_name in FRAME_SECTIONS:
+                expected = reference[section_name] if section_name == decode_section else None
+                if get_section_string(mocap_data, section_name) != expected:
+                    failures.append("%s sections=%s %s"%(decoder_name, decode_section, section_name))
+        client.set_decode_sections(None)
+
+        # 剛体の購読: 購読対象の剛体だけが同じ内容で残り、他のセクションは変わらない
+        client.set_rigid_body_subscription(DECODER_TEST_SUBSCRIPTION)
+        for decode_sections in ( None, ( "rigid_bodies", ), ( "rigid_bodies", "skeletons" ) ):
+            client.set_decode_sections(decode_sections)
+            mocap_data = decode(client, process_message)
+            if mocap_data.rigid_body_data.get_as_string() != reference_rigid_bodies:
+                failures.append("%s subscription sections=%s"%(decoder_name, decode_sections))
+            for section_name in ( "skeletons", "labeled_markers" ):
+                expected = reference[section_name] if decode_sections is None or section_name in decode_sections else None
+                if get_section_string(mocap_data, section_name) != expected:
+                    failures.append("%s subscription sections=%s %s"%(decoder_name, decode_sections, section_name))
+        client.set_decode_sections(None)
+        client.set_rigid_body_subscription(None)
+
+    detail = ", ".join("%s%s"%decoder for decoder in (( mode, " lazy" if lazy else "" ) for mode, lazy in decoders))
+    if not failures:
+        print("[PASS] %s: %s"%(test_name, detail))
+        return K_PASS
+    print("[FAIL] %s: %s"%(test_name, ", ".join(failures)))
+    return K_FAIL
+
+
+def test_all(run_test=True):
+    totals = [0, 0, 0]
+    for major, minor in DECODER_TEST_VERSIONS:
+        result = test_decoders(major, minor, run_test)
+        totals = [total + value for total, value in zip(totals, result)]
+    result = test_lazy_frames(run_test)
+    totals = [total + value for total, value in zip(totals, result)]
+    print("--------------------")
+    print("[PASS] Count = %3.1d"%totals[0])
+    print("[FAIL] Count = %3.1d"%totals[1])
+    print("[SKIP] Count = %3.1d"%totals[2])
+    return totals
+
+
+if __name__ == "__main__":
+    test_all(True)
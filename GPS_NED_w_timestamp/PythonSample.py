@@ -3,8 +3,18 @@
 import sys
 import time
 from NatNetClient import NatNetClient
+import NatNetClient as NatNetClientModule
 import DataDescriptions
 import MoCapData
+import GeoConversion
+import FixedPoint
+import CoordinateTransform
+import Recorder
+import FrameHistory
+import Stats
+import FrameRing
+import BatchSocket
+import Egress
 import socket
 import threading
 import msvcrt  # Windows用の非ブロッキング入力
@@ -16,19 +26,12 @@ rot = 0
 is_looping = True
 
 # This is a callback function that gets connected to the NatNet client
-# and called once per mocap frame.
-def receive_new_frame(data_dict):
-    order_list=[ "frameNumber", "markerSetCount", "unlabeledMarkersCount", "rigidBodyCount", "skeletonCount",
-                "labeledMarkerCount", "timecode", "timecodeSub", "timestamp", "isRecording", "trackedModelsChanged" ]
+# and called once per mocap frame with a MoCapData.FrameSummary.
+# The summary is reused for the next frame: call frame_summary.copy() to keep it.
+def receive_new_frame(frame_summary):
     dump_args = False
     if dump_args == True:
-        out_string = "    "
-        for key in data_dict:
-            out_string += key + "="
-            if key in data_dict :
-                out_string += data_dict[key] + " "
-            out_string+="/"
-        print(out_string)
+        print(frame_summary.get_as_string("    "))
 
 # This is a callback function that gets connected to the NatNet client. It is called once per rigid body per frame
 def receive_rigid_body_frame( new_id, position, rotation ):
@@ -83,16 +86,29 @@ def request_data_descriptions(s_client):
     # Request the model definitions
     s_client.send_request(s_client.command_socket, s_client.NAT_REQUEST_MODELDEF,    "",  (s_client.server_ip_address, s_client.command_port) )
 
+# (見出し, test_all() を持つモジュール)
+TEST_MODULES = (
+    ("Test Data Description Classes", DataDescriptions),
+    ("Test MoCap Frame Classes", MoCapData),
+    ("Test NatNet Client", NatNetClientModule),
+    ("Test Geo Conversion", GeoConversion),
+    ("Test Fixed Point Fields", FixedPoint),
+    ("Test Coordinate Transform", CoordinateTransform),
+    ("Test Recorder", Recorder),
+    ("Test Frame History", FrameHistory),
+    ("Test Frame Statistics", Stats),
+    ("Test Frame Ring", FrameRing),
+    ("Test Batch Socket", BatchSocket),
+    ("Test Egress", Egress),
+)
+
 def test_classes():
     totals = [0,0,0]
-    print("Test Data Description Classes")
-    totals_tmp = DataDescriptions.test_all()
-    totals=add_lists(totals, totals_tmp)
-    print("")
-    print("Test MoCap Frame Classes")
-    totals_tmp = MoCapData.test_all()
-    totals=add_lists(totals, totals_tmp)
-    print("")
+    for title, module in TEST_MODULES:
+        print(title)
+        totals_tmp = module.test_all()
+        totals=add_lists(totals, totals_tmp)
+        print("")
     print("All Tests totals")
     print("--------------------")
     print("[PASS] Count = %3.1d"%totals[0])
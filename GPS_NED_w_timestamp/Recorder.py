@@ -0,0 +1,445 @@
+# 剛体データの記録（ストリーミング・バイナリ形式）
+#
+# Recorder : データスレッド（1つ）→ 書き込みスレッド（1つ）の SPSC リング。
+#            事前確保した bytearray のレコードスロット（RecordStruct、52バイト × capacity）に
+#            record() が pack_into で直接書き込み、書き込み位置を進めるだけで受け渡す（ロック・確保なし）。
+#            書き込みスレッドは溜まったレコードを chunk_records 件以下のチャンクとして追記し、
+#            flush_interval_sec 毎に flush するため、記録時間に関係なくメモリ使用量は一定で、
+#            異常終了しても最後に書き出したチャンクまでのデータが残る。
+#            リングが満杯の場合は新しいレコードを破棄して数える。
+#
+# 記録の開始・停止（キーボードスレッドなど）は start / stop マーカーとして書き込みスレッドへ渡す。
+# 各スロットには記録番号（RecordingSession.number）を付けるため、stop() の直前に判定を済ませた
+# データスレッドのレコードが停止後に届いても、そのファイルにも次の記録にも混ざらない（late_count に数える）。
+# stop() は書き込みスレッドが停止マーカーまでのレコードを書き出してファイルを閉じるまで待つ。
+#
+# ファイル形式（リトルエンディアン）
+#   ファイルヘッダ : FileHeader（マジック "GNREC", バージョン, レコードサイズ, 記録開始時刻 [ns]）
+#   チャンク       : ChunkHeader（マジック "CK", レコード数, CRC32）+ RecordStruct × レコード数
+#   レコード       : time_ns（SDK の time.time_ns()）, NatNet フレーム番号, 剛体ID,
+#                    pos_x, pos_y, pos_z, quat_x, quat_y, quat_z, quat_w（Motive の float32 そのまま）,
+#                    Motive タイムスタンプ [秒]（不明な場合は NaN）
+#
+# read_records / convert_to_csv : 途中で切れた・壊れたチャンクの手前までを読み、従来の record_*.csv の列に変換する
+#   python Recorder.py record_YYYYMMDD_HHMMSS.bin [出力.csv]
+#
+# test_all() : 書き込み → 読み出し → CSV 変換、途中で切れたファイルの読み出し、記録中の開始・停止の繰り返し
+
+import array
+import collections
+import csv
+import math
+import os
+import struct
+import sys
+import tempfile
+import threading
+import time
+import zlib
+
+FileHeader = struct.Struct('<5sBHq')
+ChunkHeader = struct.Struct('<2sII')
+RecordStruct = struct.Struct('<qii7fd')
+FILE_MAGIC = b"GNREC"
+FILE_VERSION = 1
+CHUNK_MAGIC = b"CK"
+
+CSV_HEADER = ['timestamp', 'rigid_body_id', 'pos_x', 'pos_y', 'pos_z', 'quat_x', 'quat_y', 'quat_z', 'quat_w']
+
+K_SKIP = [0, 0, 1]
+K_FAIL = [0, 1, 0]
+K_PASS = [1, 0, 0]
+
+
+# 1回分の記録（start() 〜 stop()）。ファイルは書き込みスレッドだけが書く
+class RecordingSession:
+    def __init__(self, path, number, start_time_ns, file):
+        self.path = path
+        self.number = number
+        self.start_time_ns = start_time_ns
+        self.file = file
+        self.done = threading.Event()           # 停止マーカーまで書き出してファイルを閉じた
+
+        self.record_count = 0                   # リングに受け付けたレコード数（データスレッド）
+        self.written_count = 0                  # ファイルに書き出したレコード数
+        self.dropped_count = 0                  # リング満杯・書き込みエラーで破棄したレコード数
+        self.chunk_count = 0
+        self.bytes_written = FileHeader.size
+        self.last_error = None
+
+    def write_chunk(self, payload, count):
+        if self.file is None:
+            self.dropped_count += count
+            return
+        header = ChunkHeader.pack(CHUNK_MAGIC, count, zlib.crc32(payload))
+        try:
+            self.file.write(header)
+            self.file.write(payload)
+        except OSError as e:
+            self.fail(e)
+            self.dropped_count += count
+            return
+        self.written_count += count
+        self.chunk_count += 1
+        self.bytes_written += len(header) + len(payload)
+
+    def flush(self):
+        if self.file is None:
+            return
+        try:
+            self.file.flush()
+        except OSError as e:
+            self.fail(e)
+
+    def fail(self, e):
+        self.last_error = e
+        print(f"[ERROR] 記録ファイルの書き込みエラー: {e}")
+        try:
+            self.file.close()
+        except OSError:
+            pass
+        self.file = None
+
+    def close(self):
+        self.flush()
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+        self.done.set()
+
+    def get_as_string(self):
+        out_str = "Recorder - %s: Records %d, Written %d, Dropped %d, Chunks %d, %d bytes"%(
+            self.path, self.record_count, self.written_count, self.dropped_count, self.chunk_count, self.bytes_written)
+        if self.last_error is not None:
+            out_str += ", last error: %s"%self.last_error
+        return out_str
+
+
+class Recorder:
+    def __init__(self, capacity=64*1024, chunk_records=1024, flush_interval_sec=1.0, poll_interval_sec=0.05):
+        self.capacity = capacity
+        self.chunk_records = chunk_records
+        self.flush_interval_sec = flush_interval_sec
+        self.poll_interval_sec = poll_interval_sec
+
+        self.__buffer = bytearray(capacity * RecordStruct.size)
+        self.__view = memoryview(self.__buffer)
+        self.__tags = array.array('L', [0]) * capacity  # スロット毎の記録番号
+        self.__write_index = 0                  # 次に書くスロット（データスレッドだけが進める）
+        self.__read_index = 0                   # 次に読むスロット（書き込みスレッドだけが進める）
+
+        self.session = None                     # 記録中の RecordingSession（None = 停止中）
+        self.__session_count = 0
+        self.__markers = collections.deque()    # ("start" / "stop" / "close", RecordingSession)
+        self.__wakeup = threading.Event()
+        self.__open_sessions = {}               # 記録番号 → RecordingSession（書き込みスレッド）
+        self.__thread = None
+
+        self.late_count = 0                     # 停止後に届いたレコード数
+        self.high_water = 0
+
+    # ---- データスレッド側 ----
+
+    # pos = (x, y, z), rot = (qx, qy, qz, qw)。記録中でない場合・リングが満杯の場合は False
+    def record(self, time_ns, frame_number, rigid_body_id, pos, rot, motive_timestamp=None):
+        session = self.session
+        if session is None:
+            return False
+        write_index = self.__write_index
+        if write_index - self.__read_index >= self.capacity:
+            session.dropped_count += 1
+            return False
+        if motive_timestamp is None:
+            motive_timestamp = math.nan
+        slot = write_index % self.capacity
+        RecordStruct.pack_into(self.__buffer, slot * RecordStruct.size, time_ns, frame_number, rigid_body_id,
+                               pos[0], pos[1], pos[2], rot[0], rot[1], rot[2], rot[3], motive_timestamp)
+        self.__tags[slot] = session.number
+        session.record_count += 1
+        self.__write_index = write_index + 1
+        return True
+
+    # ---- 記録の開始・停止（制御スレッド側） ----
+
+    # path に記録ファイルを作成して記録を開始する（作成できない場合は OSError）
+    def start(self, path, start_time_ns=None):
+        if self.session is not None:
+            raise RuntimeError("recording is already in progress: %s"%self.session.path)
+        if start_time_ns is None:
+            start_time_ns = time.time_ns()
+        file = open(path, "wb")
+        try:
+            file.write(FileHeader.pack(FILE_MAGIC, FILE_VERSION, RecordStruct.size, start_time_ns))
+            file.flush()
+        except OSError:
+            file.close()
+            raise
+        self.__session_count += 1
+        session = RecordingSession(path, self.__session_count, start_time_ns, file)
+        if self.__thread is None:
+            self.__thread = threading.Thread(target=self.__run, name="recorder", daemon=True)
+            self.__thread.start()
+        # 開始マーカーを先に渡してから、データスレッドに記録番号を見せる
+        self.__markers.append(( "start", session ))
+        self.session = session
+        return session
+
+    # 記録を停止し、停止マーカーまでのレコードを書き出してファイルを閉じるまで待つ。記録していない場合は None
+    def stop(self, timeout=None):
+        session = self.session
+        if session is None:
+            return None
+        self.session = None
+        self.__markers.append(( "stop", session ))
+        self.__wakeup.set()
+        session.done.wait(timeout)
+        return session
+
+    # 記録中なら停止し、書き込みスレッドを終了する
+    def close(self, timeout=None):
+        self.stop(timeout)
+        if self.__thread is None:
+            return
+        self.__markers.append(( "close", None ))
+        self.__wakeup.set()
+        self.__thread.join(timeout)
+        self.__thread = None
+
+    # ---- 書き込みスレッド側 ----
+
+    def __run(self):
+        last_flush = time.perf_counter()
+        while True:
+            self.__wakeup.wait(self.poll_interval_sec)
+            self.__wakeup.clear()
+            # 書き込み位置を読んでからマーカーを取り出す（読んだ範囲の記録番号の開始マーカーは必ず取り出せる）
+            limit = self.__write_index
+            stops = []
+            closing = False
+            while self.__markers:
+                kind, session = self.__markers.popleft()
+                if kind == "start":
+                    self.__open_sessions[session.number] = session
+                elif kind == "stop":
+                    stops.append(session)
+                else:
+                    closing = True
+
+            now = time.perf_counter()
+            if stops or closing or limit - self.__read_index >= self.chunk_records or now - last_flush >= self.flush_interval_sec:
+                self.__drain(limit)
+                if stops:
+                    # 停止マーカーより前に書かれたレコードを全て書き出す
+                    self.__drain(self.__write_index)
+                for session in self.__open_sessions.values():
+                    session.flush()
+                last_flush = now
+            for session in stops:
+                del self.__open_sessions[session.number]
+                session.close()
+            if closing:
+                return
+
+    # limit までのスロットを、記録番号が同じ連続部分毎にチャンクとして書き出す
+    def __drain(self, limit):
+        read_index = self.__read_index
+        if limit - read_index > self.high_water:
+            self.high_water = limit - read_index
+        tags = self.__tags
+        record_size = RecordStruct.size
+        while read_index < limit:
+            slot = read_index % self.capacity
+            end = slot + min(limit - read_index, self.capacity - slot, self.chunk_records)
+            number = tags[slot]
+            run_end = slot + 1
+            while run_end < end and tags[run_end] == number:
+                run_end += 1
+            count = run_end - slot
+            session = self.__open_sessions.get(number)
+            if session is None:
+                self.late_count += count
+            else:
+                session.write_chunk(bytes(self.__view[slot * record_size:run_end * record_size]), count)
+            read_index += count
+            self.__read_index = read_index
+
+    def get_as_string(self):
+        return "Recorder ring - Capacity %d, High water %d, Late %d"%(self.capacity, self.high_water, self.late_count)
+
+
+# 記録ファイルを読み、(記録開始時刻 [ns], レコードのジェネレータ) を返す。
+# レコードは (time_ns, frame_number, rigid_body_id, pos_x, pos_y, pos_z, quat_x, quat_y, quat_z, quat_w, motive_timestamp)
+def read_records(path):
+    f = open(path, "rb")
+    header = f.read(FileHeader.size)
+    if len(header) < FileHeader.size:
+        f.close()
+        raise ValueError("%s: file header is truncated"%path)
+    magic, version, record_size, start_time_ns = FileHeader.unpack(header)
+    if magic != FILE_MAGIC or version != FILE_VERSION or record_size != RecordStruct.size:
+        f.close()
+        raise ValueError("%s: unknown record file (magic %r, version %d, record size %d)"%(path, magic, version, record_size))
+
+    def generate():
+        with f:
+            while True:
+                chunk_header = f.read(ChunkHeader.size)
+                if len(chunk_header) < ChunkHeader.size:
+                    return
+                chunk_magic, count, crc = ChunkHeader.unpack(chunk_header)
+                if chunk_magic != CHUNK_MAGIC:
+                    return
+                payload = f.read(count * RecordStruct.size)
+                # 書き込み途中で終了したチャンク
+                if len(payload) < count * RecordStruct.size or zlib.crc32(payload) != crc:
+                    return
+                yield from RecordStruct.iter_unpack(payload)
+    return start_time_ns, generate()
+
+
+# 従来の record_*.csv と同じ列で書き出し、行数を返す
+def convert_to_csv(path, csv_path=None):
+    if csv_path is None:
+        csv_path = os.path.splitext(path)[0] + ".csv"
+    start_time_ns, records = read_records(path)
+    row_count = 0
+    with open(csv_path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(CSV_HEADER)
+        for record in records:
+            writer.writerow(( record[0], record[2] ) + record[3:10])
+            row_count += 1
+    return csv_path, row_count
+
+
+# ---- テスト ----
+
+def get_test_records(count):
+    records = []
+    for i in range(count):
+        pos = tuple(struct.unpack('<3f', struct.pack('<3f', 0.001 * i, 1.5 + 0.002 * i, -0.003 * i)))
+        rot = tuple(struct.unpack('<4f', struct.pack('<4f', 0.1, -0.2, 0.3, 0.9)))
+        records.append(( 1717084800000000000 + i * 20000000, 1000 + i // 2, 1 + i % 2, pos, rot, None if i == 0 else i * 0.02 ))
+    return records
+
+
+def test_round_trip(run_test=True, count=5000):
+    test_name = "Recorder round trip (%d records)"%count
+    if not run_test:
+        print("[SKIP] %s"%test_name)
+        return K_SKIP
+    records = get_test_records(count)
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "record.bin")
+        recorder = Recorder(chunk_records=256, flush_interval_sec=0.01)
+        recorder.start(path)
+        for record in records:
+            recorder.record(*record)
+        session = recorder.stop()
+        recorder.close()
+        ok = session.written_count == count and session.dropped_count == 0 and recorder.late_count == 0
+        ok &= not recorder.record(*records[0])
+
+        start_time_ns, read_back = read_records(path)
+        read_back = list(read_back)
+        ok &= len(read_back) == count
+        for record, row in zip(records, read_back):
+            time_ns, frame_number, rigid_body_id, pos, rot, timestamp = record
+            ok &= row[:3] == ( time_ns, frame_number, rigid_body_id ) and row[3:6] == pos and row[6:10] == rot
+            ok &= math.isnan(row[10]) if timestamp is None else row[10] == timestamp
+
+        # 従来の stop_recording と同じ CSV（float は repr）
+        csv_path, row_count = convert_to_csv(path)
+        with open(csv_path, newline='', encoding='utf-8') as f:
+            rows = list(csv.reader(f))
+        ok &= row_count == count and rows[0] == CSV_HEADER
+        ok &= rows[1] == [str(records[0][0]), str(records[0][2])] + [str(value) for value in records[0][3] + records[0][4]]
+
+        # 最後のチャンクの途中で切れたファイル（異常終了）。最後のチャンク（chunk_records 件以下）だけが失われる
+        size = os.path.getsize(path)
+        with open(path, "r+b") as f:
+            f.truncate(size - 10)
+        start_time_ns, truncated = read_records(path)
+        truncated_count = len(list(truncated))
+        ok &= count - recorder.chunk_records <= truncated_count < count
+
+    detail = "%d chunks, %d bytes, %d records after truncation"%(session.chunk_count, session.bytes_written, truncated_count)
+    if ok:
+        print("[PASS] %s: %s"%(test_name, detail))
+        return K_PASS
+    print("[FAIL] %s: %s"%(test_name, detail))
+    return K_FAIL
+
+
+# データスレッドが記録し続けている間に開始・停止を繰り返す。
+# 各ファイルのフレーム番号が連続し、受け付けたレコードが書き出し・破棄・停止後のいずれかに数えられること
+def test_sessions(run_test=True, session_count=20):
+    test_name = "Recorder start/stop while recording (%d sessions)"%session_count
+    if not run_test:
+        print("[SKIP] %s"%test_name)
+        return K_SKIP
+    recorder = Recorder(capacity=4096, chunk_records=128, flush_interval_sec=0.005, poll_interval_sec=0.001)
+    finished = threading.Event()
+    pos = ( 0.0, 1.0, 2.0 )
+    rot = ( 0.0, 0.0, 0.0, 1.0 )
+
+    def produce():
+        frame_number = 0
+        while not finished.is_set():
+            if recorder.record(time.time_ns(), frame_number, 1, pos, rot):
+                frame_number += 1
+
+    producer = threading.Thread(target=produce)
+    producer.start()
+    sessions = []
+    with tempfile.TemporaryDirectory() as directory:
+        for i in range(session_count):
+            sessions.append(recorder.start(os.path.join(directory, "record_%02d.bin"%i)))
+            time.sleep(0.005)
+            recorder.stop()
+        finished.set()
+        producer.join()
+        recorder.close()
+
+        ok = True
+        frame_ranges = []
+        for session in sessions:
+            start_time_ns, records = read_records(session.path)
+            frame_numbers = [record[1] for record in records]
+            ok &= len(frame_numbers) == session.written_count and session.done.is_set()
+            ok &= frame_numbers == list(range(frame_numbers[0], frame_numbers[0] + len(frame_numbers))) if frame_numbers else True
+            if frame_numbers:
+                frame_ranges.append(( frame_numbers[0], frame_numbers[-1] ))
+        # 記録同士でフレームが重ならない
+        ok &= all(a[1] < b[0] for a, b in zip(frame_ranges, frame_ranges[1:]))
+    accepted = sum(session.record_count for session in sessions)
+    written = sum(session.written_count for session in sessions)
+    dropped = sum(session.dropped_count for session in sessions)
+    ok &= accepted == written + recorder.late_count and written > 0
+
+    detail = "%d written, %d dropped, %d late, high water %d"%(written, dropped, recorder.late_count, recorder.high_water)
+    if ok:
+        print("[PASS] %s: %s"%(test_name, detail))
+        return K_PASS
+    print("[FAIL] %s: %s"%(test_name, detail))
+    return K_FAIL
+
+
+def test_all(run_test=True):
+    totals = [0, 0, 0]
+    for test in ( test_round_trip, test_sessions ):
+        result = test(run_test)
+        totals = [total + value for total, value in zip(totals, result)]
+    print("--------------------")
+    print("[PASS] Count = %3.1d"%totals[0])
+    print("[FAIL] Count = %3.1d"%totals[1])
+    print("[SKIP] Count = %3.1d"%totals[2])
+    return totals
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        csv_path, row_count = convert_to_csv(sys.argv[1], sys.argv[2] if len(sys.argv) > 2 else None)
+        print("%s (%d rows)"%(csv_path, row_count))
+    else:
+        test_all(True)
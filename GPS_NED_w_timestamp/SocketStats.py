@@ -0,0 +1,89 @@
+# ソケットバッファサイズの設定とカーネル統計
+#
+# SO_RCVBUF / SO_SNDBUF を要求値で設定し、実際に割り当てられた値（getsockopt）と併せて記録する。
+# Linux では要求値の2倍が返る（カーネルの管理領域込み）。上限は net.core.rmem_max / wmem_max。
+#
+# Linux では /proc/net/udp(6) からソケットの inode に一致する行を探し、
+# 受信キュー長（rx_queue）とカーネルが破棄したデータグラム数（drops）を読み出す。
+
+import os
+import socket
+import sys
+
+PROC_NET_UDP = ( "/proc/net/udp", "/proc/net/udp6" )
+
+
+def get_socket_inode(sock):
+    try:
+        return os.fstat(sock.fileno()).st_ino
+    except (OSError, ValueError):
+        return None
+
+
+# /proc/net/udp(6) を読み、{inode: (rx_queue, drops)} を返す（inodes に含まれるもののみ）
+def read_udp_drops(inodes):
+    result = {}
+    for path in PROC_NET_UDP:
+        try:
+            with open(path, "r") as f:
+                lines = f.readlines()
+        except OSError:
+            continue
+        for line in lines[1:]:
+            fields = line.split()
+            if len(fields) < 13:
+                continue
+            inode = int(fields[9])
+            if inode in inodes:
+                rx_queue = int(fields[4].split(":")[1], 16)
+                result[inode] = (rx_queue, int(fields[12]))
+    return result
+
+
+class SocketStats:
+    def __init__(self):
+        # name -> [socket, inode, {"rcvbuf": (requested, granted), "sndbuf": (requested, granted)}]
+        self.__sockets = {}
+
+    # sock のバッファサイズを設定して登録する。None の項目は設定せず、現在値だけ記録する
+    def register(self, name, sock, rcvbuf=None, sndbuf=None):
+        buffer_sizes = {}
+        for key, option, requested in ( ("rcvbuf", socket.SO_RCVBUF, rcvbuf), ("sndbuf", socket.SO_SNDBUF, sndbuf) ):
+            if requested is not None:
+                try:
+                    sock.setsockopt(socket.SOL_SOCKET, option, int(requested))
+                except OSError as msg:
+                    print(f"[警告] {name}: {key}={requested} の設定に失敗: {msg}")
+            granted = sock.getsockopt(socket.SOL_SOCKET, option)
+            buffer_sizes[key] = (requested, granted)
+        self.__sockets[name] = [sock, get_socket_inode(sock), buffer_sizes]
+        return buffer_sizes
+
+    def unregister(self, name):
+        self.__sockets.pop(name, None)
+
+    def get_buffer_sizes(self, name):
+        return self.__sockets[name][2]
+
+    # {name: (rx_queue, drops)}。Linux 以外、または見つからない場合は空
+    def get_kernel_drops(self):
+        if not sys.platform.startswith("linux"):
+            return {}
+        inodes = {entry[1]: name for name, entry in self.__sockets.items() if entry[1] is not None}
+        counters = read_udp_drops(inodes)
+        return {inodes[inode]: value for inode, value in counters.items()}
+
+    def get_as_string(self):
+        kernel_drops = self.get_kernel_drops()
+        out_str = "Socket Statistics\n"
+        for name, (sock, inode, buffer_sizes) in self.__sockets.items():
+            sizes = []
+            for key in ( "rcvbuf", "sndbuf" ):
+                requested, granted = buffer_sizes[key]
+                sizes.append("%s %s/%d"%(key, "default" if requested is None else requested, granted))
+            out_str += "  %-24s: %s"%(name, ", ".join(sizes))
+            if name in kernel_drops:
+                rx_queue, drops = kernel_drops[name]
+                out_str += ", rx_queue %d, drops %d"%(rx_queue, drops)
+            out_str += "\n"
+        return out_str
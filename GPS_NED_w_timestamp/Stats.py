@@ -0,0 +1,307 @@
+# フレーム受信統計
+#
+# FrameStats : フレーム番号の連続性（欠落・重複・順序入れ替わり）と、受信時刻の到着間隔・ジッタを集計する。
+#              累積値（total）と、定期サマリ毎にリセットされる区間値（window）を持つ。
+# LatencyTracer : 露光から UDP 送信完了までの段階別遅延を直近 sample_count 件保持し、パーセンタイルを求める。
+# ClockOffsetEstimator : サーバ時計とローカル時計の差を最小値フィルタで推定する。
+#
+# 受信時刻は time.perf_counter_ns() の値（受信スレッドで recv 直後に取得）を渡す。
+
+import collections
+
+# 到着間隔ヒストグラムの上限 [ms]（最後のビンは上限超過）
+INTERVAL_BUCKETS_MS = ( 2, 5, 10, 15, 19, 21, 25, 30, 40, 50, 100, 200 )
+
+# 受信済みフレーム番号を覚えておく範囲（最新番号からの差）。これより古い遅着は欠落の取り消し・重複の判定ができない
+SEQUENCE_WINDOW = 256
+SEQUENCE_WINDOW_MASK = ( 1 << SEQUENCE_WINDOW ) - 1
+
+K_SKIP = [0, 0, 1]
+K_FAIL = [0, 1, 0]
+K_PASS = [1, 0, 0]
+
+
+class FrameCounters:
+    def __init__(self):
+        self.frame_count = 0
+        self.lost_count = 0             # フレーム番号の飛び（欠落したフレーム数。遅着で埋まった分は差し引く）
+        self.duplicate_count = 0        # 既に受信したフレーム番号
+        self.reorder_count = 0          # 最新の番号より古い未受信のフレーム（遅着）
+        self.interval_count = 0
+        self.interval_sum_ns = 0
+        self.interval_max_ns = 0
+        self.interval_histogram = [0] * ( len(INTERVAL_BUCKETS_MS) + 1 )
+
+    def add_interval(self, interval_ns):
+        self.interval_count += 1
+        self.interval_sum_ns += interval_ns
+        if interval_ns > self.interval_max_ns:
+            self.interval_max_ns = interval_ns
+        interval_ms = interval_ns / 1e6
+        for i, upper_ms in enumerate(INTERVAL_BUCKETS_MS):
+            if interval_ms < upper_ms:
+                self.interval_histogram[i] += 1
+                return
+        self.interval_histogram[-1] += 1
+
+    def get_interval_mean_ms(self):
+        if self.interval_count == 0:
+            return 0.0
+        return self.interval_sum_ns / self.interval_count / 1e6
+
+    def get_histogram_as_string(self, tab_str="  "):
+        out_str = ""
+        lower_ms = 0
+        for i, count in enumerate(self.interval_histogram):
+            if i < len(INTERVAL_BUCKETS_MS):
+                label = "%3d-%3d ms"%(lower_ms, INTERVAL_BUCKETS_MS[i])
+                lower_ms = INTERVAL_BUCKETS_MS[i]
+            else:
+                label = "%3d-    ms"%lower_ms
+            out_str += "%s%s: %d\n"%(tab_str, label, count)
+        return out_str
+
+
+class FrameStats:
+    def __init__(self):
+        self.total = FrameCounters()
+        self.window = FrameCounters()
+        self.window_start_ns = None
+
+        self.last_frame_number = None
+        # bit i: last_frame_number - i を受信済み（SEQUENCE_WINDOW ビット）
+        self.seen_bitmap = 0
+        self.last_receive_time_ns = None
+        # 到着間隔の平滑値と、それからのずれの平滑値（RFC 3550 の到着間ジッタと同じ 1/16 の係数）
+        self.interval_ema_ns = None
+        self.jitter_ns = 0.0
+
+    def record(self, frame_number, receive_time_ns):
+        total = self.total
+        window = self.window
+        if self.window_start_ns is None:
+            self.window_start_ns = receive_time_ns
+        total.frame_count += 1
+        window.frame_count += 1
+
+        if self.last_frame_number is None:
+            self.last_frame_number = frame_number
+            self.seen_bitmap = 1
+        else:
+            delta = frame_number - self.last_frame_number
+            if delta > 0:
+                if delta > 1:
+                    total.lost_count += delta - 1
+                    window.lost_count += delta - 1
+                self.last_frame_number = frame_number
+                self.seen_bitmap = ( ( self.seen_bitmap << delta ) | 1 ) & SEQUENCE_WINDOW_MASK
+            elif -delta >= SEQUENCE_WINDOW:
+                # 記録範囲外の遅着（受信済みか判定できない）
+                total.reorder_count += 1
+                window.reorder_count += 1
+            else:
+                bit = 1 << -delta
+                if self.seen_bitmap & bit:
+                    total.duplicate_count += 1
+                    window.duplicate_count += 1
+                else:
+                    # 欠落として数えた番号が遅れて届いた
+                    self.seen_bitmap |= bit
+                    total.reorder_count += 1
+                    window.reorder_count += 1
+                    total.lost_count -= 1
+                    # 欠落を前の区間で数えた場合は区間値を負にしない
+                    if window.lost_count > 0:
+                        window.lost_count -= 1
+
+        if self.last_receive_time_ns is not None:
+            interval_ns = receive_time_ns - self.last_receive_time_ns
+            total.add_interval(interval_ns)
+            window.add_interval(interval_ns)
+            if self.interval_ema_ns is None:
+                self.interval_ema_ns = float(interval_ns)
+            else:
+                self.jitter_ns += ( abs(interval_ns - self.interval_ema_ns) - self.jitter_ns ) / 16.0
+                self.interval_ema_ns += ( interval_ns - self.interval_ema_ns ) / 16.0
+        self.last_receive_time_ns = receive_time_ns
+
+    # 区間値をリセットする（シーケンスの状態は引き継ぐ）
+    def reset_window(self, now_ns=None):
+        self.window = FrameCounters()
+        self.window_start_ns = now_ns
+
+    def get_window_rate_hz(self, now_ns):
+        if self.window_start_ns is None or now_ns <= self.window_start_ns:
+            return 0.0
+        return self.window.frame_count * 1e9 / ( now_ns - self.window_start_ns )
+
+    def get_summary_line(self, now_ns):
+        window = self.window
+        return "[Stats] frames %d (%.1f Hz) lost %d dup %d reorder %d | interval mean %.2f ms max %.2f ms jitter %.2f ms"%(
+            window.frame_count, self.get_window_rate_hz(now_ns),
+            window.lost_count, window.duplicate_count, window.reorder_count,
+            window.get_interval_mean_ms(), window.interval_max_ns / 1e6, self.jitter_ns / 1e6)
+
+    def get_as_string(self, tab_str="  "):
+        total = self.total
+        out_str = "Frame Statistics\n"
+        out_str += "%sFrames   : %d\n"%(tab_str, total.frame_count)
+        out_str += "%sLost     : %d\n"%(tab_str, total.lost_count)
+        out_str += "%sDuplicate: %d\n"%(tab_str, total.duplicate_count)
+        out_str += "%sReorder  : %d\n"%(tab_str, total.reorder_count)
+        out_str += "%sInterval : mean %.2f ms, max %.2f ms, jitter %.2f ms\n"%(
+            tab_str, total.get_interval_mean_ms(), total.interval_max_ns / 1e6, self.jitter_ns / 1e6)
+        out_str += "%sInterval histogram\n"%tab_str
+        out_str += total.get_histogram_as_string(tab_str * 2)
+        return out_str
+
+
+# 遅延計測の段階（表示順）
+#   motive  : Motive 内部（カメラ露光中央 → 送信）
+#   network : 送信 → 受信（時計オフセット推定後。最小遅延を 0 とした相対値）
+#   queue   : 受信 → デコード開始
+#   decode  : デコード（剛体毎の変換・送信ワーカーへの受け渡しを含む）
+#   convert : 剛体1個の NED / GPS / Yaw 変換と pack
+#   sendto  : sendto 呼び出し
+#   egress  : 受信 → sendto 完了
+LATENCY_STAGES = ( "motive", "network", "queue", "decode", "convert", "sendto", "egress" )
+LATENCY_PERCENTILES = ( 50, 90, 99, 99.9 )
+
+
+class LatencyTracer:
+    def __init__(self, sample_count=4096, stages=LATENCY_STAGES):
+        self.stages = stages
+        self.samples = {stage: collections.deque(maxlen=sample_count) for stage in stages}
+
+    def add(self, stage, value_ns):
+        self.samples[stage].append(value_ns)
+
+    # 直近のサンプルの percentiles [ns]（最近傍順位法）。サンプルが無い場合は None
+    def get_percentiles(self, stage, percentiles=LATENCY_PERCENTILES):
+        values = sorted(self.samples[stage])
+        if not values:
+            return None
+        result = []
+        for percentile in percentiles:
+            rank = int(percentile / 100.0 * len(values) + 0.5)
+            result.append(values[min(max(rank, 1), len(values)) - 1])
+        return result
+
+    def get_as_string(self, tab_str="  "):
+        out_str = "Latency [ms] (last %d samples)\n"%self.samples[self.stages[0]].maxlen
+        out_str += "%s%-8s %7s"%(tab_str, "stage", "count")
+        for percentile in LATENCY_PERCENTILES:
+            out_str += " %8s"%("p%g"%percentile)
+        out_str += " %8s\n"%"max"
+        for stage in self.stages:
+            values = self.samples[stage]
+            out_str += "%s%-8s %7d"%(tab_str, stage, len(values))
+            percentile_values = self.get_percentiles(stage)
+            if percentile_values is None:
+                out_str += "\n"
+                continue
+            for value in percentile_values:
+                out_str += " %8.3f"%(value / 1e6)
+            out_str += " %8.3f\n"%(max(values) / 1e6)
+        return out_str
+
+
+class ClockOffsetEstimator:
+    # offset = ローカル受信時刻 - サーバ送信時刻 の最小値を、現在と直前の window_ns の区間で追跡する。
+    # 区間を切り替えることで時計のドリフトに追従する。
+    def __init__(self, window_ns=10 * 1000 * 1000 * 1000):
+        self.window_ns = window_ns
+        self.window_start_ns = None
+        self.current_min_ns = None
+        self.previous_min_ns = None
+
+    def update(self, offset_ns, now_ns):
+        if self.window_start_ns is None or now_ns - self.window_start_ns >= self.window_ns:
+            self.previous_min_ns = self.current_min_ns
+            self.current_min_ns = None
+            self.window_start_ns = now_ns
+        if self.current_min_ns is None or offset_ns < self.current_min_ns:
+            self.current_min_ns = offset_ns
+        return self.get_offset()
+
+    def get_offset(self):
+        if self.previous_min_ns is None:
+            return self.current_min_ns
+        if self.current_min_ns is None:
+            return self.previous_min_ns
+        return min(self.previous_min_ns, self.current_min_ns)
+
+
+# ---- テスト ----
+
+def record_sequence(stats, frame_numbers, start_ns=0, period_ns=10000000):
+    for i, frame_number in enumerate(frame_numbers):
+        stats.record(frame_number, start_ns + i * period_ns)
+
+
+def test_sequence(test_name, frame_numbers, expected, run_test=True):
+    if not run_test:
+        print("[SKIP] %s"%test_name)
+        return K_SKIP
+    stats = FrameStats()
+    record_sequence(stats, frame_numbers)
+    counts = []
+    for counters in ( stats.total, stats.window ):
+        counts.append(( counters.frame_count, counters.lost_count, counters.duplicate_count, counters.reorder_count ))
+    detail = "frames/lost/dup/reorder %r, expected %r"%(counts[0], expected)
+    if counts[0] == expected and counts[1] == expected:
+        print("[PASS] %s: %s"%(test_name, detail))
+        return K_PASS
+    print("[FAIL] %s: %s (window %r)"%(test_name, detail, counts[1]))
+    return K_FAIL
+
+
+# 区間をまたいだ遅着: 累積値は欠落を取り消し、区間値は負にならないこと
+def test_window_reset(run_test=True):
+    test_name = "FrameStats late frame after window reset"
+    if not run_test:
+        print("[SKIP] %s"%test_name)
+        return K_SKIP
+    stats = FrameStats()
+    record_sequence(stats, ( 1, 2, 4 ))
+    stats.reset_window(30000000)
+    record_sequence(stats, ( 3, 5 ), 30000000)
+    total = stats.total
+    window = stats.window
+    ok = ( total.lost_count, total.reorder_count ) == ( 0, 1 )
+    ok &= ( window.frame_count, window.lost_count, window.reorder_count ) == ( 2, 0, 1 )
+    if ok:
+        print("[PASS] %s"%test_name)
+        return K_PASS
+    print("[FAIL] %s: total lost %d reorder %d, window lost %d reorder %d"%(
+        test_name, total.lost_count, total.reorder_count, window.lost_count, window.reorder_count))
+    return K_FAIL
+
+
+SEQUENCE_TESTS = (
+    # 名前, 受信したフレーム番号, 期待値 (frames, lost, duplicate, reorder)
+    ( "FrameStats in order", list(range(1, 101)), ( 100, 0, 0, 0 ) ),
+    ( "FrameStats gaps", ( 1, 2, 5, 6, 10 ), ( 5, 5, 0, 0 ) ),
+    ( "FrameStats duplicates", ( 1, 2, 2, 3, 1, 3 ), ( 6, 0, 3, 0 ) ),
+    ( "FrameStats late frames fill gaps", ( 1, 2, 3, 5, 5, 4, 6, 10, 9, 11 ), ( 10, 2, 1, 2 ) ),
+    ( "FrameStats late frame repeated", ( 1, 3, 2, 2, 4 ), ( 5, 0, 1, 1 ) ),
+    ( "FrameStats late beyond window", ( 1, 2, 300, 3 ), ( 4, 297, 0, 1 ) ),
+)
+
+
+def test_all(run_test=True):
+    totals = [0, 0, 0]
+    for test_name, frame_numbers, expected in SEQUENCE_TESTS:
+        result = test_sequence(test_name, frame_numbers, expected, run_test)
+        totals = [total + value for total, value in zip(totals, result)]
+    result = test_window_reset(run_test)
+    totals = [total + value for total, value in zip(totals, result)]
+    print("--------------------")
+    print("[PASS] Count = %3.1d"%totals[0])
+    print("[FAIL] Count = %3.1d"%totals[1])
+    print("[SKIP] Count = %3.1d"%totals[2])
+    return totals
+
+
+if __name__ == "__main__":
+    test_all(True)